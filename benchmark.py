@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import collections
+import json
+import resource
+import sys
+
+
+def percentile(values, percent):
+    """
+    Percentile with linear interpolation between closest ranks
+    """
+    values = sorted(values)
+    if not values:
+        return 0
+    rank = (len(values) - 1) * percent / 100.0
+    lower = int(rank)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (rank - lower)
+
+
+def peak_rss_mb():
+    """
+    Peak resident set size of this process in MB (ru_maxrss is in kB on Linux, in bytes on macOS)
+    """
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak_rss / (1024.0**2 if sys.platform == 'darwin' else 1024.0), 1)
+
+
+def _latency_stats(durations):
+    return {
+        'count': len(durations),
+        'p50': round(percentile(durations, 50), 1),
+        'p95': round(percentile(durations, 95), 1),
+        'p99': round(percentile(durations, 99), 1)
+    }
+
+
+def summarize(results, duration):
+    """
+    Latency percentiles (ms) per query label and per phase, throughput and peak RSS of benchmark iterations.
+    Phase latency is wall time from start of its first statement to end of its last statement,
+    on each host in each iteration.
+
+    :param results: finished requests of all iterations (with iteration, start_time and end_time)
+    :param duration: wall time of all iterations in seconds
+    :rtype: dict
+    """
+    labels = collections.defaultdict(list)
+    phase_spans = {}
+    statements = 0
+    rows = 0
+    for result in results:
+        if result['status'] != 'ok':
+            continue
+        statements += 1
+        rows += result['result'].get('rows', 0)
+        labels[result['query_name']].append(result['duration'])
+        key = (result['iteration'], result['host'], result['phase']['name'])
+        start, end = phase_spans.get(key, (result['start_time'], result['end_time']))
+        phase_spans[key] = (min(start, result['start_time']), max(end, result['end_time']))
+    phases = collections.defaultdict(list)
+    for (_, _, phase_name), (start, end) in phase_spans.items():
+        phases[phase_name].append((end - start) * 1000)
+    return {
+        'labels': {label: _latency_stats(durations) for label, durations in sorted(labels.items())},
+        'phases': {phase: _latency_stats(durations) for phase, durations in sorted(phases.items())},
+        'duration': round(duration, 3),
+        'statements_per_second': round(statements / duration, 2) if duration else 0,
+        'rows_per_second': round(rows / duration, 2) if duration else 0,
+        'peak_rss_mb': peak_rss_mb()
+    }
+
+
+def format_summary(summary):
+    lines = []
+    for section in ('phases', 'labels'):
+        for name, stats in summary[section].items():
+            lines.append('{} {} count={} p50={} p95={} p99={}'.format(
+                section[:-1], name, stats['count'], stats['p50'], stats['p95'], stats['p99']))
+    lines.append('duration={} statements_per_second={} rows_per_second={} peak_rss_mb={}'.format(
+        summary['duration'], summary['statements_per_second'], summary['rows_per_second'], summary['peak_rss_mb']))
+    return lines
+
+
+def compare(summary, baseline, threshold, min_delta):
+    """
+    Regressions against baseline - p95 of a label or phase slower by more than threshold (relative)
+    and min_delta ms (absolute, fast statements are noisy), throughput lower or peak RSS higher by more than threshold.
+    Labels and phases missing in either summary are not compared.
+
+    :return: list of regression descriptions
+    :rtype: list
+    """
+    regressions = []
+    for section in ('phases', 'labels'):
+        for name, base in baseline.get(section, {}).items():
+            current = summary[section].get(name)
+            if not current:
+                continue
+            if current['p95'] > base['p95'] * (1 + threshold) and current['p95'] - base['p95'] > min_delta:
+                regressions.append('{} {} p95 {} -> {}'.format(section[:-1], name, base['p95'], current['p95']))
+    if summary['statements_per_second'] < baseline.get('statements_per_second', 0) * (1 - threshold):
+        regressions.append('statements_per_second {} -> {}'.format(
+            baseline['statements_per_second'], summary['statements_per_second']))
+    if 'peak_rss_mb' in baseline and summary['peak_rss_mb'] > baseline['peak_rss_mb'] * (1 + threshold):
+        regressions.append('peak_rss_mb {} -> {}'.format(baseline['peak_rss_mb'], summary['peak_rss_mb']))
+    return regressions
+
+
+def read_baseline(file_name):
+    with open(file_name) as fp:
+        return json.load(fp)
+
+
+def write_summary(file_name, summary):
+    with open(file_name, 'w') as fp:
+        json.dump(summary, fp, indent=2, sort_keys=True)
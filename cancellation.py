@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import time
+from threading import Condition, Thread
+
+# Interrupts are issued from sessions of general pool, resource pools of the pipeline can be saturated
+ADMIN_RESOURCE_POOL = 'general'
+
+
+class Watchdog(object):
+    """
+    Tracks statements executed by workers and interrupts them on the server, when their deadline passes
+    or when they are cancelled (interrupt_all). Statement is interrupted by INTERRUPT_STATEMENT issued from
+    another session, the session is closed by CLOSE_SESSION if it does not execute any statement
+    (or interrupt fails), closed session is marked broken, so the pool discards it.
+    Worker gets error of the interrupted statement within milliseconds.
+    """
+
+    def __init__(self, conn_pool, log=print):
+        self._conn_pool = conn_pool
+        self._log = log
+        self._condition = Condition()
+        # id(request) -> [request, session, deadline, interrupting]
+        self._running = {}
+        self._closed = False
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def register(self, request, conn, deadline=None):
+        """
+        :param deadline: time (epoch seconds), when the statement is interrupted, None for no deadline
+        """
+        with self._condition:
+            self._running[id(request)] = [request, conn, deadline, False]
+            self._condition.notify_all()
+
+    def unregister(self, request):
+        """
+        Stop tracking of the request. Waits for interrupt in progress, so the session is not released
+        (and reused by another statement) before it is interrupted.
+        """
+        with self._condition:
+            while self._running[id(request)][3]:
+                self._condition.wait()
+            del self._running[id(request)]
+
+    def interrupt_all(self, reason, host=None):
+        """
+        Interrupt all tracked statements (of the host, if specified)
+        """
+        with self._condition:
+            entries = [entry for entry in self._running.values()
+                       if not entry[3] and (host is None or entry[0]['host'] == host)]
+            for entry in entries:
+                entry[3] = True
+        for entry in entries:
+            self._interrupt(entry, reason)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                if self._closed:
+                    return
+                now = time.time()
+                expired = [entry for entry in self._running.values()
+                           if entry[2] is not None and entry[2] <= now and not entry[3]]
+                for entry in expired:
+                    entry[3] = True
+                if not expired:
+                    deadlines = [entry[2] for entry in self._running.values() if entry[2] is not None and not entry[3]]
+                    self._condition.wait(min(deadlines) - now if deadlines else None)
+                    continue
+            for entry in expired:
+                self._interrupt(entry, 'deadline exceeded')
+
+    def _interrupt(self, entry, reason):
+        request, conn, _, _ = entry
+        request['interrupted'] = reason
+        self._log('host={} query_name="{}" interrupt ({})'.format(request['host'], request['query_name'], reason))
+        try:
+            with self._conn_pool.session(conn.host, conn.schema_name, ADMIN_RESOURCE_POOL) as admin:
+                statement = admin.exec_default("select statement_id from sessions where session_id = '{}'".format(
+                    conn.session_id))
+                try:
+                    if not statement or statement[0]['statement_id'] is None:
+                        raise Exception('session does not execute any statement')
+                    admin.exec_default("select interrupt_statement('{}', {}) as result".format(
+                        conn.session_id, statement[0]['statement_id']))
+                except Exception:
+                    # Closed session must not be reused, even if the worker does not get any error
+                    conn.broken = True
+                    admin.exec_default("select close_session('{}') as result".format(conn.session_id))
+        except Exception as e:
+            self._log('host={} query_name="{}" interrupt failed: {}'.format(request['host'], request['query_name'], e))
+        finally:
+            with self._condition:
+                # Interrupted once is enough
+                entry[2] = None
+                entry[3] = False
+                self._condition.notify_all()
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import array
+import collections
+from vertica_python.datatypes import VerticaType
+
+# Vertica types stored in compact arrays (buffer protocol, e.g. numpy.frombuffer(column, 'int64') works
+# without a copy), values of other types are kept as Python objects in lists
+ARRAY_TYPECODES = {
+    VerticaType.BOOL: 'b',
+    VerticaType.INT8: 'q',
+    VerticaType.FLOAT8: 'd'
+}
+
+Column = collections.namedtuple('Column', ['name', 'type_code', 'typecode', 'precision', 'scale'])
+
+
+def get_schema(description):
+    """
+    Schema of result from cursor description, shared by all batches of the result
+
+    :return: list of Column (name, Vertica type code, array typecode or None for Python objects,
+        precision and scale of NUMERIC columns)
+    :rtype: list
+    """
+    return [Column(column[0], column[1], ARRAY_TYPECODES.get(column[1]),
+                   column[4] if len(column) > 5 else None, column[5] if len(column) > 5 else None)
+            for column in description or []]
+
+
+class ColumnBatch(object):
+    """
+    Rows stored by columns. Column of array type is array.array, NULLs are stored as 0
+    with a flag in nulls (bytearray, None if the column has no NULL in the batch).
+    Column of other types is list of values (None for NULL).
+    """
+
+    def __init__(self, schema):
+        self.schema = schema
+        self.columns = [array.array(c.typecode) if c.typecode else [] for c in schema]
+        self.nulls = [None] * len(schema)
+        self.length = 0
+
+    @classmethod
+    def from_rows(cls, schema, rows):
+        """
+        Transpose rows (sequences of values in schema order) into a batch, one pass over the rows
+        """
+        batch = cls(schema)
+        batch.extend_rows(rows)
+        return batch
+
+    def extend_rows(self, rows):
+        start = self.length
+        if not rows:
+            return
+        for i, (column, values) in enumerate(zip(self.schema, zip(*rows))):
+            if not column.typecode:
+                self.columns[i].extend(values)
+                continue
+            if None in values:
+                if self.nulls[i] is None:
+                    self.nulls[i] = bytearray(start)
+                self.nulls[i].extend(value is None for value in values)
+                values = [0 if value is None else value for value in values]
+            elif self.nulls[i] is not None:
+                self.nulls[i].extend(bytes(len(values)))
+            self.columns[i].extend(values)
+        self.length += len(rows)
+
+    def extend(self, batch):
+        """
+        Append another batch of the same schema
+        """
+        for i in range(len(self.schema)):
+            if batch.nulls[i] is not None or self.nulls[i] is not None:
+                if self.nulls[i] is None:
+                    self.nulls[i] = bytearray(self.length)
+                self.nulls[i].extend(batch.nulls[i] if batch.nulls[i] is not None else bytes(batch.length))
+            self.columns[i].extend(batch.columns[i])
+        self.length += batch.length
+
+    def __len__(self):
+        return self.length
+
+    def column(self, name):
+        return self.columns[self.names().index(name)]
+
+    def names(self):
+        return [column.name for column in self.schema]
+
+    def values(self, i):
+        """
+        Values of column i as Python objects, None for NULL
+        """
+        values = self.columns[i]
+        # Booleans are stored as bytes
+        if self.schema[i].typecode == 'b':
+            values = [bool(value) for value in values]
+        if self.nulls[i] is None:
+            return values
+        return [None if null else value for value, null in zip(values, self.nulls[i])]
+
+    def rows(self):
+        """
+        Iterator of rows (tuples in schema order)
+        """
+        return zip(*[self.values(i) for i in range(len(self.schema))])
+
+
+class ColumnarResult(ColumnBatch):
+    """
+    Whole result stored by columns, with index of rows by key columns built while batches are appended.
+    """
+
+    def __init__(self, schema, key_list=None):
+        super(ColumnarResult, self).__init__(schema)
+        self._key_positions = [self.names().index(key) for key in key_list or []]
+        self.index = {}
+
+    def extend(self, batch):
+        if self._key_positions:
+            keys = zip(*[batch.values(i) for i in self._key_positions])
+            self.index.update((key, self.length + row) for row, key in enumerate(keys))
+        super(ColumnarResult, self).extend(batch)
+
+    def row(self, key):
+        """
+        Row with the key (tuple of values of key columns) as dict
+        """
+        position = self.index[key]
+        row = {}
+        for i, column in enumerate(self.schema):
+            value = None if self.nulls[i] and self.nulls[i][position] else self.columns[i][position]
+            row[column.name] = bool(value) if column.typecode == 'b' and value is not None else value
+        return row
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import time
+from threading import Condition, Lock
+
+
+class AdaptiveLimiter(object):
+    """
+    Concurrency limit of a phase, which adapts to what the resource pool sustains (AIMD).
+
+    Limit grows by one after a statement finishes, if other statements of the phase wait for a slot,
+    no statement of the pool waits in resource_queues (server-side queueing) and latency does not degrade.
+    Limit is reduced (multiplied by backoff) if statements queue inside Vertica or if short-term average
+    latency exceeds long-term average latency more than latency_tolerance times (after min_samples statements,
+    latencies of the first statements do not say much).
+    resource_queues is checked at most once per check_interval seconds, by the session which just finished
+    a statement.
+    """
+
+    def __init__(self, name, pool_name, initial, minimum=1, maximum=None, latency_tolerance=2.0, backoff=0.75,
+                 check_interval=1.0, min_samples=5, log=print):
+        self.name = name
+        self._pool_name = pool_name
+        self._minimum = max(1, minimum)
+        self.maximum = max(maximum or initial, self._minimum)
+        self.limit = min(max(initial, self._minimum), self.maximum)
+        self._latency_tolerance = latency_tolerance
+        self._backoff = backoff
+        self._check_interval = check_interval
+        self._min_samples = min_samples
+        self._samples = 0
+        self._log = log
+        self._condition = Condition()
+        self._check_lock = Lock()
+        self._in_use = 0
+        self._waiting = 0
+        self._short_latency = None
+        self._long_latency = None
+        self._server_queued = 0
+        self._last_check = 0
+        self.adjustments = 0
+
+    def acquire(self, blocking=True):
+        """
+        :param blocking: wait for a free slot, otherwise return False at once, if there is none
+        :rtype: bool
+        """
+        with self._condition:
+            if not blocking and self._in_use >= self.limit:
+                return False
+            self._waiting += 1
+            while self._in_use >= self.limit:
+                self._condition.wait()
+            self._waiting -= 1
+            self._in_use += 1
+            return True
+
+    def release(self):
+        with self._condition:
+            self._in_use -= 1
+            self._condition.notify_all()
+
+    def _check_server_queue(self, conn):
+        """
+        Number of statements of the pool queued in Vertica, None if it was checked recently
+        """
+        with self._check_lock:
+            if time.time() - self._last_check < self._check_interval:
+                return None
+            self._last_check = time.time()
+        result = conn.exec_default(
+            "select count(*) as cnt from resource_queues where pool_name = '{}'".format(self._pool_name.lower()))
+        return result[0]['cnt']
+
+    def observe(self, conn, latency):
+        """
+        Adjust limit after a statement finished successfully.
+
+        :param conn: session, which executed the statement
+        :param latency: execution time of the statement (seconds)
+        """
+        server_queued = self._check_server_queue(conn)
+        with self._condition:
+            if server_queued is not None:
+                self._server_queued = server_queued
+            self._samples += 1
+            if self._long_latency is None:
+                self._short_latency = self._long_latency = latency
+            else:
+                self._short_latency = 0.5 * self._short_latency + 0.5 * latency
+                self._long_latency = 0.9 * self._long_latency + 0.1 * latency
+            if server_queued:
+                self._set_limit(int(self.limit * self._backoff), 'resource_queues={}'.format(server_queued))
+            elif (self._samples >= self._min_samples
+                  and self._short_latency > self._long_latency * self._latency_tolerance):
+                self._set_limit(int(self.limit * self._backoff), 'latency {:.3f}s > {:.3f}s * {}'.format(
+                    self._short_latency, self._long_latency, self._latency_tolerance))
+                # Do not back off again for the same latency spike
+                self._short_latency = self._long_latency
+            elif self._waiting and not self._server_queued:
+                self._set_limit(self.limit + 1, 'waiting={}'.format(self._waiting))
+
+    def _set_limit(self, limit, reason):
+        limit = min(max(limit, self._minimum), self.maximum)
+        if limit == self.limit:
+            return
+        self._log('{} concurrency {} -> {} ({})'.format(self.name, self.limit, limit, reason))
+        self.limit = limit
+        self.adjustments += 1
+        self._condition.notify_all()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import random
+import re
+import time
+from vertica import open_copy_source
+from columnar import ColumnBatch, ColumnarResult, get_schema
+from vertica_python.datatypes import VerticaType
+
+RE_LABEL = re.compile(r'label\(([^)]+)\)', re.I)
+# Hints are removed from COPY statements, stream name is their label
+RE_STREAM_NAME = re.compile(r'stream\s+name\s+\'([^\']+)\'', re.I)
+
+
+class FakeVerticaConnection(object):
+    """
+    Stand-in for VerticaConnection, which does not need any database.
+    Every statement sleeps for configured latency, SELECTs return generated rows of configured size,
+    COPY reads the whole input. Used to benchmark overhead of the tool itself (scheduling, pooling,
+    result handling) on a machine without Vertica.
+
+    Settings (database/fake in config file):
+      connect_latency_ms - latency of opening a session
+      latency_ms, latency_jitter_ms - latency of each statement
+      label_latency_ms - latency by statement label, overrides latency_ms
+      result_rows, result_columns - size of result of each SELECT
+      label_result_rows - result rows by statement label, overrides result_rows
+    """
+
+    def __init__(self, conn_attributes, host, schema_name='public', resource_pool='general', settings=None):
+        self.host = host
+        self.schema_name = schema_name
+        self.resource_pool = resource_pool
+        self.session_id = 'fake-{}'.format(id(self))
+        self.broken = False
+        self._settings = settings or {}
+        self._closed = False
+        self._rows = []
+        self._description = []
+        start = time.time()
+        self._sleep(self._settings.get('connect_latency_ms', 10))
+        self.opened_at = time.time()
+        self.setup_duration = 0
+        self.connect_duration = self.opened_at - start
+
+    @staticmethod
+    def _sleep(latency_ms):
+        if latency_ms > 0:
+            time.sleep(latency_ms / 1000.0)
+
+    def _exec(self, stmt):
+        if self._closed:
+            raise Exception('Connection is closed, statement {}'.format(stmt))
+        label = RE_LABEL.search(stmt) or RE_STREAM_NAME.search(stmt)
+        latency = self._settings.get('latency_ms', 1)
+        if label:
+            latency = self._settings.get('label_latency_ms', {}).get(label.group(1), latency)
+        jitter = self._settings.get('latency_jitter_ms', 0)
+        self._sleep(latency + random.uniform(-jitter, jitter))
+        statement = stmt.lower()
+        if 'analyze_statistics' in statement:
+            self._set_result(['analyze_result'], [[0]])
+        elif 'analyze_constraints' in statement or 'from tables where' in statement:
+            self._set_result(['analyze_result'], [])
+        elif ' as cnt ' in statement:
+            self._set_result(['cnt'], [[0]])
+        elif statement.lstrip().startswith('select') and label:
+            columns = ['column_{}'.format(i) for i in range(int(self._settings.get('result_columns', 5)))]
+            result_rows = self._settings.get('label_result_rows', {}).get(
+                label.group(1), self._settings.get('result_rows', 100))
+            rows = [[row * len(columns) + i for i in range(len(columns))] for row in range(int(result_rows))]
+            self._set_result(columns, rows)
+        else:
+            self._set_result([], [])
+
+    def _set_result(self, columns, rows):
+        self._description = columns
+        self._rows = [dict(zip(columns, row)) for row in rows]
+
+    def close(self):
+        self._closed = True
+
+    def is_alive(self):
+        return not self._closed
+
+    def exec_default(self, stmt):
+        self._exec(stmt)
+        rows, self._rows = self._rows, []
+        return rows
+
+    def exec_stream(self, stmt, batch_size=10000):
+        self._exec(stmt)
+        rows, self._rows = self._rows, []
+        return self._description, (rows[i:i + batch_size] for i in range(0, len(rows), batch_size))
+
+    def exec_columnar(self, stmt, batch_size=10000):
+        self._exec(stmt)
+        rows, self._rows = self._rows, []
+        # Generated values are integers
+        schema = get_schema([(name, VerticaType.INT8) for name in self._description])
+        return schema, (ColumnBatch.from_rows(schema, [list(row.values()) for row in rows[i:i + batch_size]])
+                        for i in range(0, len(rows), batch_size))
+
+    def exec_columnar_indexed(self, stmt, key_list, batch_size=10000):
+        schema, batches = self.exec_columnar(stmt, batch_size)
+        result = ColumnarResult(schema, key_list)
+        for batch in batches:
+            result.extend(batch)
+        return result
+
+    def exec_simple(self, stmt):
+        rows = self.exec_default(stmt)
+        return dict(rows[0]) if rows else {}
+
+    def exec_noresult(self, stmt):
+        self._exec(stmt)
+
+    def exec_batch(self, statements):
+        durations = []
+        for stmt in statements:
+            start = time.time()
+            self._exec(stmt)
+            durations.append(time.time() - start)
+        return durations, None
+
+    def exec_copy_fh(self, stmt, fh, buffer_size=1024**2):
+        self._exec(stmt)
+        while fh.read(buffer_size):
+            pass
+
+    def exec_copy(self, stmt, file_path, buffer_size=1024**2, use_mmap=True):
+        source = open_copy_source(file_path, use_mmap)
+        try:
+            self.exec_copy_fh(stmt, source, buffer_size)
+        finally:
+            source.close()
@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import math
+import multiprocessing
+import os
+import random
+import zlib
+from datetime import datetime, timedelta
+from loader import PipeSource, merge_files
+
+# YouTube category ids
+CATEGORIES = [1, 2, 10, 15, 17, 19, 20, 22, 23, 24, 25, 26, 27, 28, 29, 43, 44]
+ID_ALPHABET = 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-_'
+# Odd multiplier scrambles sequential indexes into unique ids (bijection modulo 64^11)
+ID_MULTIPLIER = 0x9E3779B97F4A7C15
+VIDEOS_PER_USER = 3
+
+META_HEADER = 'gid,user_id,category_id,created_at,duration'
+HISTORY_HEADER = 'gid,views,likes,dislikes,comments,updated_at'
+
+DEFAULTS = {
+    'seed': 42,
+    'videos': 10000,
+    'days': 7,
+    'start_date': '2018-06-01',
+    'created_days': 1,
+    'updates_per_day': {'distribution': 'pareto', 'mean': 3, 'max': 36},
+    'category_skew': 1.0,
+    'decrease_rate': 0.01,
+    'null_rate': 0.02,
+    'malformed_rate': 0.0001,
+    'processes': 4,
+    'meta_file': 'data/generated_meta.csv',
+    'history_file': 'data/generated_history.csv'
+}
+
+
+def get_generator_options(config_generator, videos=None, days=None, seed=None):
+    """
+    Options of the generator - generator section of config file over DEFAULTS, overridden by arguments
+    """
+    options = dict(DEFAULTS, **(config_generator or {}))
+    options['updates_per_day'] = dict(DEFAULTS['updates_per_day'], **options['updates_per_day'])
+    for key, value in (('videos', videos), ('days', days), ('seed', seed)):
+        if value is not None:
+            options[key] = value
+    return options
+
+
+def _get_id(index, length, seed=0):
+    number = (index * ID_MULTIPLIER + seed) % 64**length
+    chars = []
+    for _ in range(length):
+        number, digit = divmod(number, 64)
+        chars.append(ID_ALPHABET[digit])
+    return ''.join(chars)
+
+
+def _get_category_weights(skew):
+    """
+    Cumulative Zipf weights of CATEGORIES, skew 0 means uniform
+    """
+    weights = [1 / (rank ** skew) for rank in range(1, len(CATEGORIES) + 1)]
+    return [sum(weights[:i + 1]) for i in range(len(weights))]
+
+
+def _get_updates(rng, updates_per_day):
+    """
+    Number of updates of a video in one day - uniform (1 .. 2 * mean - 1), poisson or pareto (heavy tail,
+    few videos are updated much more often), at least 1, at most max
+    """
+    distribution = updates_per_day['distribution']
+    mean = float(updates_per_day['mean'])
+    if distribution == 'uniform':
+        count = rng.randint(1, max(1, int(2 * mean - 1)))
+    elif distribution == 'poisson':
+        # Knuth, means are small
+        limit, count, product = math.exp(-mean), 0, rng.random()
+        while product > limit:
+            count += 1
+            product *= rng.random()
+    elif distribution == 'pareto':
+        # Pareto with minimum 1 has mean alpha / (alpha - 1)
+        count = int(rng.paretovariate(mean / (mean - 1) if mean > 1 else 1.0e6))
+    else:
+        raise ValueError('unknown distribution of updates_per_day: {}'.format(distribution))
+    return min(max(count, 1), int(updates_per_day['max']))
+
+
+def _format_time(days, seconds):
+    """
+    :param days: list of days (YYYY-MM-DD) starting with start_date
+    :param seconds: seconds since start_date
+    """
+    day, seconds = divmod(seconds, 86400)
+    hours, seconds = divmod(seconds, 3600)
+    return '{} {:02d}:{:02d}:{:02d}'.format(days[day], hours, *divmod(seconds, 60))
+
+
+def _get_days(options, count):
+    start = datetime.strptime(options['start_date'], '%Y-%m-%d')
+    return [(start + timedelta(days=day)).strftime('%Y-%m-%d') for day in range(count)]
+
+
+def _malformed(line, checksum):
+    """
+    Corrupt the line - unbalanced quote, non-numeric counter, missing value or invalid timestamp (by checksum)
+    """
+    values = line.split(',')
+    kind = checksum % 4
+    if kind == 0:
+        values[0] = '"' + values[0].strip('"')
+    elif kind == 1:
+        values[1] = 'n/a'
+    elif kind == 2:
+        values.pop(1 + (checksum >> 2) % (len(values) - 1))
+    else:
+        values[-1] = '2018-13-45 25:61:00'
+    return ','.join(values)
+
+
+def iter_videos(options, chunk=0, chunks=1):
+    """
+    Videos of the chunk (contiguous range of video indexes), each one generated by its own random generator
+    seeded by the index, so any chunk (and meta / history of the same video) can be generated independently
+    and the output does not depend on number of chunks.
+
+    :return: generator of tuples (random generator, meta values), created_at is in seconds since start_date
+    """
+    seed = int(options['seed'])
+    created_seconds = int(options['created_days']) * 86400
+    cum_weights = _get_category_weights(float(options['category_skew']))
+    videos = int(options['videos'])
+    users = max(1, videos // VIDEOS_PER_USER)
+    for index in range(videos * chunk // chunks, videos * (chunk + 1) // chunks):
+        rng = random.Random(seed * 1000003 + index)
+        user = rng.randrange(users)
+        yield rng, {
+            'gid': 'YT:{}'.format(_get_id(index, 11, seed)),
+            'user_id': 'UC{}{}'.format(_get_id(user, 11, seed), _get_id(user, 11, seed + 1)),
+            'category_id': rng.choices(CATEGORIES, cum_weights=cum_weights)[0],
+            'created_at': rng.randrange(created_seconds),
+            'duration': int(rng.lognormvariate(5.5, 1.0)) + 1
+        }
+
+
+def iter_meta_lines(options, chunk=0, chunks=1):
+    """
+    Records in format of youtube_meta input file
+    """
+    days = _get_days(options, int(options['created_days']))
+    for _, video in iter_videos(options, chunk, chunks):
+        yield '{},{},{},{},{}'.format(video['gid'], video['user_id'], video['category_id'],
+                                      _format_time(days, video['created_at']), video['duration'])
+
+
+def iter_history_lines(options, chunk=0, chunks=1):
+    """
+    Records in format of youtube_history input file - updates of counters of each video from its creation
+    until the end of the last day, empty (NULL) counters are quoted empty values
+    """
+    days = _get_days(options, int(options['days']))
+    decrease_rate = float(options['decrease_rate'])
+    null_rate = float(options['null_rate'])
+    for rng, video in iter_videos(options, chunk, chunks):
+        # Views per second
+        popularity = rng.lognormvariate(3, 1.5) / 3600
+        counters = [0, 0, 0, 0]
+        ratios = [1.0, rng.uniform(0.01, 0.05), rng.uniform(0.0005, 0.005), rng.uniform(0.001, 0.01)]
+        previous = video['created_at']
+        for day in range(len(days)):
+            day_start = max(day * 86400, video['created_at'])
+            day_seconds = (day + 1) * 86400 - day_start
+            if day_seconds <= 0:
+                continue
+            updates = _get_updates(rng, options['updates_per_day'])
+            for offset in sorted(rng.sample(range(day_seconds), min(updates, day_seconds))):
+                updated_at = day_start + offset
+                increment = popularity * (updated_at - previous) * rng.uniform(0.5, 1.5)
+                previous = updated_at
+                for i, ratio in enumerate(ratios):
+                    counters[i] += int(increment * ratio)
+                # Views / likes removed by YouTube (spam, deleted accounts)
+                if rng.random() < decrease_rate:
+                    counter = rng.randrange(4)
+                    counters[counter] = int(counters[counter] * rng.uniform(0.9, 1.0))
+                values = ['""' if i and rng.random() < null_rate else str(value) for i, value in enumerate(counters)]
+                yield '"{}",{},{}'.format(video['gid'], ','.join(values), _format_time(days, updated_at))
+
+
+def generate(send, kind, options, chunk=0, chunks=1, block_size=1024**2):
+    """
+    Generate records of the chunk (file starts with header in the first chunk), send them encoded in UTF-8
+    in blocks of about block_size bytes.
+
+    :param send: function(bytes)
+    :param kind: meta or history
+    :return: number of records, malformed records and bytes
+    :rtype: dict
+    """
+    if kind == 'meta':
+        header, lines = META_HEADER, iter_meta_lines(options, chunk, chunks)
+    elif kind == 'history':
+        header, lines = HISTORY_HEADER, iter_history_lines(options, chunk, chunks)
+    else:
+        raise ValueError('unknown kind of generated records: {}'.format(kind))
+    # Malformed records are chosen by checksum of the record, so they do not depend on chunks,
+    # and higher rate corrupts the same records and some more
+    malformed_limit = float(options['malformed_rate']) * 2**32
+    stats = {'rows': 0, 'malformed': 0, 'bytes': 0}
+    buffer = [header] if chunk == 0 else []
+    size = 0
+    for line in lines:
+        if malformed_limit:
+            checksum = zlib.crc32(line.encode('utf-8'))
+            if checksum < malformed_limit:
+                line = _malformed(line, checksum)
+                stats['malformed'] += 1
+        buffer.append(line)
+        stats['rows'] += 1
+        size += len(line) + 1
+        if size >= block_size:
+            data = ('\n'.join(buffer) + '\n').encode('utf-8')
+            stats['bytes'] += len(data)
+            send(data)
+            buffer = []
+            size = 0
+    if buffer:
+        data = ('\n'.join(buffer) + '\n').encode('utf-8')
+        stats['bytes'] += len(data)
+        send(data)
+    return stats
+
+
+class GeneratedSource(PipeSource):
+    """
+    Source of COPY FROM STDIN - generated records of the chunk, produced by a separate process (see PipeSource)
+    """
+
+    def __init__(self, kind, options, chunk=0, chunks=1):
+        super(GeneratedSource, self).__init__(generate, [kind, options, chunk, chunks],
+                                              'Generator of {} chunk {}'.format(kind, chunk))
+
+
+def _write_chunk(kind, options, file_name, chunk, chunks):
+    with open('{}.{}'.format(file_name, chunk), 'wb') as fp:
+        return generate(fp.write, kind, options, chunk, chunks)
+
+
+def write_file(kind, options, file_name=None):
+    """
+    Write generated records into file (default meta_file / history_file option). Chunks are generated
+    by processes (option processes) into part files, which are merged then.
+
+    :return: number of records, malformed records and bytes
+    :rtype: dict
+    """
+    file_name = file_name or options['{}_file'.format(kind)]
+    directory = os.path.dirname(file_name)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+    chunks = max(1, int(options['processes']))
+    try:
+        with multiprocessing.Pool(chunks) as pool:
+            stats = pool.starmap(_write_chunk, [(kind, options, file_name, chunk, chunks) for chunk in range(chunks)])
+    finally:
+        merge_files(file_name, chunks)
+    return {key: sum(chunk_stats[key] for chunk_stats in stats) for key in ('rows', 'malformed', 'bytes')}
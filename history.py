@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import json
+import os
+from threading import Lock
+
+
+class DurationHistory(object):
+    """
+    Local store of expected durations (ms) of statements by host and label, from previous runs.
+    Expected duration is exponential moving average of successful executions (alpha = weight of the latest one).
+    Results served from the result cache, statements skipped by resumed run and statements executed in batches
+    (approximate durations) are not counted, they do not say anything about the query.
+    """
+
+    def __init__(self, file_name, alpha=0.5):
+        self._file_name = file_name
+        self._alpha = alpha
+        self._lock = Lock()
+        try:
+            with open(file_name) as fp:
+                self._durations = json.load(fp)
+        except (OSError, ValueError):
+            self._durations = {}
+
+    def get(self, host, label):
+        """
+        :return: expected duration in ms, None if the label was not executed on the host yet
+        """
+        with self._lock:
+            return self._durations.get(host, {}).get(label)
+
+    def update(self, host, results):
+        with self._lock:
+            durations = self._durations.setdefault(host, {})
+            for result in results:
+                if (result['status'] != 'ok' or result.get('resumed') or result.get('batched')
+                        or (result.get('result') or {}).get('cached')):
+                    continue
+                previous = durations.get(result['query_name'])
+                duration = result['duration']
+                if previous is not None:
+                    duration = self._alpha * duration + (1 - self._alpha) * previous
+                durations[result['query_name']] = round(duration, 1)
+
+    def order(self, requests):
+        """
+        Requests ordered longest expected first (longest processing time first minimizes makespan
+        of parallel execution). Requests without history follow in original order.
+        """
+        return sorted(requests, key=lambda r: -(self.get(r['host'], r['query_name']) or 0))
+
+    def save(self):
+        tmp_file = '{}.tmp'.format(self._file_name)
+        with self._lock:
+            with open(tmp_file, 'w') as fp:
+                json.dump(self._durations, fp, indent=2, sort_keys=True)
+        os.replace(tmp_file, self._file_name)
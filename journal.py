@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import hashlib
+import json
+import os
+import re
+import time
+from threading import Lock
+from result_cache import normalize_sql
+from scheduler import get_tables
+
+# Statements appending into a table, partially committed data would be duplicated by their rerun
+RE_APPEND = re.compile(r'^\s*(?:copy|insert)\b', re.I)
+
+
+def get_sql_hash(request):
+    return hashlib.sha256(normalize_sql(request['sql_statement'] or request['query_name']).encode('utf-8')).hexdigest()
+
+
+class RunJournal(object):
+    """
+    Durable journal of statement executions - JSON lines (host, phase, label, SQL hash, outcome), each record
+    is flushed and fsynced, so it survives crash of the process.
+    New run starts a new journal. Resumed run reads the journal first and skips statements, which already
+    succeeded (same host, label and SQL), see plan.
+    """
+
+    def __init__(self, file_name, resume=False):
+        self._lock = Lock()
+        self._completed = set()
+        self._incomplete = set()
+        self._truncate = {}
+        if resume and os.path.isfile(file_name):
+            with open(file_name) as fp:
+                for line in fp:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # Last record can be torn by crash
+                        continue
+                    key = (record['host'], record['label'], record['sql_hash'])
+                    if record['status'] == 'ok':
+                        self._completed.add(key)
+                        self._incomplete.discard(key)
+                    else:
+                        self._incomplete.add(key)
+                        self._completed.discard(key)
+        self._fp = open(file_name, 'a' if resume else 'w')
+
+    @staticmethod
+    def get_key(request):
+        return request['host'], request['query_name'], get_sql_hash(request)
+
+    def plan(self, requests):
+        """
+        Find tables to be truncated before incomplete statements rerun. Targets of COPY / INSERT statements,
+        which started but did not succeed, can contain partially committed data (COPY chunks commit separately,
+        process can die between commit and journal record). Table is truncated only if it is created by
+        the pipeline (DDL) and none of its other writers succeeded, otherwise it is left as it is.
+
+        :param requests: all requests of the pipeline on a host
+        :return: list of tuples (label, tables to be truncated)
+        :rtype: list
+        """
+        created = set()
+        writers = {}
+        for request in requests:
+            # Analyze requests do not change data
+            if request['query_type'] == 'analyze':
+                continue
+            writes = get_tables(request['sql_statement'])[1]
+            if request['query_type'] == 'ddl':
+                created |= writes
+                continue
+            for table in writes:
+                writers.setdefault(table, []).append(request)
+        planned = []
+        for request in requests:
+            key = self.get_key(request)
+            if key not in self._incomplete or not RE_APPEND.match(request['sql_statement']):
+                continue
+            tables = sorted(table for table in get_tables(request['sql_statement'])[1]
+                            if table in created and not any(self.get_key(writer) in self._completed
+                                                            for writer in writers[table] if writer is not request))
+            if tables:
+                self._truncate[key] = tables
+                planned.append((request['query_name'], tables))
+        return planned
+
+    def apply(self, request):
+        """
+        Mark request as resumed (succeeded in previous run), or set tables to be truncated before its execution
+        """
+        key = self.get_key(request)
+        if key in self._completed:
+            request.update({'resumed': True, 'status': 'ok', 'error': '', 'duration': 0, 'result': {}})
+        elif key in self._truncate:
+            request['truncate_tables'] = self._truncate[key]
+        return request
+
+    def _write(self, request, status):
+        record = {
+            'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'host': request['host'],
+            'phase': request['phase']['name'],
+            'label': request['query_name'],
+            'sql_hash': get_sql_hash(request),
+            'status': status,
+            'error': request.get('error', '') if status != 'started' else '',
+            'duration': request.get('duration', 0) if status != 'started' else 0
+        }
+        with self._lock:
+            self._fp.write(json.dumps(record) + '\n')
+            self._fp.flush()
+            os.fsync(self._fp.fileno())
+
+    def start(self, request):
+        self._write(request, 'started')
+
+    def finish(self, request):
+        self._write(request, request['status'])
+
+    def close(self):
+        with self._lock:
+            self._fp.close()
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import json
+import mmap
+import multiprocessing
+import os
+import re
+
+RE_REJECTED = re.compile(r'(rejected\s+data\s+\')([^\']+)(\')', re.I)
+RE_EXCEPTIONS = re.compile(r'(exceptions\s+\')([^\']+)(\')', re.I)
+RE_STREAM_NAME = re.compile(r'(stream\s+name\s+\')([^\']+)(\')', re.I)
+RE_ENCLOSED = re.compile(r'enclosed\s+(?:by\s+)?\'([^\']+)\'', re.I)
+RE_DELIMITER = re.compile(r'delimiter\s+(?:as\s+)?\'([^\']+)\'', re.I)
+RE_REJECTMAX = re.compile(r'rejectmax\s+(\d+)', re.I)
+
+# Messages of PipeSource process - data, end (statistics) and error
+DATA, END, ERROR = b'D', b'E', b'X'
+
+
+def get_enclosed(statement):
+    """
+    Quote character of COPY statement (ENCLOSED BY), None if not used
+    """
+    enclosed = RE_ENCLOSED.search(statement)
+    return enclosed.group(1) if enclosed else None
+
+
+def get_delimiter(statement):
+    """
+    Delimiter of COPY statement, Vertica default is |
+    """
+    delimiter = RE_DELIMITER.search(statement)
+    return delimiter.group(1) if delimiter else '|'
+
+
+def get_rejectmax(statement):
+    """
+    REJECTMAX of COPY statement, None if not used
+    """
+    rejectmax = RE_REJECTMAX.search(statement)
+    return int(rejectmax.group(1)) if rejectmax else None
+
+
+def _next_boundary(fp, offset, quote, quoted, block_size):
+    """
+    Find first record boundary (position after new line, which is not enclosed in quotes) at or after offset.
+
+    :param quoted: True, if offset is inside quotes
+    :return: tuple (boundary, quoted at boundary), boundary is None, if end of file is reached
+    """
+    fp.seek(offset)
+    position = offset
+    while True:
+        block = fp.read(block_size)
+        if not block:
+            return None, quoted
+        start = 0
+        while True:
+            new_line = block.find(b'\n', start)
+            if new_line < 0:
+                if quote:
+                    quoted ^= block.count(quote, start) % 2 == 1
+                break
+            if quote:
+                quoted ^= block.count(quote, start, new_line) % 2 == 1
+            if not quoted:
+                return position + new_line + 1, quoted
+            start = new_line + 1
+        position += len(block)
+
+
+def _quoted_at(fp, start, end, quote, quoted, block_size):
+    """
+    Quote state at position end, if state at position start is known.
+    Doubled quotes (escaped quotes inside enclosed value) do not change the state.
+    """
+    fp.seek(start)
+    position = start
+    while position < end:
+        block = fp.read(min(block_size, end - position))
+        if not block:
+            break
+        quoted ^= block.count(quote) % 2 == 1
+        position += len(block)
+    return quoted
+
+
+def split_file(file_path, chunks, quote=None, block_size=1024**2):
+    """
+    Split file into byte ranges of similar size at record boundaries.
+    If quote is set (ENCLOSED BY of COPY), new lines inside quoted values are not considered as boundaries,
+    the whole file is scanned then (count of quote characters only, which is fast).
+
+    :param file_path: path to the file to be split
+    :param chunks: required number of ranges
+    :param quote: quote character
+    :param block_size: size of blocks read during scan
+    :return: list of tuples (start, end)
+    :rtype: list
+    """
+    size = os.path.getsize(file_path)
+    quote = quote.encode() if quote else None
+    ranges = []
+    start = 0
+    quoted = False
+    with open(file_path, 'rb') as fp:
+        for i in range(1, chunks):
+            target = max(size * i // chunks, start)
+            if quote:
+                quoted = _quoted_at(fp, start, target, quote, quoted, block_size)
+            boundary, quoted = _next_boundary(fp, target, quote, quoted, block_size)
+            if boundary is None or boundary >= size:
+                break
+            ranges.append((start, boundary))
+            start = boundary
+    ranges.append((start, size))
+    return ranges
+
+
+class FileRange(object):
+    """
+    Read-only file-like object limited to byte range of a memory-mapped file, used as a source of COPY FROM STDIN.
+    Concurrent ranges of the same file share page cache, nothing is decoded or buffered on the client.
+    """
+
+    def __init__(self, file_path, start, end):
+        self._mmap = None
+        self._position = start
+        self._end = end
+        if end > start:
+            with open(file_path, 'rb') as fp:
+                self._mmap = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def read(self, size=-1):
+        if size < 0 or size > self._end - self._position:
+            size = self._end - self._position
+        if size <= 0:
+            return b''
+        data = self._mmap[self._position:self._position + size]
+        self._position += size
+        return data
+
+    def close(self):
+        if self._mmap:
+            self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def _pipe_source_process(sender, target, args):
+    try:
+        stats = target(lambda data: sender.send_bytes(DATA + data), *args)
+        sender.send_bytes(END + json.dumps(stats).encode('utf-8'))
+    except Exception as e:
+        sender.send_bytes(ERROR + str(e).encode('utf-8'))
+    finally:
+        sender.close()
+
+
+class PipeSource(object):
+    """
+    Source of COPY FROM STDIN produced by a separate process, so producing of records overlaps with loading
+    and does not compete for GIL with other streams. Data is passed through a pipe, which blocks the process,
+    when COPY falls behind.
+
+    :param target: function(send, *args), calls send(bytes) with produced data, returns statistics (dict)
+    :param name: name of the source in errors
+    """
+
+    def __init__(self, target, args, name):
+        self.stats = None
+        self._buffer = b''
+        self._eof = False
+        self._name = name
+        receiver, sender = multiprocessing.Pipe(duplex=False)
+        self._receiver = receiver
+        self._process = multiprocessing.Process(target=_pipe_source_process, args=[sender, target, args], daemon=True)
+        self._process.start()
+        # The process holds its own end, EOF is detected if it dies
+        sender.close()
+
+    def _receive(self):
+        try:
+            message = self._receiver.recv_bytes()
+        except EOFError:
+            raise Exception('{} failed, process exited with code {}'.format(self._name, self._process.exitcode))
+        kind, data = message[:1], message[1:]
+        if kind == DATA:
+            self._buffer += data
+        elif kind == END:
+            self.stats = json.loads(data.decode('utf-8'))
+            self._eof = True
+        else:
+            raise Exception('{} failed: {}'.format(self._name, data.decode('utf-8')))
+
+    def read(self, size=-1):
+        while not self._eof and (size < 0 or len(self._buffer) < size):
+            self._receive()
+        if size < 0:
+            size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    def close(self):
+        self._receiver.close()
+        # COPY failed before all data was read, the process would wait for the pipe
+        if self._process.is_alive():
+            self._process.terminate()
+        self._process.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def get_chunk_statement(statement, index):
+    """
+    COPY statement for one chunk - rejected data / exceptions files and stream name get the chunk suffix,
+    so concurrent streams do not overwrite each other's files.
+    """
+    statement = RE_REJECTED.sub(r'\g<1>\g<2>.{}\g<3>'.format(index), statement)
+    statement = RE_EXCEPTIONS.sub(r'\g<1>\g<2>.{}\g<3>'.format(index), statement)
+    return RE_STREAM_NAME.sub(r'\g<1>\g<2>_{}\g<3>'.format(index), statement)
+
+
+def get_rejected_files(statement):
+    """
+    Rejected data and exceptions files of COPY statement, None if not used
+    """
+    rejected = RE_REJECTED.search(statement)
+    exceptions = RE_EXCEPTIONS.search(statement)
+    return rejected.group(2) if rejected else None, exceptions.group(2) if exceptions else None
+
+
+def get_rejections_table_statement(statement, table):
+    """
+    COPY statement rejecting records into the table (REJECTED DATA AS TABLE) instead of rejected data / exceptions
+    files, which would be written on the node executing the statement, not on the client.
+    """
+    rejected = 'rejected data as table {}'.format(table)
+    if RE_REJECTED.search(statement):
+        return RE_EXCEPTIONS.sub('', RE_REJECTED.sub(rejected, statement))
+    return RE_EXCEPTIONS.sub(rejected, statement)
+
+
+def write_rejections(rows, rejected_file, exception_file):
+    """
+    Write records rejected into a table (see get_rejections_table_statement) into rejected data / exceptions files.
+    Nothing is written, if no record was rejected.
+
+    :param rows: rows of the rejections table (rejected_data, rejected_reason)
+    """
+    if not rows:
+        return
+    if rejected_file:
+        with open(rejected_file, 'w') as fp:
+            fp.writelines('{}\n'.format(row['rejected_data']) for row in rows)
+    if exception_file:
+        with open(exception_file, 'w') as fp:
+            fp.writelines('{}\n'.format(row['rejected_reason']) for row in rows)
+
+
+def merge_files(target_file, chunks):
+    """
+    Merge files written by chunks (target_file.0, target_file.1, ...) into target_file.
+    Nothing is written, if none of the chunks produced a file.
+    """
+    parts = ['{}.{}'.format(target_file, i) for i in range(chunks)]
+    parts = [part for part in parts if os.path.isfile(part)]
+    if not parts:
+        return
+    with open(target_file, 'wb') as target:
+        for part in parts:
+            with open(part, 'rb') as fp:
+                while True:
+                    block = fp.read(1024**2)
+                    if not block:
+                        break
+                    target.write(block)
+            os.remove(part)
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import collections
+import json
+import os
+import time
+from pathlib import Path
+from threading import Lock
+
+# Stages of request execution, in order
+STAGES = ('queued', 'connect', 'setup', 'execute', 'first_row', 'fetch', 'serialize')
+
+
+def get_tags(request):
+    return {
+        'host': request['host'],
+        'phase': request['phase']['name'],
+        'label': request['query_name'],
+        'pool': request['phase']['pool_name']
+    }
+
+
+def _format_labels(tags):
+    def escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return ','.join('{}="{}"'.format(key, escape(value)) for key, value in tags)
+
+
+class MetricsWriter(object):
+    """
+    Per-run metrics of finished requests. Each request is appended as JSON line event into <run_id>.jsonl
+    as soon as it finishes, totals per (host, phase, label, pool) are written in Prometheus text format
+    into <run_id>.prom when the run is closed (node_exporter textfile collector can pick it up).
+    """
+
+    def __init__(self, directory, run_id=None):
+        self.run_id = run_id or '{}_{:03d}'.format(time.strftime('%Y%m%d_%H%M%S'), int(time.time() * 1000) % 1000)
+        self._directory = Path(directory)
+        self._directory.mkdir(parents=True, exist_ok=True)
+        self._lock = Lock()
+        self._events = open(self._directory / '{}.jsonl'.format(self.run_id), 'w')
+        self._seconds = collections.Counter()
+        self._executions = collections.Counter()
+        self._rows = collections.Counter()
+        self._bytes = collections.Counter()
+
+    def record(self, request):
+        tags = get_tags(request)
+        result = request.get('result') or {}
+        event = dict(tags,
+                     run_id=self.run_id,
+                     status=request['status'],
+                     error=request['error'],
+                     start_time=request.get('start_time'),
+                     duration=request['duration'],
+                     timings=request.get('timings', {}),
+                     rows=result.get('rows', 0),
+                     bytes=result.get('bytes', 0))
+        key = tuple(tags.items())
+        with self._lock:
+            self._events.write(json.dumps(event, default=str) + '\n')
+            self._events.flush()
+            for stage, duration in request.get('timings', {}).items():
+                self._seconds[key + (('stage', stage),)] += duration / 1000.0
+            self._executions[key + (('status', request['status']),)] += 1
+            self._rows[key] += event['rows']
+            self._bytes[key] += event['bytes']
+
+    def _write_metric(self, fp, name, help_text, values):
+        fp.write('# HELP {} {}\n'.format(name, help_text))
+        fp.write('# TYPE {} counter\n'.format(name))
+        for key, value in sorted(values.items()):
+            fp.write('{}{{{}}} {}\n'.format(name, _format_labels(key), round(value, 6)))
+
+    def close(self):
+        """
+        Close event log and write Prometheus text file
+        """
+        prom_file = self._directory / '{}.prom'.format(self.run_id)
+        tmp_file = prom_file.with_suffix('.prom.tmp')
+        with self._lock:
+            self._events.close()
+            with open(tmp_file, 'w') as fp:
+                self._write_metric(fp, 'pex_query_stage_seconds_total',
+                                   'Time spent in stage of query execution (first_row is part of fetch)', self._seconds)
+                self._write_metric(fp, 'pex_query_executions_total', 'Executed queries by status', self._executions)
+                self._write_metric(fp, 'pex_query_rows_total', 'Rows returned by queries', self._rows)
+                self._write_metric(fp, 'pex_query_bytes_total', 'Bytes of results written or files loaded',
+                                   self._bytes)
+        os.replace(tmp_file, prom_file)
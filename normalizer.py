@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import codecs
+import collections
+import csv
+import io
+import re
+from datetime import datetime, timezone
+from loader import FileRange, PipeSource
+from vertica import open_copy_source
+
+RE_COPY_COLUMNS = re.compile(r'^(\s*copy\s+(?:/\*.*?\*/\s*)?[\w.]+)\s*(?:\(.*\)\s*)?(from\s)', re.I | re.S)
+
+
+def get_normalized_statement(statement, columns):
+    """
+    COPY statement loading normalized records - plain list of target columns (FILLER / AS expressions
+    of the original statement are not needed, values are already cleaned and typed)
+    """
+    return RE_COPY_COLUMNS.sub(lambda m: '{} ({})\n{}'.format(m.group(1), ', '.join(columns), m.group(2)),
+                               statement, count=1)
+
+
+def _to_int(value):
+    try:
+        return str(int(value))
+    except ValueError:
+        pass
+    # Integers exported as floats (5.0)
+    try:
+        number = float(value)
+    except ValueError:
+        number = None
+    if number is None or not number.is_integer():
+        raise ValueError('not an integer: {}'.format(value))
+    return str(int(number))
+
+
+def _to_float(value):
+    return repr(float(value))
+
+
+def _to_timestamp(value):
+    """
+    ISO 8601 (T or space separator, Z or offset), / as date separator, or epoch seconds
+    """
+    if value.isdigit():
+        return datetime.fromtimestamp(int(value), timezone.utc).isoformat(sep=' ')
+    return datetime.fromisoformat(value.replace('/', '-').replace('Z', '+00:00')).isoformat(sep=' ')
+
+
+CONVERTERS = {
+    'text': None,
+    'int': _to_int,
+    'float': _to_float,
+    'timestamp': _to_timestamp
+}
+
+
+def iter_lines(source, encoding='utf-8', block_size=1024**2):
+    """
+    Lines of binary source (any object with read(size)), decoded incrementally, without line terminators
+    """
+    decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+    pending = ''
+    while True:
+        block = source.read(block_size)
+        lines = (pending + decoder.decode(block, final=not block)).split('\n')
+        pending = lines.pop()
+        for line in lines:
+            yield line.rstrip('\r')
+        if not block:
+            break
+    if pending:
+        yield pending
+
+
+def iter_records(lines, delimiter, quote, max_record_size=65536, columns=None):
+    """
+    Records (lists of values) of delimited lines. Quoted values can contain line terminators, lines are joined
+    until quotes are balanced and the record is parsed by csv.reader.
+    Unbalanced quote would swallow following records - if it is not closed until the end of input, the record
+    grows over max_record_size characters or the joined lines do not have the expected number of values (columns),
+    values of its first line are taken as they are, without quotes (quote repair), and following lines are parsed again.
+    """
+    if not quote:
+        for line in lines:
+            if line:
+                yield line, line.split(delimiter)
+        return
+    lines = iter(lines)
+    replay = collections.deque()
+    # Lines of the record with unbalanced quotes
+    pending, size, quotes = [], 0, 0
+    while True:
+        line = replay.popleft() if replay else next(lines, None)
+        if line is not None:
+            if not pending and not line:
+                continue
+            pending.append(line)
+            size += len(line)
+            quotes += line.count(quote)
+            if quotes % 2 == 0:
+                record = '\n'.join(pending)
+                values = next(csv.reader(io.StringIO(record, newline=''), delimiter=delimiter, quotechar=quote))
+                if len(pending) == 1 or columns is None or len(values) == columns:
+                    pending, size, quotes = [], 0, 0
+                    yield record, values
+                    continue
+            elif size <= max_record_size:
+                continue
+        elif not pending:
+            break
+        yield pending[0], [value.replace(quote, '') for value in pending[0].split(delimiter)]
+        replay.extendleft(reversed(pending[1:]))
+        pending, size, quotes = [], 0, 0
+
+
+def iter_normalized(records, types):
+    """
+    Validated records - empty values are NULLs (None), values are converted by column types.
+    Invalid records are yielded with error instead of values.
+
+    :param types: list of column types (text, int, float, timestamp) in order of values
+    :return: generator of tuples (line, values or None, error or None)
+    """
+    converters = [CONVERTERS[column_type] for column_type in types]
+    for line, values in records:
+        if len(values) != len(converters):
+            yield line, None, 'expected {} values, found {}'.format(len(converters), len(values))
+            continue
+        try:
+            normalized = []
+            for value, converter in zip(values, converters):
+                value = value.strip()
+                normalized.append(None if not value else converter(value) if converter else value)
+        except ValueError as e:
+            yield line, None, str(e)
+            continue
+        yield line, normalized, None
+
+
+def normalize(source, send, options, rejected_file, skip_header, block_size=1024**2):
+    """
+    Normalize records of source, send them (encoded in UTF-8, blocks of about block_size bytes)
+    in format of the COPY statement - delimiter, quote, empty value is NULL.
+
+    :param send: function(bytes)
+    :param options: columns (dict name -> type), delimiter, quote, encoding, rejectmax, max_record_size
+    :param rejected_file: invalid records are written into this file (created only if there are any)
+    :return: number of loaded and rejected records
+    :rtype: dict
+    """
+    delimiter = options.get('delimiter', '|')
+    quote = options.get('quote')
+    rejectmax = options.get('rejectmax')
+    lines = iter_lines(source, options.get('encoding', 'utf-8'), block_size)
+    if skip_header:
+        next(lines, None)
+    records = iter_records(lines, delimiter, quote, options.get('max_record_size', 65536), len(options['columns']))
+    records = iter_normalized(records, list(options['columns'].values()))
+    buffer = io.StringIO()
+    if quote:
+        writer = csv.writer(buffer, delimiter=delimiter, quotechar=quote, lineterminator='\n')
+    else:
+        writer = csv.writer(buffer, delimiter=delimiter, quoting=csv.QUOTE_NONE, quotechar=None, lineterminator='\n')
+    stats = {'rows': 0, 'rejected': 0}
+    rejected = None
+    try:
+        for line, values, error in records:
+            if values is not None and not quote and any(v and (delimiter in v or '\n' in v) for v in values):
+                values, error = None, 'value contains delimiter, COPY does not use ENCLOSED BY'
+            if values is None:
+                stats['rejected'] += 1
+                if rejected is None:
+                    rejected = open(rejected_file, 'w', encoding='utf-8')
+                rejected.write('{}\t{}\n'.format(line, error))
+                if rejectmax is not None and stats['rejected'] > rejectmax:
+                    raise Exception('rejected records exceed rejectmax {}, last one: {}'.format(rejectmax, error))
+                continue
+            writer.writerow(values)
+            stats['rows'] += 1
+            if buffer.tell() >= block_size:
+                send(buffer.getvalue().encode('utf-8'))
+                buffer.seek(0)
+                buffer.truncate()
+        if buffer.tell():
+            send(buffer.getvalue().encode('utf-8'))
+    finally:
+        if rejected:
+            rejected.close()
+    return stats
+
+
+def _normalize_process(send, file_name, file_range, options, rejected_file):
+    if file_range:
+        source = FileRange(file_name, *file_range)
+    else:
+        source = open_copy_source(file_name, use_mmap=False)
+    try:
+        return normalize(source, send, options, rejected_file,
+                         skip_header=options.get('skip_header', False) and not (file_range and file_range[0]))
+    finally:
+        source.close()
+
+
+class NormalizedSource(PipeSource):
+    """
+    Source of COPY FROM STDIN - records of the file (or its byte range) normalized in a separate process
+    (see normalize and PipeSource)
+    """
+
+    def __init__(self, file_name, file_range, options, rejected_file):
+        super(NormalizedSource, self).__init__(_normalize_process, [file_name, file_range, options, rejected_file],
+                                               'Normalization of {}'.format(file_name))
@@ -8,20 +8,78 @@ from threading import Thread
 from queue import Queue, Empty
 import os
 import re
-from threading import Event
-from vertica import VerticaConnection, VerticaUtils
+import sys
+import signal
+from threading import Event, Lock, BoundedSemaphore
+from vertica import VerticaConnection, VerticaConnectionPool, VerticaUtils, is_compressed, open_copy_source
+from fake_vertica import FakeVerticaConnection
+from scheduler import DagScheduler, get_writers, get_tables
+from result_cache import ResultCache, get_table_versions
+from metrics import MetricsWriter, STAGES
+from profiler import Profiler
+from concurrency import AdaptiveLimiter
+from history import DurationHistory
+from journal import RunJournal
+from cancellation import Watchdog
+from result_writers import get_result_writer_class
+from server import create_server
+from loader import split_file, get_enclosed, get_delimiter, get_rejectmax, get_chunk_statement, merge_files, FileRange, \
+    get_rejected_files, get_rejections_table_statement, write_rejections
+from normalizer import NormalizedSource, get_normalized_statement
+from generator import GeneratedSource, get_generator_options, write_file
+from reference import ReferenceEngine, diff_results
 from pathlib import Path
+from functools import partial
+from contextlib import nullcontext
+import benchmark
 
 
 def parse_args():
     parser = argparse.ArgumentParser(conflict_handler="resolve")
+    parser.add_argument('command', nargs='?', choices=['run', 'benchmark', 'serve', 'generate', 'diff'],
+                        default='run',
+                        help='run - execute the pipeline (default), benchmark - execute the pipeline '
+                             'benchmark/iterations times and report latency percentiles, throughput and peak RSS, '
+                             'serve - keep running and execute phases requested over HTTP (serve in config file), '
+                             'generate - write synthetic input files (generator in config file), '
+                             'diff - compare report results of hosts with results of reference backend')
     parser.add_argument('-c', '--config',
                         default='pex_test_solution.yaml',
                         help='YAML config file with static configuration, default pex_test_solution.yaml')
-    parser.add_argument('-p', '--parallel', help='Override parallel from config file')
+    parser.add_argument('-p', '--parallel',
+                        help='Override parallel from config file, auto - adapt number of workers of each phase '
+                             'to its resource pool (execution/adaptive_concurrency in config file)')
     parser.add_argument('-ph', '--phase', help='Start from this phase. Check the config file for phase names.')
     parser.add_argument('-s', '--skip-init-db', action='store_const', default=False, const=True,
                         help='Skip init (recreate) DB (schema). Valuable, when you skip phases.')
+    parser.add_argument('-i', '--incremental', action='store_const', default=False, const=True,
+                        help='Execute incremental_pipeline from config file - load only data newer than high water '
+                             'marks and merge them into existing tables. Schema is not recreated.')
+    parser.add_argument('--parallel-hosts', type=int,
+                        help='Override execution/parallel_hosts from config file, 0 means all hosts concurrently')
+    parser.add_argument('--scheduler', choices=['phase', 'dag'],
+                        help='Override execution/scheduler from config file. phase - phases are executed one by one, '
+                             'dag - statements are executed as soon as their dependencies finish')
+    parser.add_argument('--no-result-cache', action='store_const', default=False, const=True,
+                        help='Do not use result cache of SELECTs (results/cache in config file)')
+    parser.add_argument('--backend', choices=['vertica', 'fake', 'reference'],
+                        help='Override database/backend from config file. fake - no database is needed, '
+                             'statements only simulate latency and result size (database/fake in config file), '
+                             'reference - outputs are computed locally from input files (database/reference)')
+    parser.add_argument('--iterations', type=int, help='Override benchmark/iterations from config file')
+    parser.add_argument('--baseline', help='Compare benchmark with baseline JSON file, fail on regressions')
+    parser.add_argument('--save-baseline', help='Store benchmark summary as baseline JSON file')
+    parser.add_argument('--profile', action='store_const', default=False, const=True,
+                        help='Capture server-side profile of slow queries (profiling in config file)')
+    parser.add_argument('--profile-threshold', type=int,
+                        help='Override profiling/threshold_ms from config file, implies --profile')
+    parser.add_argument('-r', '--resume', action='store_const', default=False, const=True,
+                        help='Resume failed run - skip statements, which succeeded according to the run journal '
+                             '(execution/journal in config file), implies --skip-init-db')
+    parser.add_argument('--listen', help='Override serve/listen from config file - host:port of localhost HTTP, '
+                                         'or path of Unix socket')
+    parser.add_argument('--videos', type=int, help='Override generator/videos from config file')
+    parser.add_argument('--days', type=int, help='Override generator/days from config file')
     parser.add_argument('-d', '--debug', action='store_const', default=False, const=True, help='Turn on debug')
     return parser.parse_args()
 
@@ -36,37 +94,51 @@ def get_datetime():
     return time.strftime("%d/%m/%Y %H:%M:%S")
 
 
+# Hosts are executed concurrently, output of threads must not interleave
+print_lock = Lock()
+
+
 def info(debug_msg):
-    print('{} - {}'.format(get_datetime(), debug_msg))
+    with print_lock:
+        print('{} - {}'.format(get_datetime(), debug_msg))
 
 
 def debug(debug_on, debug_msg):
     if debug_on:
-        print('{} - {}'.format(get_datetime(), debug_msg))
+        with print_lock:
+            print('{} - {}'.format(get_datetime(), debug_msg))
 
 
-def get_line(line, value):
-    if not line:
-        return value
-    else:
-        return ',{}'.format(value)
+def format_stats(stats):
+    return ' '.join('{}={}'.format(key, value) for key, value in stats.items())
 
 
 def print_separator():
     print(60 * "-")
 
 
-def get_conn(config, host):
+def get_conn(config, host, schema_name='public', pool_name='general'):
     conn_info = {'host': host,
                  'port': config['port'],
                  'user': config['user'],
                  'password': config['password'],
                  'dbname': config['dbname'],
                  'timeout': config['timeout']}
-    conn = VerticaConnection(conn_info, host)
+    if config.get('backend', 'vertica') == 'fake':
+        return FakeVerticaConnection(conn_info, host, schema_name, pool_name, config.get('fake', {}))
+    conn = VerticaConnection(conn_info, host, schema_name, pool_name)
     return conn
 
 
+def get_connection_pool(config):
+    pool_config = config.get('connection_pool', {})
+    return VerticaConnectionPool(
+        partial(get_conn, config),
+        max_idle=int(pool_config.get('max_idle', 8)),
+        health_check_interval=int(pool_config.get('health_check_interval', 30))
+    )
+
+
 def init_db(conn, config):
     utils = VerticaUtils(conn)
     utils.drop_schema_if_exists(config['schema_name'], cascade=True)
@@ -76,6 +148,16 @@ def init_db(conn, config):
         utils.create_resource_pool(pool['pool_name'], pool)
 
 
+def init_db_incremental(conn, config):
+    """
+    Incremental loads need data loaded by previous runs, create only what does not exist yet.
+    """
+    utils = VerticaUtils(conn)
+    utils.create_schema_if_not_exists(config['schema_name'])
+    for pool in config['resource_pools']:
+        utils.create_resource_pool_if_not_exists(pool['pool_name'], pool)
+
+
 def read_sql_file(file_path):
     with open(file_path) as fp:
         sql_text = fp.read()
@@ -83,6 +165,18 @@ def read_sql_file(file_path):
     return [q for q in re_queries.split(sql_text) if q]
 
 
+def get_sql_statements(phase, runtime):
+    """
+    Statements of the phase's SQL file, parsed once and kept until the file changes
+    """
+    file_name = phase['sql_file']
+    mtime = os.path.getmtime(file_name)
+    cached = runtime['sql_statements'].get(file_name)
+    if not cached or cached[0] != mtime:
+        cached = runtime['sql_statements'][file_name] = (mtime, read_sql_file(file_name))
+    return cached[1]
+
+
 def get_queue_cancel(cancel_event, process_queue, cancel_check_time=1):
     while not cancel_event.is_set():
         try:
@@ -107,111 +201,660 @@ def _execute_analyze_constraints(conn, table_name):
         raise Exception('analyze_constraints found issues, table={} first_issue={}'.format(table_name, result[0]))
 
 
-def _analyze_stats_constraints(conn, phase, config_database, action):
-    setup_connection(conn, config_database['schema_name'], phase['pool_name'])
-    for table_name in phase[action]:
-        _execute_analyze_statistics(conn, table_name)
-        _execute_analyze_constraints(conn, table_name)
+def analyze_table(conn, request):
+    if request['analyze_statistics']:
+        _execute_analyze_statistics(conn, request['table_name'])
+    if request['analyze_constraints']:
+        _execute_analyze_constraints(conn, request['table_name'])
+
+
+def _get_copy_chunks(phase, file_name):
+    """
+    Number of concurrent COPY streams for the file - phase/copy_chunks, but each chunk has at least
+    phase/copy_chunk_min_size bytes. Compressed files can't be split.
+    """
+    if is_compressed(file_name):
+        return 1
+    chunks = int(phase.get('copy_chunks', 1))
+    min_size = int(phase.get('copy_chunk_min_size', 64 * 1024**2))
+    return max(1, min(chunks, os.path.getsize(file_name) // max(min_size, 1)))
+
+
+def _get_copy_buffer_size(request):
+    """
+    Buffer size of COPY statement - phase/copy_options/<label>/buffer_size, default phase/copy_buffer_size
+    """
+    phase = request['phase']
+    copy_options = phase.get('copy_options', {}).get(request['query_name'], {})
+    return int(copy_options.get('buffer_size', phase.get('copy_buffer_size', 1024**2)))
+
+
+def _get_normalize_options(request, statement):
+    """
+    Options of client-side normalization of records (phase/copy_options/<label>/normalize), with format
+    of records expected by the COPY statement. None, if records are loaded as they are.
+    """
+    copy_options = request['phase'].get('copy_options', {}).get(request['query_name'], {})
+    normalize = copy_options.get('normalize')
+    if not normalize:
+        return None
+    return dict(
+        normalize,
+        delimiter=get_delimiter(statement),
+        quote=get_enclosed(statement),
+        rejectmax=normalize.get('rejectmax', get_rejectmax(statement)),
+        rejected_file=normalize.get('rejected_file', '{}_normalize_rej.txt'.format(request['query_name']))
+    )
+
+
+def _execute_copy_chunk(conn, request, statement, file_name, file_range, index, normalize=None,
+                        rejections_table=None):
+    """
+    :param file_range: byte range of the file, None for the whole file
+    :param normalize: normalization options, see _get_normalize_options
+    :param rejections_table: records are rejected into this table instead of files, see _export_rejections
+    :return: normalization statistics (rows, rejected), None if records are loaded as they are
+    :rtype: dict
+    """
+    buffer_size = _get_copy_buffer_size(request)
+    if rejections_table:
+        statement = get_rejections_table_statement(statement, rejections_table)
+    if file_range:
+        statement = get_chunk_statement(statement, index)
+    if normalize:
+        rejected_file = '{}.{}'.format(normalize['rejected_file'], index)
+        with NormalizedSource(file_name, file_range, normalize, rejected_file) as fh:
+            conn.exec_copy_fh(statement, fh, buffer_size)
+            return fh.stats
+    if file_range:
+        with FileRange(file_name, *file_range) as fh:
+            conn.exec_copy_fh(statement, fh, buffer_size)
+    else:
+        conn.exec_copy(statement, file_name, buffer_size)
+    return None
+
+
+def _execute_generated_copy_chunk(conn, request, statement, kind, options, index, chunks, rejections_table=None):
+    """
+    Load generated records of the chunk, see GeneratedSource
+
+    :param rejections_table: records are rejected into this table instead of files, see _export_rejections
+    :return: generator statistics (rows, malformed, bytes)
+    :rtype: dict
+    """
+    if rejections_table:
+        statement = get_rejections_table_statement(statement, rejections_table)
+    if chunks > 1:
+        statement = get_chunk_statement(statement, index)
+    with GeneratedSource(kind, options, index, chunks) as fh:
+        conn.exec_copy_fh(statement, fh, _get_copy_buffer_size(request))
+        return fh.stats
 
 
-def analyze_stats_constraints(conn, phase, config_database):
-    if 'analyze_tables' in phase:
-        _analyze_stats_constraints(conn, phase, config_database, 'analyze_tables')
-    if 'analyze_constraints' in phase:
-        _analyze_stats_constraints(conn, phase, config_database, 'analyze_constraints')
+def _export_rejections(conn, request, table, index):
+    """
+    Records rejected by a chunk loaded on another node are stored in the table, export them into rejected data /
+    exceptions files of the chunk on this host, so they are merged with files of other chunks.
+    """
+    rejected_file, exception_file = get_rejected_files(request['sql_statement'])
+    rows = conn.exec_default('select rejected_data, rejected_reason from {} order by batch_number, row_number'.format(
+        table))
+    write_rejections(
+        rows,
+        '{}.{}'.format(rejected_file, index) if rejected_file else None,
+        '{}.{}'.format(exception_file, index) if exception_file else None
+    )
+    conn.exec_noresult('drop table if exists {}'.format(table))
+
+
+def _execute_copy_chunk_thread(request, runtime, execute_chunk, index, deadline, errors, stats):
+    phase = request['phase']
+    copy_hosts = phase.get('copy_hosts') or [request['host']]
+    # Spread chunks across cluster nodes
+    host = copy_hosts[index % len(copy_hosts)]
+    # Files rejected on another node would be written there, records are rejected into a table instead
+    rejections_table = '{}_rej_{}'.format(request['query_name'], index) if host != request['host'] else None
+    # Session is tracked by watchdog as a copy of the request, interrupt is propagated to the request
+    chunk_request = dict(request)
+    try:
+        with runtime['conn_pool'].session(host, request['config_database']['schema_name'],
+                                          phase['pool_name']) as conn:
+            runtime['watchdog'].register(chunk_request, conn, deadline)
+            try:
+                if rejections_table:
+                    # Rejections of previous run
+                    conn.exec_noresult('drop table if exists {}'.format(rejections_table))
+                stats.append(execute_chunk(conn, index, rejections_table))
+            finally:
+                runtime['watchdog'].unregister(chunk_request)
+                if rejections_table and not conn.broken:
+                    _export_rejections(conn, request, rejections_table, index)
+    except Exception as e:
+        errors.append('chunk {}: {}'.format(index, e))
+    if chunk_request.get('interrupted'):
+        request.setdefault('interrupted', chunk_request['interrupted'])
+
+
+def _execute_copy_chunks(conn, request, runtime, execute_chunk, chunks):
+    """
+    Load chunks over concurrent COPY streams. First chunk is loaded by the current session,
+    each other one by a pooled session (optionally on another node, see phase/copy_hosts).
+    Sessions of the other chunks are interrupted by watchdog with the current one (deadline, cancelled run).
+    Each chunk is committed separately, rejectmax applies to each chunk.
+
+    :param execute_chunk: function(conn, index, rejections_table) loading the chunk, returns its statistics
+    :return: statistics of chunks
+    :rtype: list
+    """
+    errors = []
+    stats = []
+    threads = []
+    deadline = get_deadline(request, runtime)
+    for index in range(1, chunks):
+        thread = Thread(
+            target=_execute_copy_chunk_thread,
+            args=[request, runtime, execute_chunk, index, deadline, errors, stats]
+        )
+        thread.start()
+        threads.append(thread)
+    try:
+        stats.append(execute_chunk(conn, 0))
+    finally:
+        for thread in threads:
+            thread.join()
+    if errors:
+        raise Exception('Copy of {} chunks failed: {}'.format(len(errors), '; '.join(errors)))
+    return stats
 
 
-def _execute_copy(conn, statement):
+def _execute_copy(conn, request, runtime):
     """
     This is hacky way, how to workaround missing COPY LOCAL in vertica-python driver.
+    Large files are split at record boundaries and loaded over more concurrent streams, see phase/copy_chunks.
+    Records can be normalized on the client (phase/copy_options/<label>/normalize), each stream then reads
+    from its own normalizer process and COPY loads plain list of columns, see NormalizedSource.
+    Instead of the file, generated records can be loaded (phase/copy_options/<label>/generate), see GeneratedSource.
 
     :param conn: DB connection
-    :param statement: COPY statement to be executed
-    :return:
+    :param request: request containing COPY statement to be executed
+    :param runtime: runtime providing pooled sessions for additional streams (tracked by its watchdog)
+        and options of generated records
+    :return: size of loaded file (bytes)
+    :rtype: dict
     """
     re_from = re.compile(r'from\s+local\s+\'([^\']+)\'', re.I | re.M)
     re_exception = re.compile(r'exceptions\s+\'([^\']+)\'', re.I | re.M)
+    re_rejected = re.compile(r'rejected\s+data\s+\'([^\']+)\'', re.I | re.M)
+    statement = request['sql_statement']
     file_name = re_from.search(statement).group(1)
     statement = re_from.sub('from stdin', statement) + ';'
     exception_file = re_exception.search(statement).group(1)
-    conn.exec_copy(statement, file_name)
+    copy_options = request['phase'].get('copy_options', {}).get(request['query_name'], {})
+    generate = copy_options.get('generate')
+    normalize = None if generate else _get_normalize_options(request, statement)
+    if normalize:
+        statement = get_normalized_statement(statement, normalize['columns'])
+        # Rejected records of previous run
+        if os.path.isfile(normalize['rejected_file']):
+            os.remove(normalize['rejected_file'])
+    if generate:
+        # Generated records of each chunk are produced by its own process
+        chunks = max(1, int(request['phase'].get('copy_chunks', 1)))
+
+        def execute_chunk(chunk_conn, index, rejections_table=None):
+            return _execute_generated_copy_chunk(chunk_conn, request, statement, generate, runtime['generator'],
+                                                 index, chunks, rejections_table)
+    else:
+        chunks = _get_copy_chunks(request['phase'], file_name)
+        file_ranges = split_file(file_name, chunks, get_enclosed(statement)) if chunks > 1 else []
+        # Whole file is loaded as it is, if it can't be split
+        if len(file_ranges) < 2:
+            file_ranges = [None]
+        chunks = len(file_ranges)
+
+        def execute_chunk(chunk_conn, index, rejections_table=None):
+            return _execute_copy_chunk(chunk_conn, request, statement, file_name, file_ranges[index], index,
+                                       normalize, rejections_table)
+    try:
+        if chunks > 1:
+            stats = _execute_copy_chunks(conn, request, runtime, execute_chunk, chunks)
+        else:
+            stats = [execute_chunk(conn, 0)]
+    finally:
+        if chunks > 1:
+            merge_files(exception_file, chunks)
+            rejected = re_rejected.search(statement)
+            if rejected:
+                merge_files(rejected.group(1), chunks)
+        if normalize:
+            merge_files(normalize['rejected_file'], chunks)
     if os.path.isfile(exception_file):
         with open(exception_file) as fp:
             raise Exception(
                 "Copy failed with exceptions, first exception: {}\nstatement: {}".format(
                     fp.readline(), statement))
+    if generate:
+        result = {key: sum(s[key] for s in stats) for key in ('rows', 'malformed', 'bytes')}
+        info('host={} query_name="{}" generated {} rows={} malformed={} bytes={}'.format(
+            request['host'], request['query_name'], generate, result['rows'], result['malformed'], result['bytes']))
+        return result
+    result = {'bytes': os.path.getsize(file_name)}
+    if normalize:
+        result['rows'] = sum(s['rows'] for s in stats)
+        result['normalize_rejected'] = sum(s['rejected'] for s in stats)
+        info('host={} query_name="{}" normalized rows={} rejected={}'.format(
+            request['host'], request['query_name'], result['rows'], result['normalize_rejected']))
+    return result
 
 
-def _exec_select(conn, statement):
-    result = conn.exec_default(statement)
-    header = False
-    lines = []
-    for row in result:
-        if not header:
-            header_line = ''
-            for col_name in row.keys():
-                header_line += get_line(header_line, col_name)
-            lines.append(header_line)
-            header = True
-        line = ''
-        for col_value in row.values():
-            line += get_line(line, str(col_value))
-        lines.append(line)
-    return lines
-
-
-def execute_query(conn, request):
-    statement = request['sql_statement']
+def _get_partition_keys(conn, partition_refresh):
+    """
+    Partition keys to refresh (first column of phase/partition_refresh/keys_sql) as SQL literals, in order
+    """
+    rows = conn.exec_default(partition_refresh['keys_sql'])
+    keys = sorted({next(iter(row.values())) for row in rows if next(iter(row.values())) is not None})
+    return ["'{}'".format(key) for key in keys]
+
+
+def _execute_partitions(conn, request, statement, keys, errors):
+    """
+    Execute statement for partition keys taken from the queue, each partition is committed separately.
+    Stops, when the queue is empty, the request is interrupted or any partition failed.
+    """
+    while not errors and not request.get('interrupted'):
+        try:
+            key = keys.get_nowait()
+        except Empty:
+            return
+        # Profile of the request (see Profiler.capture) is taken from the last partition executed in its session
+        request['partition_key'] = key
+        try:
+            conn.exec_noresult(statement.replace(':partition_key', key))
+            conn.exec_noresult('commit;')
+        except Exception as e:
+            errors.append('partition {}: {}'.format(key, e))
+
+
+def _try_acquire_session_slot(request, runtime):
+    """
+    Slot of an additional session of the request - from adaptive limiter of the phase (or session slots
+    of the phase, see set_limiter) and from global cap of concurrently executed statements. Slot is taken
+    without waiting, the request already holds its own slot and waiting for another one could deadlock.
+
+    :return: function releasing the slot, None if there is no free slot
+    """
+    key = (request['host'], request['phase']['name'])
+    gates = [gate for gate in (runtime['limiters'].get(key) or runtime['session_slots'].get(key),
+                               runtime['worker_slots']) if gate is not None and not isinstance(gate, nullcontext)]
+    acquired = []
+    for gate in gates:
+        if not gate.acquire(blocking=False):
+            break
+        acquired.append(gate)
+    if len(acquired) < len(gates):
+        for gate in acquired:
+            gate.release()
+        return None
+
+    def release():
+        for acquired_gate in acquired:
+            acquired_gate.release()
+    return release
+
+
+def _execute_partitions_thread(request, runtime, statement, keys, deadline, errors, release_slot):
     phase = request['phase']
-    query_type = phase['query_type']
-    result = []
-    if query_type == 'dml':
+    # Session is tracked by watchdog as a copy of the request, interrupt is propagated to the request
+    partition_request = dict(request)
+    try:
+        with runtime['conn_pool'].session(request['host'], request['config_database']['schema_name'],
+                                          phase['pool_name']) as conn:
+            runtime['watchdog'].register(partition_request, conn, deadline)
+            try:
+                _execute_partitions(conn, partition_request, statement, keys, errors)
+            finally:
+                runtime['watchdog'].unregister(partition_request)
+    except Exception as e:
+        errors.append(str(e))
+    finally:
+        release_slot()
+    if partition_request.get('interrupted'):
+        request.setdefault('interrupted', partition_request['interrupted'])
+
+
+def _execute_partition_refresh(conn, request, runtime):
+    """
+    Refresh target table of INSERT statement by partitions (phase/partition_refresh). The statement is executed
+    for each partition key returned by keys_sql (:partition_key in the statement) into staging table
+    (staging_prefix + target) over up to parallel concurrent sessions. Staging table holds the other partitions
+    of the refreshed range too (copied from the target, metadata only), so the whole range is swapped
+    into the target by one SWAP_PARTITIONS_BETWEEN_TABLES - readers never see partially refreshed table.
+
+    :return: number of refreshed partitions
+    :rtype: dict
+    """
+    partition_refresh = request['phase']['partition_refresh']
+    writes = get_tables(request['sql_statement'])[1]
+    if len(writes) != 1:
+        raise Exception('partition refresh requires statement writing one table, writes {}'.format(writes))
+    target = writes.pop()
+    staging = '{}{}'.format(partition_refresh.get('staging_prefix', 'stg_'), target)
+    statement = re.sub(r'(\binto\s+){}\b'.format(re.escape(target)), r'\g<1>{}'.format(staging),
+                       request['sql_statement'], flags=re.I)
+    label = request['query_name']
+    keys = _get_partition_keys(conn, partition_refresh)
+    if not keys:
+        return {'partitions': 0}
+    min_key, max_key = keys[0], keys[-1]
+    conn.exec_noresult('truncate table {}'.format(staging))
+    conn.exec_default("select /*+ label({}_copy_partitions) */ copy_partitions_to_table('{}', {}, {}, '{}')".format(
+        label, target, min_key, max_key, staging))
+    for key in keys:
+        conn.exec_default("select /*+ label({}_drop_partitions) */ drop_partitions('{}', {}, {})".format(
+            label, staging, key, key))
+
+    key_queue = Queue()
+    for key in keys:
+        key_queue.put(key)
+    errors = []
+    deadline = get_deadline(request, runtime)
+    threads = []
+    # One session per partition, up to phase/partition_refresh/parallel, the first one is the current session.
+    # Additional sessions take free slots of the phase (resource pool concurrency), partitions are refreshed
+    # by fewer sessions, if there are not enough of them
+    for _ in range(min(int(partition_refresh.get('parallel', 1)), len(keys)) - 1):
+        release_slot = _try_acquire_session_slot(request, runtime)
+        if not release_slot:
+            break
+        thread = Thread(target=_execute_partitions_thread,
+                        args=[request, runtime, statement, key_queue, deadline, errors, release_slot])
+        thread.start()
+        threads.append(thread)
+    try:
+        _execute_partitions(conn, request, statement, key_queue, errors)
+    finally:
+        for thread in threads:
+            thread.join()
+    if errors:
+        raise Exception('Refresh of {} partitions failed: {}'.format(len(errors), '; '.join(errors)))
+    if request.get('interrupted'):
+        raise Exception('Refresh of partitions was interrupted')
+
+    conn.exec_default("select /*+ label({}_swap_partitions) */ swap_partitions_between_tables('{}', {}, {}, '{}')"
+                      .format(label, staging, min_key, max_key, target))
+    # Staging table holds previous version of the partitions now
+    conn.exec_noresult('truncate table {}'.format(staging))
+    info('host={} query_name="{}" refreshed partitions={} range={}..{}'.format(
+        request['host'], label, len(keys), min_key, max_key))
+    return {'partitions': len(keys)}
+
+
+def _exec_select(conn, request, result_cache, timings):
+    """
+    Stream result of SELECT into result file (csv, arrow or parquet, see results/format), batch by batch
+    as it is fetched. Batches are fetched by columns, typed formats get column types from cursor description.
+    Result is written into temporary file first, so partial results never replace complete ones.
+    If result cache is enabled, result is served from the cache, if none of the tables the query reads changed.
+    Time spent in execute, first_row (wait for first batch), fetch (all batches) and serialize is added to timings.
+
+    :return: result file name, number of rows and bytes written
+    :rtype: dict
+    """
+    config_results = request['config_results']
+    writer_class = get_result_writer_class(config_results.get('format'))
+    compression = config_results.get('compression')
+    result_file_name = Path(config_results['host_directory']) / '{}{}'.format(request['query_name'],
+                                                                               writer_class.extension)
+    cache_key = None
+    if result_cache:
+        table_versions = get_table_versions(conn, get_tables(request['sql_statement'])[0])
+        # Queries not reading any table can't be versioned, they are not cached
+        if table_versions:
+            cache_key = result_cache.get_key(request['host'], request['sql_statement'], table_versions,
+                                             suffix='{}:{}'.format(writer_class.extension, compression or ''))
+        cached = cache_key and result_cache.get(cache_key, result_file_name)
+        if cached:
+            return {'file_name': result_file_name, 'rows': cached['rows'], 'bytes': cached['bytes'], 'cached': True}
+    tmp_file_name = Path('{}.tmp'.format(result_file_name))
+    batch_size = int(config_results.get('fetch_batch_size', 10000))
+    execute_start = time.time()
+    schema, batches = conn.exec_columnar(request['sql_statement'], batch_size)
+    fetch_start = time.time()
+    timings['execute'] = fetch_start - execute_start
+    timings['fetch'] = timings['serialize'] = 0
+    rows = 0
+    writer = writer_class(tmp_file_name, schema, compression)
+    try:
+        for batch in batches:
+            fetch_end = time.time()
+            timings['fetch'] += fetch_end - fetch_start
+            timings.setdefault('first_row', timings['fetch'])
+            writer.write(batch)
+            rows += len(batch)
+            fetch_start = time.time()
+            timings['serialize'] += fetch_start - fetch_end
+        # The last (empty) fetch
+        timings['fetch'] += time.time() - fetch_start
+        timings.setdefault('first_row', timings['fetch'])
+    finally:
+        size = writer.close()
+    os.replace(tmp_file_name, result_file_name)
+    if cache_key:
+        result_cache.put(cache_key, result_file_name, {'rows': rows, 'bytes': size})
+    return {'file_name': result_file_name, 'rows': rows, 'bytes': size}
+
+
+def _execute_batch(conn, request):
+    """
+    Execute statements of batch request in one round trip. DML statements are followed by commit,
+    as when they are executed alone. Each statement gets its own status, error and approximate execute time
+    (see VerticaConnection.exec_batch).
+    The server skips statements following a failed one, they are sent again in the next round trip.
+
+    :return: number of round trips
+    :rtype: dict
+    """
+    statements = request['statements']
+    position = 0
+    round_trips = 0
+    # Interrupted batch (deadline, cancelled run) is not sent again
+    while position < len(statements) and not request.get('interrupted'):
+        parts = []
+        for statement in statements[position:]:
+            parts.append(statement['sql_statement'])
+            if statement['query_type'] == 'dml':
+                parts.append('commit')
+        start = time.time()
+        durations, error = conn.exec_batch(parts)
+        round_trips += 1
+        for statement in statements[position:]:
+            count = 2 if statement['query_type'] == 'dml' else 1
+            statement_durations, durations = durations[:count], durations[count:]
+            statement['start_time'] = start
+            start += sum(statement_durations)
+            statement['end_time'] = start
+            statement['timings'] = {'execute': sum(statement_durations)}
+            statement['result'] = {}
+            position += 1
+            if len(statement_durations) == count:
+                statement.update({'status': 'ok', 'error': ''})
+                continue
+            statement.update({'status': 'error', 'error': str(error or 'Statement was not executed')})
+            break
+    failed = [statement['query_name'] for statement in statements if statement.get('status') == 'error']
+    if failed:
+        raise Exception('Failed statements of the batch: {}'.format(', '.join(failed)))
+    return {'round_trips': round_trips}
+
+
+def finish_batch(request):
+    """
+    Complete statements of finished batch request. Statements, which were not executed, get status
+    of the batch. Stages shared by the statements (queued, connect, setup) are attributed to the first one.
+    """
+    for i, statement in enumerate(request['statements']):
+        if 'status' not in statement:
+            statement.update({'status': request['status'], 'error': request['error'], 'result': {},
+                              'start_time': request['start_time'], 'end_time': request['end_time'], 'timings': {}})
+        timings = {stage: round(duration * 1000, 1) for stage, duration in statement['timings'].items()}
+        if i == 0:
+            statement['start_time'] = request['start_time']
+            timings = dict(request['timings'], execute=timings.get('execute', 0))
+        statement['timings'] = {stage: timings[stage] for stage in STAGES if stage in timings}
+        statement['duration'] = int((statement['end_time'] - statement['start_time']) * 1000)
+        # Durations of batched statements are approximate, they are not recorded into history
+        statement['batched'] = True
+
+
+def execute_query(conn, request, runtime, timings):
+    statement = request['sql_statement']
+    query_type = request['query_type']
+    result = {}
+    start = time.time()
+    # Partially written targets of resumed run, see RunJournal.plan
+    for table_name in request.get('truncate_tables', []):
+        conn.exec_noresult('truncate table {}'.format(table_name))
+    if query_type == 'analyze':
+        analyze_table(conn, request)
+    elif query_type == 'dml' and request['phase'].get('partition_refresh'):
+        result = _execute_partition_refresh(conn, request, runtime)
+    elif query_type == 'dml':
         conn.exec_noresult(statement)
         conn.exec_noresult('commit;')
     elif query_type == 'ddl':
         conn.exec_noresult(statement)
+    elif query_type == 'batch':
+        result = _execute_batch(conn, request)
     elif query_type == 'load':
-        _execute_copy(conn, statement)
+        result = _execute_copy(conn, request, runtime)
     elif query_type == 'select':
-        result = _exec_select(conn, statement)
+        result = _exec_select(conn, request, runtime['result_cache'], timings)
+    # SELECTs break execution down into more stages
+    timings.setdefault('execute', time.time() - start)
 
     return result
 
 
-def setup_connection(conn, schema_name, pool_name):
-    conn.exec_noresult('set search_path to {}'.format(schema_name))
-    conn.exec_noresult('set resource_pool to {}'.format(pool_name))
+def get_session_timings(conn, acquire_start, acquire_end):
+    """
+    Time of session acquisition split into connect (handshake of new session, health check of reused one)
+    and setup (SETs of new session)
+    """
+    setup = conn.setup_duration if conn.opened_at >= acquire_start else 0.0
+    return {'connect': acquire_end - acquire_start - setup, 'setup': setup}
 
 
-def execute_queries_thread(request_queue, report_queue, cancel_event, args):
+def capture_profile(conn, request, profiler):
+    """
+    Capture server-side profile of slow query. Failure to capture the profile does not fail the query.
+    """
+    try:
+        profile = profiler.capture(conn, request)
+    except Exception as e:
+        profile = {'error': str(e)}
+    if profile.get('error'):
+        info('host={} query_name="{}" profile error={}'.format(request['host'], request['query_name'],
+                                                             profile['error']))
+    else:
+        info('host={} query_name="{}" profile={} top_operators {}'.format(
+            request['host'], request['query_name'], profile['file_name'],
+            ', '.join('{operator_name}({path_id})={execution_time_us}us'.format(**operator)
+                      for operator in profile['top_operators'][:3])))
+    return profile
+
+
+def get_deadline(request, runtime):
+    """
+    Deadline of the request (epoch seconds), which starts now - the earlier of query deadline
+    (phase/query_timeouts/<label>, phase/query_timeout or execution/query_timeout seconds) and phase deadline.
+
+    :return: deadline, None if there is none
+    """
+    phase = request['phase']
+    timeout = phase.get('query_timeouts', {}).get(request['query_name'],
+                                                  phase.get('query_timeout', runtime['query_timeout']))
+    deadlines = [d for d in (request.get('phase_deadline'), time.time() + float(timeout) if timeout else None)
+                 if d is not None]
+    return min(deadlines) if deadlines else None
+
+
+def execute_queries_thread(request_queue, report_queue, cancel_event, args, runtime):
     while not cancel_event.is_set():
         request = get_queue_cancel(cancel_event, request_queue)
         if not request:
             continue
         start = time.time()
-        result = []
+        request['start_time'] = start
+        end = None
+        result = {}
+        timings = {}
+        limiter = runtime['limiters'].get((request['host'], request['phase']['name']))
+        # Batch request is journaled and measured by its statements
+        statements = request.get('statements', [request])
+        if runtime['journal']:
+            for statement in statements:
+                runtime['journal'].start(statement)
         try:
-            conn = get_conn(request['config_database'], request['host'])
-            setup_connection(conn, request['config_database']['schema_name'], request['phase']['pool_name'])
-
-            result = execute_query(conn, request)
+            # Adaptive concurrency of the phase, then global cap of concurrently executed statements across all hosts
+            if limiter:
+                limiter.acquire()
+            with runtime['worker_slots']:
+                acquire_start = time.time()
+                timings['queued'] = acquire_start - request.get('queued_at', start)
+                # Pooled sessions already have search_path and resource_pool set
+                with runtime['conn_pool'].session(request['host'],
+                                                  request['config_database']['schema_name'],
+                                                  request['phase']['pool_name']) as conn:
+                    timings.update(get_session_timings(conn, acquire_start, time.time()))
+                    if runtime['shutdown'].is_set():
+                        raise Exception('Cancelled')
+                    deadline = get_deadline(request, runtime)
+                    if deadline is not None and deadline <= time.time():
+                        raise Exception('Deadline of phase {} exceeded before start'.format(request['phase']['name']))
+                    # Watchdog interrupts the statement on the server, when deadline passes or run is cancelled
+                    runtime['watchdog'].register(request, conn, deadline)
+                    try:
+                        result = execute_query(conn, request, runtime, timings)
+                    finally:
+                        runtime['watchdog'].unregister(request)
+                    end = time.time()
+                    if limiter:
+                        limiter.observe(conn, timings['execute'])
+                    # Profile is captured in the same session, its duration is not included. Statement is slow
+                    # by its execution (fetch of SELECT result), waits for a worker slot and a session do not count
+                    if (runtime['profiler'] and not result.get('cached')
+                            and runtime['profiler'].is_slow(request, timings['execute'] + timings.get('fetch', 0))):
+                        result['profile'] = capture_profile(conn, request, runtime['profiler'])
 
             request['status'] = 'ok'
             request['error'] = ''
         except Exception as e:
             request['error'] = str(e)
+            if request.get('interrupted'):
+                request['error'] = 'Interrupted, {}: {}'.format(request['interrupted'], e)
             request['status'] = 'error'
         finally:
-            request['duration'] = int((time.time() - start) * 1000)
+            if limiter:
+                limiter.release()
+            request['end_time'] = end or time.time()
+            request['duration'] = int((request['end_time'] - start) * 1000)
             request['result'] = result
-            debug(args.debug, 'query_name="{}" status={} duration={} result_size={} error={}'.format(
+            request['timings'] = {stage: round(timings[stage] * 1000, 1) for stage in STAGES if stage in timings}
+            if request['query_type'] == 'batch':
+                finish_batch(request)
+            for statement in statements:
+                if runtime['metrics']:
+                    runtime['metrics'].record(statement)
+                if runtime['journal']:
+                    runtime['journal'].finish(statement)
+            debug(args.debug, 'query_name="{}" status={} duration={} result_rows={} error={}'.format(
                 request['query_name'], request['status'],
-                request['duration'], len(request['result']), request['error']))
+                request['duration'], request['result'].get('rows', 0), request['error']))
             report_queue.put(request)
             request_queue.task_done()
 
 
-def populate_request(request_queue, sql_statement, host, phase, config_database):
+def create_request(sql_statement, host, phase, config_database, config_results):
     re_label = re.compile(r'label\(([^)]+)\)', re.I)
     re_hint_remove = re.compile(r'/\*\+[^*]+\*/', re.I)
     label_groups = re_label.search(sql_statement)
@@ -226,21 +869,131 @@ def populate_request(request_queue, sql_statement, host, phase, config_database)
     elif phase['query_type'] == 'load':
         sql_statement = re_hint_remove.sub('', sql_statement)
         sql_statement += "\nSTREAM NAME '{}'".format(label)
-    request_queue.put({
+    return {
         'host': host,
         'query_name': label,
+        'query_type': phase['query_type'],
         'sql_statement': sql_statement,
         'phase': phase,
-        'config_database': config_database
-    })
+        'config_database': config_database,
+        'config_results': config_results
+    }
+
+
+def is_batchable(request):
+    """
+    Statements with their own deadline (phase/query_timeouts) or with tables to be truncated first (resumed run)
+    are executed alone
+    """
+    return (not request.get('resumed') and not request.get('truncate_tables')
+            and request['query_name'] not in request['phase'].get('query_timeouts', {}))
 
 
-def start_threads(request_queue, report_queue, cancel_event, parallelism, args):
+def create_batch_request(statements):
+    """
+    Request executing statements in one round trip, see _execute_batch.
+    For scheduling, it reads and writes tables of all its statements.
+    """
+    reads, writes = set(), set()
+    for statement in statements:
+        statement_reads, statement_writes = get_tables(statement['sql_statement'])
+        reads |= statement_reads
+        writes |= statement_writes
+    first = statements[0]
+    return {
+        'host': first['host'],
+        'query_name': '{}..{}'.format(first['query_name'], statements[-1]['query_name']),
+        'query_type': 'batch',
+        'sql_statement': '\n;\n'.join(statement['sql_statement'] for statement in statements),
+        'tables': (reads - writes, writes),
+        'statements': statements,
+        'phase': first['phase'],
+        'config_database': first['config_database'],
+        'config_results': first['config_results']
+    }
+
+
+def create_batches(requests, batch_size):
+    """
+    Group consecutive statements into batch requests of up to batch_size statements (phase/batch_size).
+
+    :return: list of batch requests and requests, which are not batched
+    :rtype: list
+    """
+    batched = []
+    group = []
+    for request in requests + [None]:
+        if request and is_batchable(request):
+            group.append(request)
+            if len(group) < batch_size:
+                continue
+            request = None
+        if len(group) > 1:
+            batched.append(create_batch_request(group))
+        else:
+            batched += group
+        group = []
+        if request:
+            batched.append(request)
+    return batched
+
+
+def get_statement_results(result):
+    """
+    Finished request as list of statement results - statements of batch request, the request itself otherwise.
+    Statements of batch, which did not start (skipped, cancelled), get status of the batch.
+    """
+    if result['query_type'] != 'batch':
+        return [result]
+    for statement in result['statements']:
+        if 'status' not in statement:
+            statement.update({'status': result['status'], 'error': result['error'], 'duration': 0, 'result': {}})
+    return result['statements']
+
+
+def create_analyze_requests(host, phase, config_database):
+    """
+    Table maintenance requests, one per table - statistics of tables listed in phase/analyze_tables
+    and constraints of tables listed in phase/analyze_constraints. They are executed by workers like statements.
+    DAG scheduler treats them as statements, which "write" the analyzed table,
+    so readers of the table wait for statistics.
+    """
+    analyze_tables = phase.get('analyze_tables', [])
+    analyze_constraints = phase.get('analyze_constraints', [])
+    requests = []
+    for table_name in analyze_tables + analyze_constraints:
+        if table_name in [r['table_name'] for r in requests]:
+            continue
+        requests.append({
+            'host': host,
+            'query_name': 'analyze_{}'.format(table_name),
+            'query_type': 'analyze',
+            'sql_statement': '',
+            'table_name': table_name,
+            'analyze_statistics': table_name in analyze_tables,
+            'analyze_constraints': table_name in analyze_constraints,
+            'tables': (set(), {table_name}),
+            'phase': phase,
+            'config_database': config_database
+        })
+    return requests
+
+
+def stop_threads(request_queue, cancel_event, workers):
+    cancel_event.set()
+    # Wake up idle workers, so they do not wait for the next cancel check
+    for _ in workers:
+        request_queue.put(None)
+    for worker in workers:
+        worker.join()
+
+
+def start_threads(request_queue, report_queue, cancel_event, parallelism, args, runtime):
     workers = []
     for i in range(parallelism):
         worker = Thread(
             target=execute_queries_thread,
-            args=[request_queue, report_queue, cancel_event, args]
+            args=[request_queue, report_queue, cancel_event, args, runtime]
         )
         worker.setDaemon(True)
         worker.start()
@@ -248,35 +1001,134 @@ def start_threads(request_queue, report_queue, cancel_event, parallelism, args):
     return workers
 
 
-def check_progress(report_queue, cancel_event, request_count):
+def create_phase_requests(host, phase, config_database, config_results, runtime, labels=None):
+    """
+    Requests of the phase - statements of its SQL file and analyze requests.
+    In resumed run, requests are marked by the journal (resumed or tables to be truncated).
+
+    :param labels: execute only statements (and analyze requests) with these labels, None means all
+    :return: tuple (statement requests, analyze requests)
+    :rtype: tuple(list, list)
+    """
+    requests = [create_request(sql_statement, host, phase, config_database, config_results)
+                for sql_statement in get_sql_statements(phase, runtime)]
+    analyze_requests = create_analyze_requests(host, phase, config_database)
+    if labels is not None:
+        requests = [r for r in requests if r['query_name'] in labels]
+        analyze_requests = [r for r in analyze_requests if r['query_name'] in labels]
+    # Phase deadline (phase/timeout seconds) starts now - with the phase, or with the whole DAG
+    if phase.get('timeout'):
+        phase_deadline = time.time() + float(phase['timeout'])
+        for request in requests + analyze_requests:
+            request['phase_deadline'] = phase_deadline
+    if runtime['journal']:
+        for request in requests + analyze_requests:
+            runtime['journal'].apply(request)
+    batch_size = int(phase.get('batch_size', 1))
+    if batch_size > 1 and phase['query_type'] in ('ddl', 'dml') and not phase.get('partition_refresh'):
+        requests = create_batches(requests, batch_size)
+    return requests, analyze_requests
+
+
+def check_progress(request_queue, report_queue, cancel_event, request_count, analyze_writers, on_result=None):
+    """
+    Wait for requests to finish. Analyze request of a table is queued as soon as all writers of the table finished.
+
+    :param analyze_writers: list of tuples (analyze request, set of ids of requests writing the table)
+    :param on_result: function called with each finished request, as soon as it finishes
+    """
     results = []
+    for analyze_request, writers in analyze_writers:
+        if not writers:
+            analyze_request['queued_at'] = time.time()
+            request_queue.put(analyze_request)
     for i in range(request_count):
-        results.append(get_queue_cancel(cancel_event, report_queue))
+        result = get_queue_cancel(cancel_event, report_queue)
+        # Cancelled
+        if not result:
+            continue
+        for statement_result in get_statement_results(result):
+            results.append(statement_result)
+            if on_result:
+                on_result(statement_result)
+        for analyze_request, writers in analyze_writers:
+            if id(result) in writers:
+                writers.remove(id(result))
+                if not writers:
+                    analyze_request['queued_at'] = time.time()
+                    request_queue.put(analyze_request)
     return results
 
 
-def execute_queries(conn, cancel_event, host, phase, config_database, args, parallelism):
+def execute_queries(cancel_event, host, phase, config_database, config_results, args, parallelism, runtime,
+                    labels=None, on_result=None):
     report_queue = Queue()
     request_queue = Queue()
     cancel_event.clear()
+    set_limiter(host, phase, config_database, args, runtime)
+
+    workers = start_threads(request_queue, report_queue, cancel_event, parallelism, args, runtime)
+    requests, analyze_requests = create_phase_requests(host, phase, config_database, config_results, runtime,
+                                                       labels)
+    # Requests succeeded in previous run are not executed again
+    resumed = [r for r in requests + analyze_requests if r.get('resumed')]
+    requests = [r for r in requests if not r.get('resumed')]
+    analyze_requests = [r for r in analyze_requests if not r.get('resumed')]
+    # Longest expected statements first, so none of them becomes the tail of the phase
+    if parallelism > 1 and runtime['history']:
+        requests = runtime['history'].order(requests)
+    for request in requests:
+        request['queued_at'] = time.time()
+        request_queue.put(request)
+
+    # Tables are analyzed by workers, each one as soon as its writers finish
+    analyze_writers = [(r, {id(w) for w in get_writers(requests, r['table_name'])}) for r in analyze_requests]
+
+    results = resumed + check_progress(request_queue, report_queue, cancel_event,
+                                       len(requests) + len(analyze_requests), analyze_writers, on_result)
+
+    stop_threads(request_queue, cancel_event, workers)
 
-    workers = start_threads(request_queue, report_queue, cancel_event, parallelism, args)
-    request_count = 0
-    for sql_statement in read_sql_file(phase['sql_file']):
-        populate_request(request_queue, sql_statement, host, phase, config_database)
-        request_count += 1
+    return results
 
-    results = check_progress(report_queue, cancel_event, request_count)
 
-    # After everything finished, we can finally analyze stats and constraints on required tables
-    analyze_stats_constraints(conn, phase, config_database)
+def execute_dag(cancel_event, host, phases, config_database, config_results, args, runtime):
+    """
+    Execute statements of all phases at once, each statement as soon as its dependencies
+    (and statistics of tables it reads) are ready. See DagScheduler.
+    """
+    report_queue = Queue()
+    request_queue = Queue()
+    cancel_event.clear()
 
-    cancel_event.set()
+    requests = []
+    parallelism = {}
+    for phase in phases:
+        parallelism[phase['name']] = get_parallelism(phase, args, runtime, config_database)
+        set_limiter(host, phase, config_database, args, runtime)
+        phase_requests, analyze_requests = create_phase_requests(host, phase, config_database, config_results,
+                                                                 runtime)
+        requests += phase_requests + analyze_requests
+    durations = None
+    if runtime['history']:
+        durations = [sum(runtime['history'].get(host, statement['query_name']) or 0
+                         for statement in request.get('statements', [request]))
+                     for request in requests]
+    scheduler = DagScheduler(requests, parallelism, durations)
+    for node, request in enumerate(requests):
+        debug(args.debug, 'host={} query_name="{}" depends_on={} priority={}'.format(
+            host, request['query_name'], scheduler.dependencies(node), scheduler.priority(node)))
 
-    for worker in workers:
-        worker.join()
+    worker_count = sum(parallelism.values())
+    if runtime['max_workers_per_host']:
+        worker_count = min(worker_count, runtime['max_workers_per_host'])
+    workers = start_threads(request_queue, report_queue, cancel_event, worker_count, args, runtime)
 
-    return results
+    results = scheduler.run(request_queue, report_queue, cancel_event)
+
+    stop_threads(request_queue, cancel_event, workers)
+
+    return [statement for result in results for statement in get_statement_results(result)]
 
 
 def create_dir(directory):
@@ -284,77 +1136,692 @@ def create_dir(directory):
         os.mkdir(directory)
 
 
-def report_results(results, result_dir):
+def report_results(results):
+    with print_lock:
+        _report_results(results)
+
+
+def _report_results(results):
     for result in results:
         print_separator()
         print('-- host: {}'.format(result['host']))
         print('-- phase: {}'.format(result['phase']['name']))
         print('-- query: {}'.format(result['query_name']))
         print('-- return status: {}'.format(result['status']))
+        if result['error']:
+            print('-- error: {}'.format(result['error']))
         print('-- duration: {}'.format(result['duration']))
+        if result.get('timings'):
+            print('-- timings: {}'.format(format_stats(result['timings'])))
+        if result.get('resumed'):
+            print('-- resumed: True')
+
+        if result['query_type'] == 'select' and result['status'] == 'ok' and result['result']:
+            print('-- result_file_name: {}'.format(result['result']['file_name']))
+            print('-- result_rows: {}'.format(result['result']['rows']))
+            print('-- result_bytes: {}'.format(result['result']['bytes']))
+            if result['result'].get('cached'):
+                print('-- result_cached: True')
+        if result['result'].get('profile', {}).get('file_name'):
+            print('-- profile: {}'.format(result['result']['profile']['file_name']))
+    print_separator()
+
+
+def get_phases(config, args):
+    phases = []
+    phase_continue = False
+    for phase in config['incremental_pipeline' if args.incremental else 'sql_pipeline']:
+        # Either phase is NOT required or current phase is the required one or any following one
+        if not args.phase or args.phase == phase['name'] or phase_continue:
+            phase_continue = True
+            phases.append(phase)
+    return phases
+
+
+def is_adaptive(phase, args):
+    return str(args.parallel or phase.get('parallel', 1)) == 'auto'
+
+
+def get_adaptive_limits(phase, config_database, runtime):
+    """
+    Initial, min and max number of concurrently executed statements of adaptive phase.
+    Initial is plannedconcurrency of the phase's resource pool, max is execution/adaptive_concurrency/max_workers
+    or maxconcurrency of the pool.
+    """
+    config_adaptive = runtime['adaptive_concurrency']
+    pool = next((p for p in config_database['resource_pools'] if p['pool_name'] == phase['pool_name']), {})
+    initial = int(pool.get('plannedconcurrency') or pool.get('maxconcurrency') or 1)
+    maximum = int(config_adaptive.get('max_workers', 0) or pool.get('maxconcurrency') or 2 * initial)
+    if runtime['max_workers_per_host']:
+        maximum = min(maximum, runtime['max_workers_per_host'])
+    return initial, int(config_adaptive.get('min_workers', 1)), maximum
 
-        if result['phase']['query_type'] == 'select':
-            result_file_name = Path(result_dir) / '{}.csv'.format(result['query_name'])
-            print('-- result_file_name: {}'.format(result_file_name))
-            with open(result_file_name, 'w') as fp:
-                for line in result['result']:
-                    fp.write('{}\n'.format(line))
+
+def get_parallelism(phase, args, runtime, config_database):
+    """
+    Number of workers of the phase. Adaptive phase (parallel: auto) gets max number of workers
+    its limiter can allow, see get_adaptive_limits.
+    """
+    if is_adaptive(phase, args):
+        return get_adaptive_limits(phase, config_database, runtime)[2]
+    parallelism = int(args.parallel) if args.parallel else int(phase.get('parallel', 1))
+    if runtime['max_workers_per_host']:
+        parallelism = min(parallelism, runtime['max_workers_per_host'])
+    return parallelism
 
 
-def execute_host(host, config, args, cancel_event, result_dir):
+def set_limiter(host, phase, config_database, args, runtime):
+    """
+    Create adaptive concurrency limiter of the phase on the host, if the phase is adaptive. Otherwise create
+    slots of additional sessions, which statements of the phase open (partition refresh) - maxconcurrency
+    of the phase's resource pool minus workers of the phase, so the sessions do not queue on the server.
+    """
+    if not is_adaptive(phase, args):
+        pool = next((p for p in config_database['resource_pools'] if p['pool_name'] == phase['pool_name']), {})
+        if pool.get('maxconcurrency'):
+            runtime['session_slots'][(host, phase['name'])] = BoundedSemaphore(
+                max(0, int(pool['maxconcurrency']) - get_parallelism(phase, args, runtime, config_database)))
+        return
+    config_adaptive = runtime['adaptive_concurrency']
+    initial, minimum, maximum = get_adaptive_limits(phase, config_database, runtime)
+    runtime['limiters'][(host, phase['name'])] = AdaptiveLimiter(
+        'host={} phase={}'.format(host, phase['name']), phase['pool_name'], initial, minimum, maximum,
+        latency_tolerance=float(config_adaptive.get('latency_tolerance', 2.0)),
+        backoff=float(config_adaptive.get('backoff', 0.75)),
+        check_interval=float(config_adaptive.get('check_interval', 1)),
+        log=info
+    )
+
+
+def plan_resume(host, phases, config_database, config_results, runtime):
+    """
+    Plan truncation of partially written tables, see RunJournal.plan
+    """
+    journal = runtime['journal']
+    requests = []
+    for phase in phases:
+        requests += [create_request(sql_statement, host, phase, config_database, config_results)
+                     for sql_statement in get_sql_statements(phase, runtime)]
+        requests += create_analyze_requests(host, phase, config_database)
+    for label, tables in journal.plan(requests):
+        info('host={} resume query_name="{}" truncate tables {}'.format(host, label, ', '.join(tables)))
+    resumed = sum(1 for request in requests if journal.apply(request).get('resumed'))
+    info('host={} resume skips {} of {} statements'.format(host, resumed, len(requests)))
+
+
+def execute_host(host, config, args, result_dir, runtime):
     conn = None
+    conn_pool = runtime['conn_pool']
+    # Each host has its own cancellation scope, failure of one host does not affect the others
+    cancel_event = Event()
+    runtime['cancel_events'].append(cancel_event)
     results = []
     config_database = config['database']
     result_host_dir = Path(result_dir) / host
     create_dir(result_host_dir)
+    config_results = dict(config['results'], host_directory=result_host_dir)
     try:
+        if runtime['shutdown'].is_set():
+            raise Exception('Cancelled')
         info('START host={}'.format(host))
         start_host = time.time()
 
         conn = get_conn(config_database, host)
-        if not args.skip_init_db:
+        if args.skip_init_db or args.resume:
+            pass
+        elif args.incremental:
+            init_db_incremental(conn, config_database)
+        else:
             init_db(conn, config_database)
 
-        phase_continue = False
-        for phase in config['sql_pipeline']:
-            # Either phase is NOT required or current phase is the required one or any following one
-            if not args.phase or args.phase == phase['name'] or phase_continue:
-                phase_continue = True
-                parallelism = args.parallel or int(phase['parallel']) if 'parallel' in phase else 1
+        phases = get_phases(config, args)
+        if args.resume:
+            plan_resume(host, phases, config_database, config_results, runtime)
+        if runtime['scheduler'] == 'dag':
+            info('START host={} scheduler=dag phases={}'.format(host, ','.join(p['name'] for p in phases)))
+            results += execute_dag(cancel_event, host, phases, config_database, config_results, args, runtime)
+        else:
+            for phase in phases:
+                if runtime['shutdown'].is_set():
+                    break
+                failed = [r['query_name'] for r in results if r['status'] not in ('ok', 'skipped')]
+                if phase.get('skip_on_failure') and failed:
+                    info('SKIP host={} phase={} failed statements: {}'.format(host, phase['name'], ', '.join(failed)))
+                    continue
+                parallelism = get_parallelism(phase, args, runtime, config_database)
                 info('START host={} phase={} parallelism={}'.format(host, phase['name'], parallelism))
                 start_phase = time.time()
 
-                results += execute_queries(conn, cancel_event, host, phase, config_database, args, parallelism)
+                results += execute_queries(cancel_event, host, phase, config_database, config_results, args,
+                                           parallelism, runtime)
 
                 duration_phase = int((time.time() - start_phase)*1000)
                 info('END host={} phase={} duration={}'.format(host, phase['name'], duration_phase))
+                limiter = runtime['limiters'].get((host, phase['name']))
+                if limiter:
+                    info('host={} phase={} concurrency limit={} adjustments={}'.format(
+                        host, phase['name'], limiter.limit, limiter.adjustments))
+
+        if runtime['shutdown'].is_set():
+            raise Exception('Cancelled')
+
+        if args.incremental:
+            watermarks = VerticaUtils(conn).get_watermarks(config_database['schema_name'])
+            info('host={} watermarks {}'.format(host, format_stats(watermarks)))
 
         duration_host = int((time.time() - start_host)*1000)
         info('END host={} duration={}'.format(host, duration_host))
+        if runtime['history']:
+            runtime['history'].update(host, results)
+        return results
     finally:
         cancel_event.set()
         if conn:
             conn.close()
-        report_results(results, result_host_dir)
-        print_separator()
+        conn_pool.close(host)
+        # Benchmark reports aggregated latencies instead
+        if args.command != 'benchmark':
+            report_results(results)
+        info('host={} connections {}'.format(host, format_stats(conn_pool.stats(host))))
+
+
+def _execute_host_thread(host, config, args, result_dir, runtime, host_slots, results, failed_hosts):
+    with host_slots:
+        try:
+            results += execute_host(host, config, args, result_dir, runtime)
+        except Exception as e:
+            info('ERROR host={} error={}'.format(host, e))
+            failed_hosts.append(host)
+
+
+def execute_hosts(hosts, config, args, result_dir, runtime):
+    """
+    Execute the pipeline against all hosts, config execution/parallel_hosts of them concurrently.
+
+    :return: tuple (finished requests of all hosts, list of hosts, which failed)
+    :rtype: tuple(list, list)
+    """
+    config_execution = config.get('execution', {})
+    parallel_hosts = args.parallel_hosts
+    if parallel_hosts is None:
+        parallel_hosts = int(config_execution.get('parallel_hosts', 1))
+    host_slots = BoundedSemaphore(parallel_hosts or len(hosts))
+    results = []
+    failed_hosts = []
+    host_threads = []
+    for host in hosts:
+        host_thread = Thread(
+            target=_execute_host_thread,
+            args=[host, config, args, result_dir, runtime, host_slots, results, failed_hosts]
+        )
+        host_thread.start()
+        host_threads.append(host_thread)
+    try:
+        for host_thread in host_threads:
+            host_thread.join()
+    except KeyboardInterrupt:
+        info('Interrupted, cancelling running statements')
+        cancel_run(runtime)
+        for host_thread in host_threads:
+            host_thread.join()
+        raise
+    return results, failed_hosts
+
+
+def cancel_run(runtime):
+    """
+    Stop all hosts - no new phases or statements are started, running statements are interrupted on the server
+    """
+    runtime['shutdown'].set()
+    for cancel_event in runtime['cancel_events']:
+        cancel_event.set()
+    runtime['watchdog'].interrupt_all('cancelled')
+
+
+def get_result_cache(config_results):
+    config_cache = config_results.get('cache', {})
+    if not config_cache.get('enabled', False):
+        return None
+    return ResultCache(
+        config_cache.get('directory', str(Path(config_results['directory']) / '.cache')),
+        max_size=int(config_cache.get('max_size_mb', 1024)) * 1024**2,
+        max_age=int(config_cache.get('max_age_seconds', 7 * 24 * 3600))
+    )
+
+
+def get_metrics(config):
+    config_metrics = config.get('metrics', {})
+    if not config_metrics.get('enabled', False):
+        return None
+    return MetricsWriter(config_metrics.get('directory', str(Path(config['results']['directory']) / 'metrics')))
+
+
+def get_profiler(config, args):
+    config_profiling = config.get('profiling', {})
+    if not (config_profiling.get('enabled', False) or args.profile or args.profile_threshold is not None):
+        return None
+    threshold = args.profile_threshold
+    if threshold is None:
+        threshold = int(config_profiling.get('threshold_ms', 1000))
+    return Profiler(threshold, config_profiling.get('labels'), int(config_profiling.get('top_operators', 10)))
+
+
+def get_history(config_execution):
+    config_history = config_execution.get('history', {})
+    if not config_history.get('enabled', False):
+        return None
+    return DurationHistory(config_history['file'])
+
+
+def get_journal(config_execution, args):
+    if 'journal' not in config_execution:
+        return None
+    return RunJournal(config_execution['journal'], resume=args.resume)
+
+
+def get_runtime(config, args):
+    """
+    State shared by all hosts during the run.
+    """
+    config_execution = config.get('execution', {})
+    # 0 means unlimited
+    max_workers = int(config_execution.get('max_workers', 0))
+    max_workers_per_host = int(config_execution.get('max_workers_per_host', 0))
+    conn_pool = get_connection_pool(config['database'])
+    return {
+        'conn_pool': conn_pool,
+        # Global cap of concurrently executed statements across all hosts
+        'worker_slots': BoundedSemaphore(max_workers) if max_workers else nullcontext(),
+        'max_workers_per_host': max_workers_per_host,
+        'adaptive_concurrency': config_execution.get('adaptive_concurrency', {}),
+        # Adaptive concurrency limiters by (host, phase name)
+        'limiters': {},
+        # Slots of additional sessions of non-adaptive phases by (host, phase name), see set_limiter
+        'session_slots': {},
+        'scheduler': args.scheduler or config_execution.get('scheduler', 'phase'),
+        'result_cache': None if args.no_result_cache else get_result_cache(config['results']),
+        'metrics': get_metrics(config),
+        'profiler': get_profiler(config, args),
+        'history': get_history(config_execution),
+        # Requests of serve mode are not resumable
+        'journal': get_journal(config_execution, args) if args.command != 'serve' else None,
+        # Parsed SQL files, see get_sql_statements
+        'sql_statements': {},
+        # Options of generated records loaded by COPY (phase/copy_options/<label>/generate)
+        'generator': get_generator_options(config.get('generator'), args.videos, args.days),
+        # Default deadline of statements (seconds), 0 means none
+        'query_timeout': float(config_execution.get('query_timeout', 0)),
+        'watchdog': Watchdog(conn_pool, log=info),
+        # Set when the run is cancelled (CTRL+C), see cancel_run
+        'shutdown': Event(),
+        'cancel_events': []
+    }
+
+
+def close_runtime(runtime):
+    runtime['watchdog'].close()
+    runtime['conn_pool'].close()
+    if runtime['journal']:
+        runtime['journal'].close()
+    if runtime['history']:
+        runtime['history'].save()
+    if runtime['metrics']:
+        runtime['metrics'].close()
+        info('metrics run_id={}'.format(runtime['metrics'].run_id))
+
+
+def run_benchmark(config, args, result_dir):
+    """
+    Execute the pipeline benchmark/iterations times, each iteration with fresh connection pool (and result cache),
+    report latency percentiles per query label and per phase, throughput and peak RSS.
+    Optionally compare them with a baseline and fail on regressions.
+    """
+    config_benchmark = config.get('benchmark', {})
+    iterations = args.iterations or int(config_benchmark.get('iterations', 5))
+    samples = []
+    start = time.time()
+    for iteration in range(iterations):
+        info('START benchmark iteration={}'.format(iteration))
+        runtime = get_runtime(config, args)
+        try:
+            results, failed_hosts = execute_hosts(config['hosts'], config, args, result_dir, runtime)
+        finally:
+            close_runtime(runtime)
+        if failed_hosts:
+            raise Exception('Benchmark failed on hosts: {}'.format(', '.join(failed_hosts)))
+        for result in results:
+            result['iteration'] = iteration
+        samples += results
+    summary = benchmark.summarize(samples, time.time() - start)
+    for line in benchmark.format_summary(summary):
+        info('benchmark {}'.format(line))
+    benchmark.write_summary(Path(result_dir) / 'benchmark.json', summary)
+    if args.save_baseline:
+        benchmark.write_summary(args.save_baseline, summary)
+    if args.baseline:
+        regressions = benchmark.compare(
+            summary, benchmark.read_baseline(args.baseline),
+            float(config_benchmark.get('regression_threshold', 0.2)),
+            float(config_benchmark.get('min_delta_ms', 20))
+        )
+        if regressions:
+            raise Exception('Benchmark regressions against {}: {}'.format(args.baseline, '; '.join(regressions)))
+        info('benchmark no regressions against {}'.format(args.baseline))
+
+
+def get_result_event(request):
+    """
+    Finished request as streamed to clients of serve mode
+    """
+    result = request.get('result') or {}
+    return {
+        'event': 'result',
+        'host': request['host'],
+        'phase': request['phase']['name'],
+        'label': request['query_name'],
+        'status': request['status'],
+        'error': request['error'],
+        'duration': request['duration'],
+        'timings': request.get('timings', {}),
+        'result_file_name': str(result['file_name']) if result.get('file_name') else None,
+        'rows': result.get('rows'),
+        'bytes': result.get('bytes'),
+        'cached': result.get('cached', False)
+    }
+
+
+def plan_serve_run(config, args, runtime, params):
+    """
+    Validate run request of serve mode.
+
+    :param params: query parameters - phase (mandatory), label and host (optional, repeatable)
+    :return: tuple (phase, hosts, labels or None for all statements of the phase)
+    :rtype: tuple
+    """
+    phases = {phase['name']: phase for phase in config['incremental_pipeline' if args.incremental else 'sql_pipeline']}
+    phase_name = params.get('phase', [None])[0]
+    if phase_name not in phases:
+        raise ValueError('Unknown phase {}, phases: {}'.format(phase_name, ', '.join(phases)))
+    phase = phases[phase_name]
+    # Repeated host would execute the phase on it twice (concurrently with itself)
+    hosts = list(dict.fromkeys(params.get('host', config['hosts'])))
+    unknown_hosts = [host for host in hosts if host not in config['hosts']]
+    if unknown_hosts:
+        raise ValueError('Unknown hosts: {}'.format(', '.join(unknown_hosts)))
+    labels = params.get('label')
+    if not labels:
+        return phase, hosts, None
+    known_labels = {create_request(sql_statement, hosts[0], phase, config['database'], None)['query_name']
+                    for sql_statement in get_sql_statements(phase, runtime)}
+    known_labels.update(r['query_name'] for r in create_analyze_requests(hosts[0], phase, config['database']))
+    unknown_labels = [label for label in labels if label not in known_labels]
+    if unknown_labels:
+        raise ValueError('Unknown labels of phase {}: {}'.format(phase_name, ', '.join(unknown_labels)))
+    return phase, hosts, set(labels)
+
+
+def serve_run(config, args, result_dir, runtime, plan, emit, closed):
+    """
+    Execute run request of serve mode - the phase on each requested host (one run per host at a time,
+    runs of the same host would overwrite each other's result files). Finished statements are emitted
+    as soon as they finish. If the client disconnects, its running statements are interrupted.
+
+    :param plan: see plan_serve_run
+    :param emit: function(dict), streams a JSON line to the client
+    :param closed: Event set when the client disconnects
+    """
+    phase, hosts, labels = plan
+    start = time.time()
+    cancel_event = Event()
+    finished = Event()
+    current = {'host': None}
+    results = []
+
+    def cancel_on_disconnect():
+        closed.wait()
+        if finished.is_set():
+            return
+        info('host={} phase={} serve client disconnected, cancelling'.format(current['host'], phase['name']))
+        cancel_event.set()
+        if current['host']:
+            runtime['watchdog'].interrupt_all('client disconnected', current['host'])
+
+    def on_result(request):
+        try:
+            emit(get_result_event(request))
+        except OSError:
+            closed.set()
+
+    Thread(target=cancel_on_disconnect, daemon=True).start()
+    try:
+        for host in hosts:
+            if closed.is_set() or runtime['shutdown'].is_set():
+                break
+            config_results = dict(config['results'], host_directory=Path(result_dir) / host)
+            parallelism = get_parallelism(phase, args, runtime, config['database'])
+            with runtime['serve_locks'][host]:
+                runtime['cancel_events'].append(cancel_event)
+                current['host'] = host
+                try:
+                    host_results = execute_queries(cancel_event, host, phase, config['database'], config_results,
+                                                   args, parallelism, runtime, labels, on_result)
+                finally:
+                    current['host'] = None
+                    runtime['cancel_events'].remove(cancel_event)
+            if runtime['history']:
+                runtime['history'].update(host, host_results)
+            results += host_results
+        summary = {'event': 'end', 'duration': int((time.time() - start) * 1000), 'statements': len(results),
+                   'errors': sum(1 for r in results if r['status'] != 'ok')}
+    except Exception as e:
+        summary = {'event': 'error', 'error': str(e)}
+    finally:
+        finished.set()
+    info('serve phase={} hosts={} {}'.format(phase['name'], ','.join(hosts), format_stats(summary)))
+    if not closed.is_set():
+        try:
+            emit(summary)
+        except OSError:
+            pass
+
+
+def get_serve_result_file(config, result_dir, host, label):
+    """
+    :return: tuple (result file of the label on the host, None if there is none, content type)
+    :rtype: tuple
+    """
+    writer_class = get_result_writer_class(config['results'].get('format'))
+    if host not in config['hosts'] or not re.match(r'^[\w.-]+$', label):
+        return None, None
+    file_name = Path(result_dir) / host / '{}{}'.format(label, writer_class.extension)
+    return file_name if file_name.is_file() else None, writer_class.content_type
+
+
+def serve(config, args, result_dir):
+    """
+    Long-running mode - config, parsed SQL files, connection pool (warm sessions) and result cache are kept
+    between requests, so a request costs only execution of its statements. Schema is never recreated.
+    See ServeHandler for the API.
+    """
+    listen = args.listen or config.get('serve', {}).get('listen', '127.0.0.1:8750')
+    runtime = get_runtime(config, args)
+    runtime['serve_locks'] = {host: Lock() for host in config['hosts']}
+    # Fail on invalid SQL files or result format at start, not with the first request
+    for phase in config['incremental_pipeline' if args.incremental else 'sql_pipeline']:
+        get_sql_statements(phase, runtime)
+    get_result_writer_class(config['results'].get('format'))
+    for host in config['hosts']:
+        create_dir(Path(result_dir) / host)
+    server = create_server(
+        listen,
+        partial(plan_serve_run, config, args, runtime),
+        partial(serve_run, config, args, result_dir, runtime),
+        partial(get_serve_result_file, config, result_dir),
+        log=info
+    )
+    # Stop as on CTRL+C
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    info('START serve listen={}'.format(listen))
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        cancel_run(runtime)
+        close_runtime(runtime)
+        info('END serve')
+
+
+def generate(config, args):
+    """
+    Write synthetic meta and history files (generator/meta_file, generator/history_file in config file)
+    """
+    options = get_generator_options(config.get('generator'), args.videos, args.days)
+    info('START generate videos={} days={} processes={}'.format(options['videos'], options['days'],
+                                                               options['processes']))
+    for kind in ('meta', 'history'):
+        start = time.time()
+        stats = write_file(kind, options)
+        duration = time.time() - start
+        info('generated file={} {} duration={} rows_per_second={}'.format(
+            options['{}_file'.format(kind)], format_stats(stats), int(duration * 1000),
+            int(stats['rows'] / duration) if duration else 0))
+
+
+def get_reference_sources(config, generator_options):
+    """
+    Inputs of tables loaded by load phases of sql_pipeline - input file (or generated records, see
+    phase/copy_options/<label>/generate), delimiter and quote character of its COPY statement
+
+    :return: functions opening binary source, delimiter and quote character by table name
+    :rtype: dict
+    """
+    re_from = re.compile(r'from\s+local\s+\'([^\']+)\'', re.I | re.M)
+    re_label = re.compile(r'label\(([^)]+)\)', re.I)
+    sources = {}
+    for phase in config['sql_pipeline']:
+        if phase['query_type'] != 'load':
+            continue
+        for statement in read_sql_file(phase['sql_file']):
+            file_name = re_from.search(statement)
+            if not file_name:
+                continue
+            label = re_label.search(statement).group(1)
+            generate = phase.get('copy_options', {}).get(label, {}).get('generate')
+            if generate:
+                open_source = partial(GeneratedSource, generate, generator_options)
+            else:
+                open_source = partial(open_copy_source, file_name.group(1))
+            for table_name in get_tables(statement)[1]:
+                sources[table_name] = (open_source, get_delimiter(statement), get_enclosed(statement))
+    return sources
+
+
+def run_reference(config, args, result_dir):
+    """
+    Compute outputs of the pipeline by the reference engine (database/reference in config file) -
+    tables and report results are written into <results/directory>/reference
+
+    :return: result files by label
+    :rtype: dict
+    """
+    config_reference = config['database'].get('reference', {})
+    reference_dir = Path(result_dir) / 'reference'
+    create_dir(reference_dir)
+    sources = get_reference_sources(config, get_generator_options(config.get('generator'), args.videos, args.days))
+    for table_name in ('youtube_meta', 'youtube_history'):
+        if table_name not in sources:
+            raise Exception('Reference backend requires load phase loading {}'.format(table_name))
+    info('START reference')
+    start = time.time()
+    engine = ReferenceEngine(reference_dir, get_result_writer_class(config['results'].get('format')),
+                             config['results'].get('compression'),
+                             chunk_rows=int(config_reference.get('chunk_rows', 1000000)),
+                             buckets=int(config_reference.get('buckets', 8)),
+                             write_tables=config_reference.get('write_tables', True))
+    inputs = []
+    try:
+        for table_name in ('youtube_meta', 'youtube_history'):
+            open_source, delimiter, quote = sources[table_name]
+            inputs.append((open_source(), delimiter, quote))
+        result_files = engine.run(*inputs)
+    finally:
+        for source, _, _ in inputs:
+            source.close()
+    info('reference {}'.format(format_stats(engine.stats)))
+    for label, file_name in sorted(result_files.items()):
+        info('reference query_name="{}" result_file_name={}'.format(label, file_name))
+    info('END reference time={}'.format(int((time.time() - start) * 1000)))
+    return result_files
+
+
+def diff(config, args, result_dir):
+    """
+    Compare report results of each host (results of the last run, csv format) with results of reference backend
+    """
+    if (config['results'].get('format') or 'csv') != 'csv':
+        raise Exception('diff requires results/format csv')
+    reference_files = run_reference(config, args, result_dir)
+    tolerance = float(config['database'].get('reference', {}).get('tolerance', 1e-9))
+    mismatches = 0
+    for host in config['hosts']:
+        for label, reference_file in sorted(reference_files.items()):
+            result_file = Path(result_dir) / host / Path(reference_file).name
+            if not os.path.isfile(result_file):
+                info('diff host={} query_name="{}" result file {} not found'.format(host, label, result_file))
+                mismatches += 1
+                continue
+            differences = diff_results(reference_file, result_file, tolerance)
+            info('diff host={} query_name="{}" {}'.format(host, label, 'differs' if differences else 'matches'))
+            for difference in differences:
+                info('  {}'.format(difference))
+            mismatches += bool(differences)
+    if mismatches:
+        raise Exception('Results differ from reference results: {}'.format(mismatches))
 
 
 def main():
     args = parse_args()
     config = read_config(args.config)
+    if args.backend:
+        config['database']['backend'] = args.backend
     hosts = config['hosts']
     start_all = time.time()
-    cancel_event = Event()
     result_dir = config['results']['directory']
     create_dir(result_dir)
+    if args.command == 'benchmark':
+        run_benchmark(config, args, result_dir)
+        return
+    if args.command == 'serve':
+        serve(config, args, result_dir)
+        return
+    if args.command == 'generate':
+        generate(config, args)
+        return
+    if args.command == 'diff':
+        diff(config, args, result_dir)
+        return
+    if config['database'].get('backend') == 'reference':
+        run_reference(config, args, result_dir)
+        return
+    runtime = get_runtime(config, args)
     info('START')
 
-    for host in hosts:
-        execute_host(host, config, args, cancel_event, result_dir)
+    try:
+        _, failed_hosts = execute_hosts(hosts, config, args, result_dir, runtime)
+    finally:
+        close_runtime(runtime)
 
+    if runtime['result_cache']:
+        info('result cache {}'.format(format_stats(runtime['result_cache'].stats())))
     duration = int((time.time() - start_all)*1000)
     info('END time={}'.format(duration))
+    if failed_hosts:
+        raise Exception('Pipeline failed on hosts: {}'.format(', '.join(failed_hosts)))
 
 
 if __name__ == "__main__":
-    main()
+    try:
+        main()
+    except KeyboardInterrupt:
+        # Running statements were interrupted and connections closed, see cancel_run
+        sys.exit(130)
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import collections
+import csv
+from pathlib import Path
+
+# Only labelled statements can be found in system tables (hints are removed from DDL and COPY)
+PROFILED_QUERY_TYPES = ('select', 'dml')
+
+
+def _write_csv(file_name, rows):
+    with open(file_name, 'w', newline='') as fp:
+        writer = csv.writer(fp, lineterminator='\n')
+        if rows:
+            writer.writerow(rows[0].keys())
+            writer.writerows(row.values() for row in rows)
+
+
+def get_top_operators(profile_rows, limit):
+    """
+    Operators (by path) with highest execution time and memory, summed over nodes and threads.
+
+    :param profile_rows: rows of execution_engine_profiles
+    :return: tuple (top operators by time, top operators by memory), each operator is a dict
+    :rtype: tuple(list, list)
+    """
+    operators = collections.defaultdict(lambda: {'execution_time_us': 0, 'memory_allocated_bytes': 0})
+    for row in profile_rows:
+        operator = operators[(row['operator_name'], row['path_id'])]
+        if row['counter_name'] == 'execution time (us)':
+            operator['execution_time_us'] += row['counter_value'] or 0
+        elif row['counter_name'] == 'memory allocated (bytes)':
+            operator['memory_allocated_bytes'] += row['counter_value'] or 0
+    operators = [dict(operator_name=name, path_id=path_id, **counters)
+                 for (name, path_id), counters in operators.items()]
+    by_time = sorted(operators, key=lambda o: o['execution_time_us'], reverse=True)[:limit]
+    by_memory = sorted(operators, key=lambda o: o['memory_allocated_bytes'], reverse=True)[:limit]
+    return by_time, by_memory
+
+
+class Profiler(object):
+    """
+    Captures server-side diagnostics of slow labelled queries - plan (EXPLAIN), query_requests,
+    resource_acquisitions and execution_engine_profiles of the statement, saved next to result files
+    as <label>.explain.txt, <label>.<system table>.csv and summary of top operators <label>.profile.txt.
+    Profiles are taken from data collector, so they are available only for recently finished statements.
+    """
+
+    def __init__(self, threshold_ms=1000, labels=None, top_operators=10):
+        self._threshold = threshold_ms / 1000.0
+        self._labels = set(labels or [])
+        self._top_operators = top_operators
+
+    def is_slow(self, request, duration):
+        """
+        :param duration: execution time of the statement in seconds (without waits for a slot and a session)
+        """
+        return (request['query_type'] in PROFILED_QUERY_TYPES and duration >= self._threshold
+                and (not self._labels or request['query_name'] in self._labels))
+
+    def capture(self, conn, request):
+        """
+        Capture profile of the last statement with request label executed in the session.
+
+        :param conn: session, which executed the statement
+        :return: profile file names and top operators
+        :rtype: dict
+        """
+        label = request['query_name']
+        prefix = Path(request['config_results']['host_directory']) / label
+        statement = conn.exec_default(
+            "select transaction_id, statement_id from query_requests "
+            "where session_id = current_session() and request_label = '{}' "
+            "order by start_timestamp desc limit 1".format(label))
+        if not statement:
+            return {'error': 'statement not found in query_requests'}
+        condition = 'transaction_id = {transaction_id} and statement_id = {statement_id}'.format(**statement[0])
+
+        sql_statement = request['sql_statement']
+        # Statement refreshing partitions (phase/partition_refresh) - the last partition executed in the session
+        if request.get('partition_key'):
+            sql_statement = sql_statement.replace(':partition_key', request['partition_key'])
+        plan = conn.exec_default('explain {}'.format(sql_statement))
+        with open('{}.explain.txt'.format(prefix), 'w') as fp:
+            fp.writelines('{}\n'.format(value) for row in plan for value in row.values())
+        profile_rows = []
+        for table in ('query_requests', 'resource_acquisitions', 'execution_engine_profiles'):
+            rows = conn.exec_default('select * from {} where {}'.format(table, condition))
+            _write_csv('{}.{}.csv'.format(prefix, table), rows)
+            if table == 'execution_engine_profiles':
+                profile_rows = rows
+
+        by_time, by_memory = get_top_operators(profile_rows, self._top_operators)
+        with open('{}.profile.txt'.format(prefix), 'w') as fp:
+            fp.write('{}\n'.format(condition))
+            for title, operators in (('Top operators by execution time', by_time),
+                                     ('Top operators by memory', by_memory)):
+                fp.write('{}:\n'.format(title))
+                for operator in operators:
+                    fp.write('  {operator_name} path_id={path_id} execution_time_us={execution_time_us} '
+                             'memory_allocated_bytes={memory_allocated_bytes}\n'.format(**operator))
+        return {'file_name': '{}.profile.txt'.format(prefix), 'top_operators': by_time}
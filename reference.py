@@ -0,0 +1,505 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import csv
+import math
+import os
+import shutil
+import tempfile
+from datetime import date, datetime, timedelta
+from vertica_python.datatypes import VerticaType
+from columnar import ColumnBatch, get_schema
+from normalizer import iter_lines
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# NULL of int64 columns
+NULL = -2**63
+COUNTERS = ['views', 'likes', 'dislikes', 'comments']
+# report_task_4 reads updates after date '2018-06-08' - interval '7 day' (sql/reports.sql)
+TASK_4_START = '2018-06-01'
+EPOCH = datetime(1970, 1, 1)
+
+DENORM_SCHEMA = get_schema(
+    [('gid', VerticaType.VARCHAR)] + [(c, VerticaType.INT8) for c in COUNTERS] +
+    [('updated_at', VerticaType.TIMESTAMP), ('user_id', VerticaType.VARCHAR), ('category_id', VerticaType.INT8),
+     ('created_at', VerticaType.TIMESTAMP), ('duration', VerticaType.INT8), ('day_updated_at', VerticaType.DATE),
+     ('hour', VerticaType.INT8)] + [('{}_diff'.format(c), VerticaType.INT8) for c in COUNTERS])
+LATEST_SCHEMA = DENORM_SCHEMA[:11]
+DAILY_SCHEMA = DENORM_SCHEMA[:5] + DENORM_SCHEMA[6:11]
+
+
+def _require_numpy():
+    if np is None:
+        raise Exception('Module numpy is required by reference backend, install it: pip install numpy')
+
+
+def _iter_chunks(source, delimiter, quote, chunk_rows):
+    """
+    Records of the source (binary file-like object) parsed like COPY parses them (ENCLOSED BY quote),
+    in lists of up to chunk_rows records
+    """
+    if quote:
+        records = csv.reader(iter_lines(source), delimiter=delimiter, quotechar=quote)
+    else:
+        records = csv.reader(iter_lines(source), delimiter=delimiter, quoting=csv.QUOTE_NONE)
+    chunk = []
+    for record in records:
+        if not record:
+            continue
+        chunk.append(record)
+        if len(chunk) >= chunk_rows:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _parse(values, dtype, convert):
+    """
+    Vectorized conversion of strings, values failing the conversion are converted one by one to find them
+
+    :return: tuple (array, mask of valid values)
+    """
+    strings = np.array(values, dtype=str)
+    try:
+        return strings.astype(dtype), np.ones(len(values), dtype=bool)
+    except ValueError:
+        pass
+    result = np.zeros(len(values), dtype=dtype)
+    valid = np.ones(len(values), dtype=bool)
+    for i, value in enumerate(values):
+        try:
+            result[i] = convert(value)
+        except ValueError:
+            valid[i] = False
+    return result, valid
+
+
+def _parse_ints(values, nullable=True):
+    """
+    :return: tuple (int64 array, empty values are NULL, mask of valid values)
+    """
+    empty = np.array([value == '' for value in values], dtype=bool)
+    result = np.full(len(values), NULL, dtype=np.int64)
+    valid = ~empty if not nullable else np.ones(len(values), dtype=bool)
+    present = np.flatnonzero(~empty)
+    parsed, parsed_valid = _parse([values[i] for i in present], np.int64, int)
+    result[present] = parsed
+    valid[present] &= parsed_valid
+    return result, valid
+
+
+def _parse_timestamps(values, nullable=True):
+    """
+    :return: tuple (int64 array of seconds since epoch, empty values are NULL, mask of valid values)
+    """
+    empty = np.array([value == '' for value in values], dtype=bool)
+    result = np.full(len(values), NULL, dtype=np.int64)
+    valid = ~empty if not nullable else np.ones(len(values), dtype=bool)
+    present = np.flatnonzero(~empty)
+    parsed, parsed_valid = _parse([values[i] for i in present], 'datetime64[s]', np.datetime64)
+    # NaT literal is not a timestamp
+    parsed_valid &= ~np.isnat(parsed)
+    result[present] = parsed.astype(np.int64)
+    valid[present] &= parsed_valid
+    return result, valid
+
+
+def _to_timestamp(seconds):
+    return None if seconds == NULL else EPOCH + timedelta(seconds=seconds)
+
+
+def _to_date(days):
+    return None if days == NULL else date(1970, 1, 1) + timedelta(days=days)
+
+
+def _to_value(value):
+    return None if value == NULL else value
+
+
+class Meta(object):
+    """
+    youtube_meta sorted by gid, history records are joined by binary search
+    """
+
+    def __init__(self, gids, user_ids, category_ids, created_at, durations):
+        order = np.argsort(gids, kind='stable')
+        self.gids = gids[order]
+        self.user_ids = user_ids[order]
+        self.category_ids = category_ids[order]
+        self.created_at = created_at[order]
+        self.durations = durations[order]
+
+    @classmethod
+    def load(cls, chunks):
+        """
+        :param chunks: lists of records, see _iter_chunks
+        :return: tuple (Meta, number of rejected records)
+        """
+        columns = [[], [], [], [], []]
+        rejected = 0
+        for chunk in chunks:
+            records = [record for record in chunk if len(record) == 5]
+            rejected += len(chunk) - len(records)
+            if not records:
+                continue
+            gids, user_ids, category_ids, created_at, durations = (list(values) for values in zip(*records))
+            valid = np.array([0 < len(gid) <= 14 and len(user_id) <= 24 for gid, user_id in zip(gids, user_ids)])
+            category_ids, category_valid = _parse_ints(category_ids)
+            created_at, created_valid = _parse_timestamps(created_at)
+            durations, duration_valid = _parse_ints(durations)
+            valid &= category_valid & created_valid & duration_valid
+            rejected += int((~valid).sum())
+            for i, values in enumerate([np.array(gids), np.array(user_ids, dtype=object), category_ids, created_at,
+                                        durations]):
+                columns[i].append(values[valid])
+        if not columns[0]:
+            columns = [[np.array([], dtype=str)], [np.array([], dtype=object)]] + \
+                      [[np.array([], dtype=np.int64)] for _ in range(3)]
+        return cls(*[np.concatenate(values) for values in columns]), rejected
+
+    def find(self, gids):
+        """
+        :return: tuple (positions of gids in meta, mask of found gids)
+        """
+        positions = np.searchsorted(self.gids, gids)
+        positions[positions >= len(self.gids)] = 0
+        found = self.gids[positions] == gids if len(self.gids) else np.zeros(len(gids), dtype=bool)
+        return positions, found
+
+
+def _get_diffs(videos, values):
+    """
+    value - nvl(lag(value) over (partition by video order by updated_at), 0) of rows sorted by video, updated_at
+
+    :param values: 2D array, row per counter
+    """
+    first = np.ones(len(videos), dtype=bool)
+    first[1:] = videos[1:] != videos[:-1]
+    previous = np.zeros_like(values)
+    previous[:, 1:] = values[:, :-1]
+    previous[:, first] = 0
+    previous[previous == NULL] = 0
+    diffs = values - previous
+    diffs[values == NULL] = NULL
+    return diffs
+
+
+def _aggregate(accumulator, keys, measures):
+    """
+    Add partial aggregates of rows into accumulator - dict group key (tuple) -> [rows, then (sum, count, max)
+    of each measure], NULLs are ignored like by SQL aggregate functions
+
+    :param keys: list of int64 arrays, group by columns
+    :param measures: list of int64 arrays
+    """
+    if not len(keys[0]):
+        return
+    groups, inverse = np.unique(np.stack(keys, axis=1), axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    partial = [np.bincount(inverse, minlength=len(groups))]
+    for values in measures:
+        valid = values != NULL
+        sums = np.zeros(len(groups), dtype=np.int64)
+        np.add.at(sums, inverse, np.where(valid, values, 0))
+        maxes = np.full(len(groups), NULL, dtype=np.int64)
+        np.maximum.at(maxes, inverse, values)
+        partial += [sums, np.bincount(inverse[valid], minlength=len(groups)), maxes]
+    for i, key in enumerate(map(tuple, groups.tolist())):
+        values = [int(column[i]) for column in partial]
+        current = accumulator.get(key)
+        if current is None:
+            accumulator[key] = values
+            continue
+        current[0] += values[0]
+        for m in range(1, len(values), 3):
+            current[m] += values[m]
+            current[m + 1] += values[m + 1]
+            current[m + 2] = max(current[m + 2], values[m + 2])
+
+
+def _get_views_group(values):
+    """
+    greatest(10^ceil(log10(nvl(value, 0))), 1000) of sql/reports.sql (log10 of 0 is -infinity)
+    """
+    groups = np.full(len(values), 1000, dtype=np.int64)
+    positive = (values != NULL) & (values > 0)
+    powers = np.power(10.0, np.ceil(np.log10(values[positive].astype(np.float64))))
+    groups[positive] = np.maximum(powers, 1000).astype(np.int64)
+    return groups
+
+
+class ReferenceEngine(object):
+    """
+    Computes outputs of denorm, pre_agg and report phases from input files without database - tables
+    youtube_history_denorm, youtube_history_denorm_latest, youtube_history_denorm_daily and results of report tasks.
+
+    History is read in chunks, joined with meta and spilled into buckets (temporary files) by video, so memory
+    is bounded by one chunk and one bucket. Each bucket is sorted by video and updated_at, lag(), latest values
+    and daily sums are computed by vectorized operations over the sorted arrays. Reports are aggregated
+    per bucket and merged.
+    """
+
+    def __init__(self, directory, writer_class, compression=None, chunk_rows=1000000, buckets=8, write_tables=True):
+        _require_numpy()
+        self._directory = directory
+        self._writer_class = writer_class
+        self._compression = compression
+        self._chunk_rows = chunk_rows
+        self._buckets = buckets
+        self._write_tables = write_tables
+        self._task_4_start = int(np.datetime64(TASK_4_START, 's').astype(np.int64))
+        # Report aggregates, see _aggregate
+        self._by_category = {}
+        self._by_category_day = {}
+        self._by_views_group = {}
+        self._by_likes_group = {}
+        self._by_category_hour = {}
+        self.stats = {}
+
+    def run(self, meta_source, history_source):
+        """
+        :param meta_source: tuple (binary file-like object, delimiter, quote) of youtube_meta input
+        :param history_source: tuple (binary file-like object, delimiter, quote) of youtube_history input
+        :return: result files by label
+        :rtype: dict
+        """
+        source, delimiter, quote = meta_source
+        meta, self.stats['meta_rejected'] = Meta.load(_iter_chunks(source, delimiter, quote, self._chunk_rows))
+        self.stats['meta_rows'] = len(meta.gids)
+        spill_directory = tempfile.mkdtemp(prefix='.spill_', dir=self._directory)
+        writers = {}
+        try:
+            bucket_files = self._spill(meta, history_source, spill_directory)
+            if self._write_tables:
+                for name, schema in (('youtube_history_denorm', DENORM_SCHEMA),
+                                     ('youtube_history_denorm_latest', LATEST_SCHEMA),
+                                     ('youtube_history_denorm_daily', DAILY_SCHEMA)):
+                    writers[name] = (self._open_writer(name, schema), schema)
+            for bucket_file in bucket_files:
+                self._process_bucket(meta, np.fromfile(bucket_file, dtype=np.int64).reshape(-1, 6), writers)
+                os.remove(bucket_file)
+        finally:
+            for writer, _ in writers.values():
+                writer.close()
+            shutil.rmtree(spill_directory, ignore_errors=True)
+        return self._write_reports()
+
+    def _spill(self, meta, history_source, spill_directory):
+        """
+        Parse, validate and join history records, append them into bucket files (video, updated_at, counters)
+        """
+        source, delimiter, quote = history_source
+        bucket_files = [os.path.join(spill_directory, 'bucket_{}.bin'.format(i)) for i in range(self._buckets)]
+        handles = [open(file_name, 'wb') for file_name in bucket_files]
+        self.stats.update({'history_rows': 0, 'history_rejected': 0, 'history_unmatched': 0})
+        try:
+            for chunk in _iter_chunks(source, delimiter, quote, self._chunk_rows):
+                records = [record for record in chunk if len(record) == 6]
+                self.stats['history_rejected'] += len(chunk) - len(records)
+                if not records:
+                    continue
+                columns = list(zip(*records))
+                valid = np.array([0 < len(gid) <= 14 for gid in columns[0]])
+                counters = []
+                for values in columns[1:5]:
+                    counter, counter_valid = _parse_ints(values)
+                    counters.append(counter)
+                    valid &= counter_valid
+                updated_at, updated_valid = _parse_timestamps(columns[5], nullable=False)
+                valid &= updated_valid
+                self.stats['history_rejected'] += int((~valid).sum())
+                videos, found = meta.find(np.array(columns[0]))
+                # Inner join with meta
+                self.stats['history_unmatched'] += int((valid & ~found).sum())
+                valid &= found
+                if (meta.category_ids[videos[valid]] == NULL).any():
+                    raise Exception('meta record without category_id, youtube_history_denorm.category_id is NOT NULL')
+                rows = np.stack([videos, updated_at] + counters, axis=1)[valid]
+                self.stats['history_rows'] += len(rows)
+                buckets = rows[:, 0] % self._buckets
+                for i, handle in enumerate(handles):
+                    rows[buckets == i].tofile(handle)
+        finally:
+            for handle in handles:
+                handle.close()
+        return bucket_files
+
+    def _process_bucket(self, meta, rows, writers):
+        if not len(rows):
+            return
+        rows = rows[np.lexsort((rows[:, 1], rows[:, 0]))]
+        videos, updated_at, values = rows[:, 0], rows[:, 1], rows[:, 2:].T.copy()
+
+        # denorm - rows changing any counter
+        diffs = _get_diffs(videos, values)
+        changed = (diffs > 0).any(axis=0)
+        videos, updated_at, values, diffs = videos[changed], updated_at[changed], values[:, changed], diffs[:, changed]
+        days = updated_at // 86400
+        hours = updated_at % 86400 // 3600
+        categories = meta.category_ids[videos]
+        self.stats['denorm_rows'] = self.stats.get('denorm_rows', 0) + len(videos)
+
+        # latest - last row of each video
+        last = np.ones(len(videos), dtype=bool)
+        last[:-1] = videos[1:] != videos[:-1]
+        self.stats['latest_rows'] = self.stats.get('latest_rows', 0) + int(last.sum())
+
+        # daily - sums of diffs (lag over denorm rows) per video and day
+        daily_diffs = _get_diffs(videos, values)
+        starts = np.ones(len(videos), dtype=bool)
+        starts[1:] = (videos[1:] != videos[:-1]) | (days[1:] != days[:-1])
+        starts = np.flatnonzero(starts)
+        present = daily_diffs != NULL
+        daily = np.add.reduceat(np.where(present, daily_diffs, 0), starts, axis=1)
+        daily[np.add.reduceat(present, starts, axis=1) == 0] = NULL
+        daily_videos, daily_days = videos[starts], days[starts]
+        self.stats['daily_rows'] = self.stats.get('daily_rows', 0) + len(starts)
+
+        # Reports
+        _aggregate(self._by_category, [categories[last]], list(values[:, last]))
+        _aggregate(self._by_category_day, [meta.category_ids[daily_videos], daily_days],
+                   list(daily) + [meta.durations[daily_videos]])
+        _aggregate(self._by_views_group, [_get_views_group(values[0, last]), categories[last]], [])
+        _aggregate(self._by_likes_group, [_get_views_group(values[1, last]), categories[last]], [])
+        recent = updated_at > self._task_4_start
+        _aggregate(self._by_category_hour, [categories[recent], hours[recent]], list(values[:, recent]))
+
+        if writers:
+            self._write_rows(writers['youtube_history_denorm'], meta, videos,
+                             [values, updated_at, days, hours, diffs])
+            self._write_rows(writers['youtube_history_denorm_latest'], meta, videos[last],
+                             [values[:, last], updated_at[last], days[last]])
+            self._write_rows(writers['youtube_history_denorm_daily'], meta, daily_videos, [daily, None, daily_days])
+
+    @staticmethod
+    def _write_rows(writer_schema, meta, videos, columns):
+        """
+        :param columns: counters, updated_at (None for daily), day and optionally hour and diffs (denorm)
+        """
+        counters, updated_at, days = columns[:3]
+        values = [meta.gids[videos].tolist()] + [[_to_value(v) for v in counter] for counter in counters.tolist()]
+        if updated_at is not None:
+            values.append([_to_timestamp(v) for v in updated_at.tolist()])
+        values += [
+            meta.user_ids[videos].tolist(),
+            meta.category_ids[videos].tolist(),
+            [_to_timestamp(v) for v in meta.created_at[videos].tolist()],
+            [_to_value(v) for v in meta.durations[videos].tolist()],
+            [_to_date(v) for v in days.tolist()]
+        ]
+        if len(columns) > 3:
+            hours, diffs = columns[3:]
+            values += [hours.tolist()] + [[_to_value(v) for v in diff] for diff in diffs.tolist()]
+        writer, schema = writer_schema
+        writer.write(ColumnBatch.from_rows(schema, list(zip(*values))))
+
+    def _open_writer(self, name, schema):
+        return self._writer_class(os.path.join(self._directory, name + self._writer_class.extension), schema,
+                                  self._compression)
+
+    def _write_report(self, label, columns, rows):
+        schema = get_schema(columns)
+        file_name = os.path.join(self._directory, label + self._writer_class.extension)
+        writer = self._open_writer(label, schema)
+        writer.write(ColumnBatch.from_rows(schema, rows))
+        writer.close()
+        return file_name
+
+    def _write_reports(self):
+        def total(aggregates, m):
+            # sum() of no value is NULL
+            return aggregates[1 + 3 * m] if aggregates[2 + 3 * m] else None
+
+        def average(aggregates, m):
+            return aggregates[1 + 3 * m] / aggregates[2 + 3 * m] if aggregates[2 + 3 * m] else None
+
+        def maximum(aggregates, m):
+            return _to_value(aggregates[3 + 3 * m])
+
+        int8, float8 = VerticaType.INT8, VerticaType.FLOAT8
+        files = {}
+        rows = [[key[0]] + [total(a, m) for m in range(4)] for key, a in self._by_category.items()]
+        rows.sort(key=lambda row: (-(row[1] or 0), row[0]))
+        files['report_task_1'] = self._write_report(
+            'report_task_1', [('category_id', int8)] + [('total_{}'.format(c), int8) for c in COUNTERS], rows)
+
+        rows = sorted([key[0], _to_date(key[1])] + [f(a, m) for m in range(5) for f in (average, maximum)]
+                      for key, a in self._by_category_day.items())
+        files['report_task_2'] = self._write_report(
+            'report_task_2', [('category_id', int8), ('day_updated_at', VerticaType.DATE)] +
+            [(name.format(c), t) for c in COUNTERS + ['duration'] for name, t in (('avg_{}', float8),
+                                                                                   ('max_{}', int8))], rows)
+
+        for label, column, aggregates in (('report_task_3', 'total_views_group', self._by_views_group),
+                                          ('report_task_31', 'total_likes_group', self._by_likes_group)):
+            rows = sorted([a[0], float(key[0]), key[1]] for key, a in aggregates.items())
+            rows.sort(key=lambda row: (row[1], row[2]))
+            files[label] = self._write_report(label, [('count_videos', int8), (column, float8),
+                                                      ('category_id', int8)], rows)
+
+        rows = [[key[0], key[1]] + [total(a, m) for m in range(4)] for key, a in self._by_category_hour.items()]
+        rows.sort(key=lambda row: (-(row[2] or 0), row[0], row[1]))
+        files['report_task_4'] = self._write_report(
+            'report_task_4', [('category_id', int8), ('hour', int8)] +
+            [('total_{}'.format(c), int8) for c in COUNTERS], rows)
+        return files
+
+
+def _read_csv(file_name):
+    with open(file_name, newline='') as fp:
+        rows = list(csv.reader(fp))
+    return (rows[0], rows[1:]) if rows else ([], [])
+
+
+def _normalize_value(value):
+    """
+    Value of CSV result for comparison - None for NULL, float for numbers, string otherwise
+    """
+    if value == '':
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+
+def _sort_key(row):
+    # Floats of both sides may differ in last digits, they are rounded for ordering only
+    return tuple((0, '') if v is None else (1, '{:.9g}'.format(v)) if isinstance(v, float) else (2, v) for v in row)
+
+
+def _values_equal(expected, actual, tolerance):
+    if isinstance(expected, float) and isinstance(actual, float):
+        return math.isclose(expected, actual, rel_tol=tolerance, abs_tol=tolerance)
+    return expected == actual
+
+
+def diff_results(reference_file, result_file, tolerance=1e-9, max_differences=5):
+    """
+    Compare CSV result with reference result - same columns and same rows in any order,
+    numbers are compared with relative tolerance
+
+    :return: list of differences (empty if results match)
+    :rtype: list
+    """
+    expected_header, expected = _read_csv(reference_file)
+    actual_header, actual = _read_csv(result_file)
+    if expected_header != actual_header:
+        return ['columns differ: expected {}, found {}'.format(expected_header, actual_header)]
+    differences = []
+    if len(expected) != len(actual):
+        differences.append('rows differ: expected {}, found {}'.format(len(expected), len(actual)))
+    expected = sorted(([_normalize_value(v) for v in row] for row in expected), key=_sort_key)
+    actual = sorted(([_normalize_value(v) for v in row] for row in actual), key=_sort_key)
+    for expected_row, actual_row in zip(expected, actual):
+        if len(differences) >= max_differences:
+            break
+        if len(expected_row) != len(actual_row) or not all(
+                _values_equal(e, a, tolerance) for e, a in zip(expected_row, actual_row)):
+            differences.append('expected {}, found {}'.format(expected_row, actual_row))
+    return differences
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import collections
+import hashlib
+import json
+import os
+import re
+import shutil
+import time
+from pathlib import Path
+from threading import Lock
+
+RE_COMMENT = re.compile(r'--[^\n]*')
+RE_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_sql(sql_statement):
+    """
+    SQL text without comments and redundant white spaces, so formatting changes do not invalidate the cache
+    """
+    return RE_WHITESPACE.sub(' ', RE_COMMENT.sub('', sql_statement)).strip()
+
+
+def get_table_versions(conn, tables):
+    """
+    Version fingerprint of tables - row count, deleted row count and last commit epoch of each table,
+    read from catalog (storage containers of the table's projections), data of the tables is not scanned.
+    Identifiers, which are not tables of current schema (parser of read tables is simple), are ignored.
+
+    :param conn: DB connection
+    :param tables: names of tables
+    :return: sorted list of tuples (table name, row count, deleted row count, last epoch)
+    :rtype: list
+    """
+    if not tables:
+        return []
+    existing = conn.exec_default(
+        "select table_name from tables where table_schema = current_schema() and lower(table_name) in ({})".format(
+            ', '.join("'{}'".format(t.lower()) for t in sorted(tables))))
+    existing = sorted(row['table_name'].lower() for row in existing)
+    if not existing:
+        return []
+    rows = conn.exec_default(
+        "select lower(p.anchor_table_name) as table_name, sum(s.total_row_count) as row_count, "
+        "sum(s.deleted_row_count) as deleted_row_count, max(s.end_epoch) as last_epoch "
+        "from storage_containers s join projections p on p.projection_id = s.projection_id "
+        "where p.projection_schema = current_schema() and lower(p.anchor_table_name) in ({}) "
+        "group by lower(p.anchor_table_name)".format(', '.join("'{}'".format(t) for t in existing)))
+    versions = {row['table_name']: (row['row_count'], row['deleted_row_count'], row['last_epoch']) for row in rows}
+    # Empty tables have no storage containers
+    return [(t, ) + versions.get(t, (0, 0, None)) for t in existing]
+
+
+class ResultCache(object):
+    """
+    Persistent on-disk cache of SELECT results (result files), keyed by host, normalized SQL and version fingerprint
+    of tables the query reads. Entries created more than max_age seconds ago are evicted, then least recently used
+    entries are evicted, until the cache fits into max_size bytes.
+    Modification time of a data file is its creation time, access time is the time of its last use.
+    """
+
+    def __init__(self, directory, max_size=1024**3, max_age=7 * 24 * 3600):
+        self._directory = Path(directory)
+        self._max_size = max_size
+        self._max_age = max_age
+        self._lock = Lock()
+        self._stats = collections.Counter()
+        self._directory.mkdir(parents=True, exist_ok=True)
+        self.evict()
+
+    @staticmethod
+    def get_key(host, sql_statement, table_versions, suffix=''):
+        fingerprint = json.dumps([host, normalize_sql(sql_statement), table_versions, suffix], default=str)
+        return hashlib.sha256(fingerprint.encode('utf-8')).hexdigest()
+
+    def _paths(self, key):
+        return self._directory / '{}.data'.format(key), self._directory / '{}.json'.format(key)
+
+    def get(self, key, target_file):
+        """
+        Copy cached result into target_file.
+
+        :return: metadata stored with the result (rows, bytes), None if there is no valid entry
+        :rtype: dict
+        """
+        data_file, meta_file = self._paths(key)
+        try:
+            created = data_file.stat().st_mtime
+            if time.time() - created > self._max_age:
+                raise FileNotFoundError(data_file)
+            with open(meta_file) as fp:
+                metadata = json.load(fp)
+            tmp_file = '{}.tmp'.format(target_file)
+            shutil.copyfile(data_file, tmp_file)
+            os.replace(tmp_file, target_file)
+            # Keep track of usage for LRU eviction, creation time (max_age) is not changed
+            os.utime(data_file, (time.time(), created))
+        except (OSError, ValueError):
+            with self._lock:
+                self._stats['misses'] += 1
+            return None
+        with self._lock:
+            self._stats['hits'] += 1
+        return metadata
+
+    def put(self, key, source_file, metadata):
+        """
+        Store result file (copy) and its metadata into the cache
+        """
+        data_file, meta_file = self._paths(key)
+        tmp_file, tmp_meta_file = (path.with_name('{}.tmp.{}'.format(path.name, os.getpid()))
+                                   for path in (data_file, meta_file))
+        shutil.copyfile(source_file, tmp_file)
+        with open(tmp_meta_file, 'w') as fp:
+            json.dump(metadata, fp, default=str)
+        # Readers never see partially written files, metadata is replaced after the data it describes
+        os.replace(tmp_file, data_file)
+        os.replace(tmp_meta_file, meta_file)
+        with self._lock:
+            self._stats['stores'] += 1
+        self.evict()
+
+    def evict(self):
+        with self._lock:
+            entries = []
+            now = time.time()
+            for data_file in self._directory.glob('*.data'):
+                try:
+                    stat = data_file.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_atime, stat.st_mtime, stat.st_size, data_file))
+            # Least recently used first
+            entries.sort()
+            total_size = sum(size for _, _, size, _ in entries)
+            for _, created, size, data_file in entries:
+                if now - created <= self._max_age and total_size <= self._max_size:
+                    continue
+                for path in (data_file, data_file.with_suffix('.json')):
+                    try:
+                        path.unlink()
+                    except OSError:
+                        pass
+                total_size -= size
+                self._stats['evictions'] += 1
+
+    def stats(self):
+        with self._lock:
+            return {key: self._stats[key] for key in ('hits', 'misses', 'stores', 'evictions')}
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import csv
+import os
+from vertica_python.datatypes import VerticaType
+
+
+def _import_pyarrow(format_name):
+    try:
+        import pyarrow
+    except ImportError:
+        raise Exception('Module pyarrow is required to write {} results, install it: pip install pyarrow'.format(
+            format_name))
+    return pyarrow
+
+
+def get_arrow_type(pa, column):
+    """
+    Arrow type of result column from its Vertica type, types without exact Arrow counterpart are written as strings
+
+    :param pa: pyarrow module
+    :param column: Column of result schema
+    """
+    type_code = column.type_code
+    if type_code == VerticaType.BOOL:
+        return pa.bool_()
+    if type_code == VerticaType.INT8:
+        return pa.int64()
+    if type_code == VerticaType.FLOAT8:
+        return pa.float64()
+    if type_code == VerticaType.NUMERIC and column.precision and column.precision <= 38:
+        return pa.decimal128(column.precision, column.scale or 0)
+    if type_code == VerticaType.DATE:
+        return pa.date32()
+    if type_code == VerticaType.TIME:
+        return pa.time64('us')
+    if type_code == VerticaType.TIMESTAMP:
+        return pa.timestamp('us')
+    if type_code == VerticaType.TIMESTAMPTZ:
+        return pa.timestamp('us', tz='UTC')
+    if type_code == VerticaType.INTERVAL:
+        return pa.duration('us')
+    if type_code in (VerticaType.BINARY, VerticaType.VARBINARY, VerticaType.LONGVARBINARY):
+        return pa.binary()
+    return pa.string()
+
+
+class CsvResultWriter(object):
+    """
+    Result written as csv text file with header, values converted by str()
+    """
+    extension = '.csv'
+    content_type = 'text/csv'
+
+    def __init__(self, file_name, schema, compression=None):
+        if compression:
+            raise Exception('Compression {} is not supported by csv results'.format(compression))
+        self._fp = open(file_name, 'w', newline='')
+        self._writer = csv.writer(self._fp, lineterminator='\n')
+        self._writer.writerow(column.name for column in schema)
+
+    def write(self, batch):
+        self._writer.writerows(batch.rows())
+
+    def close(self):
+        """
+        :return: size of the file in bytes
+        """
+        size = self._fp.tell()
+        self._fp.close()
+        return size
+
+
+class ArrowResultWriter(object):
+    """
+    Result written as Arrow IPC file (random access format), one record batch per fetched batch.
+    Compression (lz4 or zstd) is applied to record batch buffers.
+    """
+    extension = '.arrow'
+    content_type = 'application/vnd.apache.arrow.file'
+    format_name = 'arrow'
+
+    def __init__(self, file_name, schema, compression=None):
+        self._pa = _import_pyarrow(self.format_name)
+        self._file_name = file_name
+        self._types = [get_arrow_type(self._pa, column) for column in schema]
+        self._schema = self._pa.schema([(column.name, arrow_type) for column, arrow_type in zip(schema, self._types)])
+        self._writer = self._open(compression)
+
+    def _open(self, compression):
+        options = self._pa.ipc.IpcWriteOptions(compression=compression)
+        return self._pa.ipc.new_file(str(self._file_name), self._schema, options=options)
+
+    def _to_array(self, batch, i):
+        arrow_type = self._types[i]
+        column = batch.schema[i]
+        # Arrays of int64 / float64 without NULLs are passed to Arrow without copy
+        if column.typecode in ('q', 'd') and batch.nulls[i] is None:
+            return self._pa.Array.from_buffers(arrow_type, batch.length, [None, self._pa.py_buffer(batch.columns[i])])
+        values = batch.values(i)
+        if arrow_type == self._pa.string() and column.type_code not in (VerticaType.CHAR, VerticaType.VARCHAR,
+                                                                        VerticaType.LONGVARCHAR):
+            values = [None if value is None else str(value) for value in values]
+        return self._pa.array(values, type=arrow_type)
+
+    def _to_record_batch(self, batch):
+        arrays = [self._to_array(batch, i) for i in range(len(batch.schema))]
+        return self._pa.RecordBatch.from_arrays(arrays, schema=self._schema)
+
+    def write(self, batch):
+        self._writer.write_batch(self._to_record_batch(batch))
+
+    def close(self):
+        """
+        :return: size of the file in bytes
+        """
+        self._writer.close()
+        return os.path.getsize(self._file_name)
+
+
+class ParquetResultWriter(ArrowResultWriter):
+    """
+    Result written as Parquet file, one row group per fetched batch.
+    Compression codec is one of snappy (default), gzip, brotli, lz4, zstd or none.
+    """
+    extension = '.parquet'
+    content_type = 'application/vnd.apache.parquet'
+    format_name = 'parquet'
+
+    def _open(self, compression):
+        import pyarrow.parquet
+        return pyarrow.parquet.ParquetWriter(str(self._file_name), self._schema, compression=compression or 'snappy')
+
+    def write(self, batch):
+        self._writer.write_table(self._pa.Table.from_batches([self._to_record_batch(batch)]))
+
+
+RESULT_WRITERS = {
+    'csv': CsvResultWriter,
+    'arrow': ArrowResultWriter,
+    'parquet': ParquetResultWriter
+}
+
+
+def get_result_writer_class(result_format):
+    """
+    :param result_format: format of result files (results/format in config) - csv, arrow or parquet
+    """
+    try:
+        return RESULT_WRITERS[result_format or 'csv']
+    except KeyError:
+        raise Exception('Unknown result format {}, supported formats: {}'.format(
+            result_format, ', '.join(sorted(RESULT_WRITERS))))
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import re
+import collections
+import time
+from queue import Empty
+
+RE_COMMENT = re.compile(r'--[^\n]*')
+RE_HINT = re.compile(r'/\*.*?\*/', re.S)
+RE_WRITE = re.compile(
+    r'\b(?:insert\s+into|copy|create\s+(?:temporary\s+|local\s+temporary\s+)?table(?:\s+if\s+not\s+exists)?|'
+    r'merge\s+into|truncate\s+table|update|delete\s+from)\s+(?!set\b)([a-z_][\w.]*)',
+    re.I)
+RE_READ = re.compile(r'\b(?:from|join|using|like)\s+([a-z_][\w.]*)', re.I)
+
+
+def _table_name(name):
+    """
+    Table name without schema, lower case
+    """
+    return name.split('.')[-1].lower()
+
+
+def get_tables(sql_statement):
+    """
+    Tables read and written by SQL statement. Simple regex parser, it is good enough for statements in sql/.
+    Read tables contain any identifier following FROM/JOIN/USING/LIKE, callers should intersect them with
+    known tables (e.g. column in extract(hour from updated_at) is not a table).
+
+    :param sql_statement: SQL statement
+    :return: tuple (read tables, written tables)
+    :rtype: tuple(set, set)
+    """
+    statement = RE_HINT.sub(' ', RE_COMMENT.sub('', sql_statement))
+    writes = {_table_name(t) for t in RE_WRITE.findall(statement)}
+    reads = {_table_name(t) for t in RE_READ.findall(statement)} - writes
+    return reads, writes
+
+
+def get_writers(requests, table_name):
+    """
+    Requests writing into the table
+    """
+    return [r for r in requests if table_name in (r.get('tables') or get_tables(r['sql_statement']))[1]]
+
+
+class DagScheduler(object):
+    """
+    Statement-level scheduler. Builds dependency DAG from tables, which statements read and write
+    (read after write, write after write and write after read, in pipeline order),
+    and from dependencies declared in config (phase/dependencies: label -> list of labels).
+    Statement is dispatched to workers as soon as all its dependencies finished,
+    respecting parallelism of its phase. Dependents of a failed statement are skipped.
+    Ready statements are dispatched by critical-path priority - expected duration of the longest chain
+    of statements starting with the statement, ties (e.g. no expected durations) in pipeline order.
+    """
+
+    def __init__(self, requests, parallelism, durations=None):
+        """
+        :param requests: list of requests in pipeline order
+        :param parallelism: dict phase name -> max number of concurrently executed requests of the phase
+        :param durations: expected durations of requests (list in the same order, None if unknown)
+        """
+        self._requests = requests
+        self._parallelism = parallelism
+        self._dependencies = [set() for _ in requests]
+        self._dependents = [set() for _ in requests]
+        self._build()
+        self._priorities = self._critical_path([d or 0 for d in durations or [None] * len(requests)])
+
+    def _add_dependency(self, node, dependency):
+        if node != dependency:
+            self._dependencies[node].add(dependency)
+            self._dependents[dependency].add(node)
+
+    def _build(self):
+        tables = []
+        for request in self._requests:
+            tables.append(request.get('tables') or get_tables(request['sql_statement']))
+        known_tables = set()
+        for _, writes in tables:
+            known_tables |= writes
+        writers = collections.defaultdict(list)
+        readers = collections.defaultdict(list)
+        labels = collections.defaultdict(list)
+        for node, (reads, writes) in enumerate(tables):
+            reads = reads & known_tables
+            for table in reads:
+                for writer in writers[table]:
+                    self._add_dependency(node, writer)
+            for table in writes:
+                for other in writers[table] + readers[table]:
+                    self._add_dependency(node, other)
+            for table in reads:
+                readers[table].append(node)
+            for table in writes:
+                writers[table].append(node)
+            labels[self._requests[node]['query_name']].append(node)
+        for node, request in enumerate(self._requests):
+            declared = request['phase'].get('dependencies', {}).get(request['query_name'], [])
+            for label in declared:
+                for dependency in labels.get(label, []):
+                    if dependency < node:
+                        self._add_dependency(node, dependency)
+
+    def _critical_path(self, durations):
+        """
+        Expected duration of the longest chain of dependents starting with each node.
+        Dependents always follow their dependencies in pipeline order, so nodes are processed in reverse order.
+        """
+        priorities = [0] * len(self._requests)
+        for node in reversed(range(len(self._requests))):
+            priorities[node] = durations[node] + max([priorities[d] for d in self._dependents[node]] or [0])
+        return priorities
+
+    def priority(self, node):
+        return self._priorities[node]
+
+    def dependencies(self, node):
+        return [self._requests[d]['query_name'] for d in sorted(self._dependencies[node])]
+
+    def _skip(self, node, skipped, reason):
+        for dependent in self._dependents[node]:
+            if dependent not in skipped:
+                skipped[dependent] = reason
+                self._skip(dependent, skipped, reason)
+
+    def run(self, request_queue, report_queue, cancel_event, cancel_check_time=1):
+        """
+        Dispatch requests into request_queue, collect finished ones from report_queue.
+        Resumed requests (succeeded in previous run) are considered finished.
+
+        :return: list of finished (or skipped) requests, in order of completion
+        :rtype: list
+        """
+        remaining = [len(d) for d in self._dependencies]
+        in_flight = collections.Counter()
+        node_ids = {id(request): node for node, request in enumerate(self._requests)}
+        skipped = {}
+        results = []
+        pending = len(self._requests)
+        for node, request in enumerate(self._requests):
+            if request.get('resumed'):
+                results.append(request)
+                pending -= 1
+                for dependent in self._dependents[node]:
+                    remaining[dependent] -= 1
+        ready = [node for node, count in enumerate(remaining)
+                 if count == 0 and not self._requests[node].get('resumed')]
+
+        while pending and not cancel_event.is_set():
+            for node in sorted(ready, key=lambda n: (-self._priorities[n], n)):
+                request = self._requests[node]
+                phase_name = request['phase']['name']
+                if in_flight[phase_name] < self._parallelism[phase_name]:
+                    ready.remove(node)
+                    in_flight[phase_name] += 1
+                    request['queued_at'] = time.time()
+                    request_queue.put(request)
+            try:
+                request = report_queue.get(True, cancel_check_time)
+            except Empty:
+                continue
+            node = node_ids[id(request)]
+            in_flight[request['phase']['name']] -= 1
+            pending -= 1
+            results.append(request)
+            if request['status'] != 'ok':
+                newly_skipped = {}
+                self._skip(node, newly_skipped, 'dependency {} failed'.format(request['query_name']))
+                for skipped_node, reason in newly_skipped.items():
+                    if skipped_node not in skipped:
+                        skipped[skipped_node] = reason
+                        skipped_request = self._requests[skipped_node]
+                        skipped_request.update({'status': 'skipped', 'error': reason, 'duration': 0, 'result': {}})
+                        results.append(skipped_request)
+                        pending -= 1
+                        if skipped_node in ready:
+                            ready.remove(skipped_node)
+                continue
+            for dependent in self._dependents[node]:
+                remaining[dependent] -= 1
+                if remaining[dependent] == 0 and dependent not in skipped:
+                    ready.append(dependent)
+        return results
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import select
+import shutil
+import socket
+import socketserver
+from threading import Event, Thread
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+
+def parse_listen(listen):
+    """
+    :param listen: host:port (localhost HTTP) or path of Unix socket (contains /)
+    :return: tuple ('unix', socket path) or ('tcp', (host, port))
+    :rtype: tuple
+    """
+    if '/' in listen:
+        return 'unix', listen
+    host, _, port = listen.rpartition(':')
+    return 'tcp', (host or '127.0.0.1', int(port))
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def server_bind(self):
+        # Socket file is left behind by killed daemon
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+        super(UnixHTTPServer, self).server_bind()
+
+    def server_close(self):
+        super(UnixHTTPServer, self).server_close()
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+
+
+class ServeHandler(BaseHTTPRequestHandler):
+    """
+    POST /run?phase=<name>[&label=<label>...][&host=<host>...] - execute the phase (or only statements with given
+        labels), stream finished statements as JSON lines, the last line is summary of the run. Parameters can be
+        sent in form encoded body as well.
+    GET /result/<host>/<label> - stream result file of the label
+    """
+    server_version = 'pex'
+
+    def log_message(self, msg_format, *args):
+        self.server.log('serve {}'.format(msg_format % args))
+
+    def _send_json(self, code, value):
+        body = json.dumps(value).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _emit(self, value):
+        self.wfile.write(json.dumps(value, default=str).encode('utf-8') + b'\n')
+        self.wfile.flush()
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == '/run':
+            # Run executes statements, it is not safe to repeat it (prefetch, crawlers, proxies)
+            self.send_response(405)
+            self.send_header('Allow', 'POST')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+        elif url.path.startswith('/result/'):
+            self._result(*url.path[len('/result/'):].partition('/')[::2])
+        else:
+            self._send_json(404, {'error': 'unknown path {}'.format(url.path)})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        # Body is read completely, so only a close of the connection is seen by _monitor
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0)).decode('utf-8')
+        if url.path != '/run':
+            self._send_json(404, {'error': 'unknown path {}'.format(url.path)})
+            return
+        params = parse_qs(url.query)
+        for name, values in parse_qs(body).items():
+            params.setdefault(name, []).extend(values)
+        self._run(params)
+
+    def _run(self, params):
+        try:
+            plan = self.server.plan_run(params)
+        except ValueError as e:
+            self._send_json(400, {'error': str(e)})
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        # Streamed response has no length, it ends with the connection
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        closed = Event()
+        Thread(target=self._monitor, args=[closed], daemon=True).start()
+        try:
+            self.server.run(plan, self._emit, closed)
+        finally:
+            closed.set()
+
+    def _monitor(self, closed, check_interval=0.5):
+        """
+        Set closed, when the client closes the connection (while its run is in progress)
+        """
+        while not closed.is_set():
+            try:
+                if not select.select([self.connection], [], [], check_interval)[0]:
+                    continue
+                if self.connection.recv(1, socket.MSG_PEEK):
+                    # Client sends something, it is not a close, do not watch it anymore
+                    return
+            except (OSError, ValueError):
+                # Connection closed by the handler
+                pass
+            closed.set()
+
+    def _result(self, host, label):
+        file_name, content_type = self.server.get_result_file(host, label)
+        if not file_name:
+            self._send_json(404, {'error': 'no result of {} on {}'.format(label, host)})
+            return
+        with open(file_name, 'rb') as fp:
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(os.fstat(fp.fileno()).st_size))
+            self.end_headers()
+            shutil.copyfileobj(fp, self.wfile)
+
+
+def create_server(listen, plan_run, run, get_result_file, log=print):
+    """
+    HTTP server of report requests, each request is handled in its own thread.
+
+    :param listen: host:port or path of Unix socket, see parse_listen
+    :param plan_run: function(query parameters), validates run request and returns its plan, raises ValueError
+    :param run: function(plan, emit, closed), executes the plan, emit(dict) streams a JSON line to the client,
+        closed (Event) is set when the client disconnects
+    :param get_result_file: function(host, label), returns tuple (result file name or None, content type)
+    """
+    kind, address = parse_listen(listen)
+    server = UnixHTTPServer(address, ServeHandler) if kind == 'unix' else ThreadingHTTPServer(address, ServeHandler)
+    server.daemon_threads = True
+    server.plan_run = plan_run
+    server.run = run
+    server.get_result_file = get_result_file
+    server.log = log
+    return server
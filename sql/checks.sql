@@ -83,3 +83,20 @@ where x.views_diff > 0 or likes_diff > 0 or dislikes_diff > 0 or comments_diff >
 ;
 
 -- we can reduce 2,123,751 out of 4,037,178 (almost 1/2)
+
+----------------------------------------------------------------------------------------------------------------------------------------
+\echo #############################################################################################;
+\echo Check, that latest values are the last row of each video, stored in the partition of its last update (expected 0)
+
+select count(*)
+from youtube_history_denorm_latest l
+full join (
+    select gid, views, likes, dislikes, comments, updated_at
+    from youtube_history_denorm
+    limit 1 over (partition by gid order by updated_at desc)
+) d on d.gid = l.gid
+where d.gid is null or l.gid is null
+  or l.updated_at <> d.updated_at or l.day_updated_at <> d.updated_at::date
+  or nvl(l.views, -1) <> nvl(d.views, -1) or nvl(l.likes, -1) <> nvl(d.likes, -1)
+  or nvl(l.dislikes, -1) <> nvl(d.dislikes, -1) or nvl(l.comments, -1) <> nvl(d.comments, -1)
+;
@@ -0,0 +1,53 @@
+insert /*+ direct,label(youtube_history_denorm_inc_p1) */ into inc_youtube_history_denorm
+select
+  gid, views, likes, dislikes, comments, updated_at,
+  user_id, category_id, created_at, duration, day_updated_at,
+  hour, views_diff, likes_diff, dislikes_diff, comments_diff
+from (
+  select
+    h.gid, h.views, h.likes, h.dislikes, h.comments, h.updated_at, h.is_new,
+    m.user_id, m.category_id, m.created_at, m.duration,
+    trunc(h.updated_at) as day_updated_at,
+    extract('hour' from h.updated_at) as hour,
+    h.views - nvl(lag(h.views) over (w1), 0) as views_diff,
+    h.likes - nvl(lag(h.likes) over (w1), 0) as likes_diff,
+    h.dislikes - nvl(lag(h.dislikes) over (w1), 0) as dislikes_diff,
+    h.comments - nvl(lag(h.comments) over (w1), 0) as comments_diff
+  from youtube_meta m
+  join (
+    -- New rows
+    select gid, views, likes, dislikes, comments, updated_at, true as is_new
+    from inc_youtube_history
+    union all
+    -- lag() of the first new row of each affected gid is seeded by the last already stored row
+    select gid, views, likes, dislikes, comments, updated_at, false as is_new
+    from (
+      select h.gid, h.views, h.likes, h.dislikes, h.comments, h.updated_at,
+        row_number() over (partition by h.gid order by h.updated_at desc) as rownum
+      from youtube_history h
+      join (select distinct gid from inc_youtube_history) g
+        on g.gid = h.gid
+      left join inc_youtube_history i
+        on i.gid = h.gid and i.updated_at = h.updated_at
+      where i.gid is null
+    ) last_stored
+    where rownum = 1
+  ) h
+    on m.gid = h.gid
+    window w1 as (partition by m.category_id, h.gid order by h.updated_at nulls auto)
+) x
+where is_new and (views_diff > 0 or likes_diff > 0 or dislikes_diff > 0 or comments_diff > 0)
+;
+
+insert /*+ direct,label(youtube_history_denorm_inc_p2) */ into youtube_history_denorm
+select
+  gid, views, likes, dislikes, comments, updated_at,
+  user_id, category_id, created_at, duration, day_updated_at,
+  hour, views_diff, likes_diff, dislikes_diff, comments_diff
+from inc_youtube_history_denorm i
+-- Rows appended by a run failed before the high water mark moved
+where not exists (
+  select 1 from youtube_history_denorm d
+  where d.gid = i.gid and d.updated_at = i.updated_at
+)
+;
@@ -0,0 +1,35 @@
+create /*+ label(create_table_etl_watermark) */ table if not exists etl_watermark (
+    table_name varchar(128) not null, -- table, which is loaded incrementally
+    high_water_mark timestamptz not null, -- max updated_at loaded into the table
+    updated_at timestamptz not null, -- when the high water mark was moved
+    constraint pk_etl_watermark primary key (table_name)
+)
+;
+
+create /*+ label(create_table_stg_youtube_meta) */ table if not exists stg_youtube_meta
+like youtube_meta including projections
+;
+
+create /*+ label(create_table_stg_youtube_history) */ table if not exists stg_youtube_history
+like youtube_history including projections
+;
+
+create /*+ label(create_table_inc_youtube_history) */ table if not exists inc_youtube_history
+like youtube_history including projections
+;
+
+create /*+ label(create_table_inc_youtube_history_denorm) */ table if not exists inc_youtube_history_denorm
+like youtube_history_denorm including projections
+;
+
+truncate /*+ label(truncate_stg_youtube_meta) */ table stg_youtube_meta
+;
+
+truncate /*+ label(truncate_stg_youtube_history) */ table stg_youtube_history
+;
+
+truncate /*+ label(truncate_inc_youtube_history) */ table inc_youtube_history
+;
+
+truncate /*+ label(truncate_inc_youtube_history_denorm) */ table inc_youtube_history_denorm
+;
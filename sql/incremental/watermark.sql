@@ -0,0 +1,12 @@
+-- Executed after denorm and pre_agg, so rows of a failed run stay above the mark and are processed again
+merge /*+ label(etl_watermark_youtube_history) */ into etl_watermark w
+using (
+  select 'youtube_history' as table_name, max(updated_at) as high_water_mark
+  from inc_youtube_history
+  having count(*) > 0
+) s
+  on w.table_name = s.table_name
+when matched then update set high_water_mark = s.high_water_mark, updated_at = now()
+when not matched then insert (table_name, high_water_mark, updated_at)
+  values (s.table_name, s.high_water_mark, now())
+;
@@ -61,6 +61,12 @@ create /*+ label(create_table_youtube_history_denorm_latest) */ table youtube_hi
 )
 order by category_id, gid, updated_at
 segmented by hash(gid) all nodes
+-- Refreshed by day, see phase/partition_refresh
+partition by day_updated_at
+;
+
+create /*+ label(create_table_stg_youtube_history_denorm_latest) */ table stg_youtube_history_denorm_latest
+like youtube_history_denorm_latest including projections
 ;
 
 create /*+ label(create_table_youtube_history_denorm_daily) */ table youtube_history_denorm_daily (
@@ -78,4 +84,10 @@ create /*+ label(create_table_youtube_history_denorm_daily) */ table youtube_his
 )
 order by category_id, gid, day_updated_at
 segmented by hash(gid) all nodes
+-- Refreshed by day, see phase/partition_refresh
+partition by day_updated_at
+;
+
+create /*+ label(create_table_stg_youtube_history_denorm_daily) */ table stg_youtube_history_denorm_daily
+like youtube_history_denorm_daily including projections
 ;
@@ -1,17 +1,23 @@
+-- Statements are executed for each refreshed partition (day), see phase/partition_refresh
+-- Latest values of a video are stored in the partition (day_updated_at) of its last update. Reports read only
+-- the values, they are the same as with the previous full rebuild, which stored the day of the first update,
+-- see checks.sql and diff command (reference results)
+
 insert /*+ direct,label(youtube_history_denorm_latest) */ into youtube_history_denorm_latest
-select gid, last_views, last_likes, last_dislikes, last_comments, last_updated_at,
+select gid, views, likes, dislikes, comments, updated_at,
   user_id, category_id, created_at, duration, day_updated_at
 from (
   select
-    gid, category_id, user_id, created_at, duration, day_updated_at,
-    last_value(views) over (w1 ROWS BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING) as last_views,
-    last_value(likes) over (w1 ROWS BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING) as last_likes,
-    last_value(dislikes) over (w1 ROWS BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING) as last_dislikes,
-    last_value(comments) over (w1 ROWS BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING) as last_comments,
-    last_value(updated_at) over (w1 ROWS BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING) as last_updated_at,
-    row_number() over (w1) as rownum
-  from youtube_history_denorm
-    window w1 as (partition by category_id, gid order by day_updated_at nulls auto, updated_at nulls auto)
+    d.gid, d.views, d.likes, d.dislikes, d.comments, d.updated_at,
+    d.user_id, d.category_id, d.created_at, d.duration, d.day_updated_at,
+    row_number() over (partition by d.category_id, d.gid order by d.updated_at desc) as rownum
+  from youtube_history_denorm d
+  where d.day_updated_at = :partition_key
+    -- Video belongs to the partition of its last update
+    and not exists (
+      select 1 from youtube_history_denorm n
+      where n.gid = d.gid and n.day_updated_at > :partition_key
+    )
 ) h where rownum = 1
 ;
 
@@ -32,11 +38,30 @@ from (
       likes - nvl(lag(likes) over (w1), 0) as likes_diff,
       dislikes - nvl(lag(dislikes) over (w1), 0) as dislikes_diff,
       comments - nvl(lag(comments) over (w1), 0) as comments_diff
-    from youtube_history_denorm
+    from (
+      select gid, views, likes, dislikes, comments, updated_at,
+        user_id, category_id, created_at, duration, day_updated_at
+      from youtube_history_denorm
+      where day_updated_at = :partition_key
+      union all
+      -- lag() of the first row of the day is seeded by the last row of previous days
+      select gid, views, likes, dislikes, comments, updated_at,
+        user_id, category_id, created_at, duration, day_updated_at
+      from (
+        select p.gid, p.views, p.likes, p.dislikes, p.comments, p.updated_at,
+          p.user_id, p.category_id, p.created_at, p.duration, p.day_updated_at,
+          row_number() over (partition by p.gid order by p.day_updated_at desc, p.updated_at desc) as rownum
+        from youtube_history_denorm p
+        join (select distinct gid from youtube_history_denorm where day_updated_at = :partition_key) g
+          on g.gid = p.gid
+        where p.day_updated_at < :partition_key
+      ) previous
+      where rownum = 1
+    ) d
       window w1 as (partition by category_id, gid order by day_updated_at nulls auto, updated_at nulls auto)
   ) hh
+  where day_updated_at = :partition_key
     window w2 as (partition by category_id, gid, day_updated_at order by updated_at nulls auto)
 ) h
 where h.rownum = 1
 ;
-
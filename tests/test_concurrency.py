@@ -0,0 +1,75 @@
+import time
+from threading import Thread
+
+from concurrency import AdaptiveLimiter
+
+
+class QueueConnection(object):
+    """
+    Session answering resource_queues check with given number of queued statements
+    """
+
+    def __init__(self, queued=0):
+        self.queued = queued
+
+    def exec_default(self, stmt):
+        return [{'cnt': self.queued}]
+
+
+def _limiter(initial, maximum=None, **kwargs):
+    return AdaptiveLimiter('test', 'etl_pool', initial, maximum=maximum, check_interval=0, log=lambda msg: None,
+                           **kwargs)
+
+
+def test_non_blocking_acquire():
+    limiter = _limiter(1)
+    assert limiter.acquire(blocking=False)
+    assert not limiter.acquire(blocking=False)
+    limiter.release()
+    assert limiter.acquire(blocking=False)
+
+
+def test_increase_while_statements_wait():
+    limiter = _limiter(1, maximum=3)
+    limiter.acquire()
+    waiter = Thread(target=limiter.acquire)
+    waiter.start()
+    while not limiter._waiting:
+        time.sleep(0.001)
+    limiter.observe(QueueConnection(), 0.1)
+    waiter.join(5)
+    assert not waiter.is_alive()
+    assert limiter.limit == 2
+
+
+def test_no_increase_without_waiting():
+    limiter = _limiter(1, maximum=3)
+    limiter.observe(QueueConnection(), 0.1)
+    assert limiter.limit == 1
+
+
+def test_backoff_on_server_queue():
+    limiter = _limiter(4)
+    limiter.observe(QueueConnection(queued=2), 0.1)
+    assert limiter.limit == 3
+    assert limiter.adjustments == 1
+
+
+def test_backoff_on_latency_spike():
+    limiter = _limiter(4, min_samples=5)
+    for _ in range(5):
+        limiter.observe(QueueConnection(), 0.1)
+    assert limiter.limit == 4
+    limiter.observe(QueueConnection(), 1.0)
+    assert limiter.limit == 3
+    # The same spike does not back off again
+    limiter.observe(QueueConnection(), 0.1)
+    assert limiter.limit == 3
+
+
+def test_limit_bounds():
+    limiter = _limiter(1, minimum=1)
+    limiter.observe(QueueConnection(queued=5), 0.1)
+    assert limiter.limit == 1
+    assert limiter.adjustments == 0
+    assert _limiter(10, maximum=4).limit == 4
@@ -0,0 +1,83 @@
+from journal import RunJournal
+
+
+def _request(label, query_type, sql_statement):
+    return {'host': 'localhost', 'query_name': label, 'query_type': query_type, 'sql_statement': sql_statement,
+            'phase': {'name': query_type}}
+
+
+def _requests():
+    return [
+        _request('create_table_youtube_history', 'ddl', 'create table youtube_history (gid varchar(100))'),
+        _request('copy_youtube_history', 'load',
+                 "copy /*+ label(copy_youtube_history) */ youtube_history from local 'history.csv'"),
+        _request('insert_youtube_history', 'dml',
+                 'insert /*+ label(insert_youtube_history) */ into youtube_history select gid from youtube_meta'),
+        _request('copy_external', 'load', "copy /*+ label(copy_external) */ external_table from local 'x.csv'"),
+        _request('analyze_youtube_history', 'analyze', 'youtube_history'),
+    ]
+
+
+def _journal(tmp_path, outcomes):
+    """
+    Journal of a previous run with given outcomes (label -> status, 'started' if it did not finish)
+    """
+    file_name = str(tmp_path / 'journal.jsonl')
+    journal = RunJournal(file_name)
+    for request in _requests():
+        if request['query_name'] not in outcomes:
+            continue
+        journal.start(request)
+        if outcomes[request['query_name']] != 'started':
+            journal.finish(dict(request, status=outcomes[request['query_name']], error='', duration=1))
+    journal.close()
+    return RunJournal(file_name, resume=True)
+
+
+def test_incomplete_copy_is_truncated(tmp_path):
+    journal = _journal(tmp_path, {'create_table_youtube_history': 'ok', 'copy_youtube_history': 'started'})
+    requests = _requests()
+    assert journal.plan(requests) == [('copy_youtube_history', ['youtube_history'])]
+    assert journal.apply(requests[0])['resumed']
+    assert journal.apply(requests[1])['truncate_tables'] == ['youtube_history']
+    assert 'truncate_tables' not in journal.apply(requests[2])
+    journal.close()
+
+
+def test_failed_copy_is_truncated(tmp_path):
+    journal = _journal(tmp_path, {'create_table_youtube_history': 'ok', 'copy_youtube_history': 'error'})
+    assert journal.plan(_requests()) == [('copy_youtube_history', ['youtube_history'])]
+    journal.close()
+
+
+def test_incomplete_copy_with_succeeded_writer_is_not_truncated(tmp_path):
+    # Truncate would remove rows of the other writer, which is not executed again
+    journal = _journal(tmp_path, {'create_table_youtube_history': 'ok', 'copy_youtube_history': 'started',
+                                  'insert_youtube_history': 'ok'})
+    requests = _requests()
+    assert journal.plan(requests) == []
+    assert 'truncate_tables' not in journal.apply(requests[1])
+    assert journal.apply(requests[2])['resumed']
+    journal.close()
+
+
+def test_table_not_created_by_pipeline_is_not_truncated(tmp_path):
+    journal = _journal(tmp_path, {'copy_external': 'started'})
+    assert journal.plan(_requests()) == []
+    journal.close()
+
+
+def test_rerun_after_success(tmp_path):
+    # Statement succeeded after a failed attempt
+    file_name = str(tmp_path / 'journal.jsonl')
+    journal = RunJournal(file_name)
+    request = _requests()[1]
+    journal.start(request)
+    journal.finish(dict(request, status='error', error='failed'))
+    journal.start(request)
+    journal.finish(dict(request, status='ok'))
+    journal.close()
+    journal = RunJournal(file_name, resume=True)
+    assert journal.plan(_requests()) == []
+    assert journal.apply(_requests()[1])['resumed']
+    journal.close()
@@ -0,0 +1,76 @@
+import csv
+import io
+
+from loader import split_file, get_chunk_statement, get_rejections_table_statement, get_rejected_files
+
+STATEMENT = ("copy /*+ label(copy_youtube_history) */ youtube_history from local 'history.csv' "
+             "delimiter ',' enclosed '\"' rejected data 'youtube_history_rej.txt' "
+             "exceptions 'youtube_history_exc.txt' stream name 'history' direct;")
+
+
+def _records(data):
+    return list(csv.reader(io.StringIO(data.decode('utf-8'), newline='')))
+
+
+def _write(tmp_path, data):
+    file_name = tmp_path / 'data.csv'
+    file_name.write_bytes(data)
+    return str(file_name)
+
+
+def _assert_split(file_name, data, chunks, quote):
+    ranges = split_file(file_name, chunks, quote, block_size=7)
+    assert ranges[0][0] == 0 and ranges[-1][1] == len(data)
+    assert all(end == start for (_, end), (start, _) in zip(ranges, ranges[1:]))
+    # Each range holds complete records
+    records = []
+    for start, end in ranges:
+        assert data[start:end].endswith(b'\n')
+        records += _records(data[start:end])
+    assert records == _records(data)
+    return ranges
+
+
+def test_split_plain_records(tmp_path):
+    data = b''.join(b'gid%d,%d\n' % (i, i * 10) for i in range(100))
+    ranges = _assert_split(_write(tmp_path, data), data, 4, None)
+    assert len(ranges) == 4
+
+
+def test_split_quoted_newlines_at_chunk_edges(tmp_path):
+    # Quoted values with new lines around each split target (size * i // chunks)
+    lines = []
+    for i in range(60):
+        if i % 2:
+            lines.append(b'gid%d,"line one\nline two\n\nline four",%d\n' % (i, i))
+        else:
+            lines.append(b'gid%d,"plain",%d\n' % (i, i))
+    data = b''.join(lines)
+    file_name = _write(tmp_path, data)
+    for chunks in range(2, 12):
+        _assert_split(file_name, data, chunks, '"')
+
+
+def test_split_escaped_quotes(tmp_path):
+    data = b''.join(b'gid%d,"say ""hi""\nthere",%d\n' % (i, i) for i in range(40))
+    _assert_split(_write(tmp_path, data), data, 5, '"')
+
+
+def test_split_single_record(tmp_path):
+    data = b'gid,"one\nvery\nlong\nvalue"\n'
+    assert split_file(_write(tmp_path, data), 4, '"') == [(0, len(data))]
+
+
+def test_chunk_statement():
+    statement = get_chunk_statement(STATEMENT, 2)
+    assert "rejected data 'youtube_history_rej.txt.2'" in statement
+    assert "exceptions 'youtube_history_exc.txt.2'" in statement
+    assert "stream name 'history_2'" in statement
+
+
+def test_rejections_table_statement():
+    statement = get_rejections_table_statement(STATEMENT, 'copy_youtube_history_rej_1')
+    assert 'rejected data as table copy_youtube_history_rej_1' in statement
+    assert 'exceptions' not in statement
+    assert get_rejected_files(STATEMENT) == ('youtube_history_rej.txt', 'youtube_history_exc.txt')
+    assert get_rejected_files(statement) == (None, None)
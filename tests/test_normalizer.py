@@ -0,0 +1,40 @@
+import io
+
+from normalizer import iter_lines, iter_records, iter_normalized, get_normalized_statement
+
+
+def _records(text, columns=3, max_record_size=65536):
+    lines = iter_lines(io.BytesIO(text.encode('utf-8')), block_size=5)
+    return [values for _, values in iter_records(lines, ',', '"', max_record_size, columns)]
+
+
+def test_quoted_new_lines():
+    assert _records('a,"x\r\ny\n\nz",1\nb,"q""r",2\n') == [['a', 'x\ny\n\nz', '1'], ['b', 'q"r', '2']]
+
+
+def test_unbalanced_quote_repaired_at_end_of_input():
+    assert _records('a,b,1\nc,"d,2\ne,f,3\n') == [['a', 'b', '1'], ['c', 'd', '2'], ['e', 'f', '3']]
+
+
+def test_unbalanced_quote_repaired_on_number_of_values():
+    # The second unbalanced quote closes the first one, the joined lines do not have 3 values
+    assert _records('a,"b,1\nc,d,2\ne,f,"3\n') == [['a', 'b', '1'], ['c', 'd', '2'], ['e', 'f', '3']]
+
+
+def test_unbalanced_quote_repaired_on_record_size():
+    assert _records('a,"b,1\nc,d,2\ne,f,3\n', columns=None, max_record_size=8) == [
+        ['a', 'b', '1'], ['c', 'd', '2'], ['e', 'f', '3']]
+
+
+def test_normalized_values():
+    records = [('', ['a', ' 5.0 ', '', '2018-06-01T10:00:00Z']), ('', ['b', 'x', '1', '1527847200'])]
+    normalized = list(iter_normalized(records, ['text', 'int', 'float', 'timestamp']))
+    assert normalized[0][1:] == (['a', '5', None, '2018-06-01 10:00:00+00:00'], None)
+    assert normalized[1][1] is None and 'x' in normalized[1][2]
+
+
+def test_normalized_statement():
+    statement = get_normalized_statement(
+        "copy /*+ label(copy_x) */ x (\n  a,\n  b_filler FILLER VARCHAR(10),\n  b AS b_filler::INT\n)\n"
+        "from stdin delimiter ','", ['a', 'b'])
+    assert statement == "copy /*+ label(copy_x) */ x (a, b)\nfrom stdin delimiter ','"
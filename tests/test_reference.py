@@ -0,0 +1,43 @@
+from reference import diff_results
+
+
+def _write(tmp_path, name, text):
+    file_name = tmp_path / name
+    file_name.write_text(text)
+    return str(file_name)
+
+
+def _diff(tmp_path, expected, actual, **kwargs):
+    return diff_results(_write(tmp_path, 'reference.csv', expected), _write(tmp_path, 'result.csv', actual),
+                        **kwargs)
+
+
+def test_rows_in_any_order(tmp_path):
+    assert _diff(tmp_path, 'category_id,total_views\n1,10\n2,\n3,"a,b"\n',
+                 'category_id,total_views\n3,"a,b"\n2,\n1,10.0\n') == []
+
+
+def test_numbers_with_tolerance(tmp_path):
+    assert _diff(tmp_path, 'avg_views\n0.1\n', 'avg_views\n0.10000000000000002\n') == []
+    assert len(_diff(tmp_path, 'avg_views\n0.1\n', 'avg_views\n0.11\n')) == 1
+    assert _diff(tmp_path, 'avg_views\n0.1\n', 'avg_views\n0.11\n', tolerance=0.1) == []
+
+
+def test_null_is_not_zero(tmp_path):
+    # csv writer quotes single empty value
+    assert _diff(tmp_path, 'total_views\n0\n', 'total_views\n""\n') == ['expected [0.0], found [None]']
+
+
+def test_different_columns(tmp_path):
+    assert _diff(tmp_path, 'a,b\n1,2\n', 'a,c\n1,2\n') == ["columns differ: expected ['a', 'b'], found ['a', 'c']"]
+
+
+def test_different_rows(tmp_path):
+    differences = _diff(tmp_path, 'a\n1\n2\n', 'a\n1\n')
+    assert differences[0] == 'rows differ: expected 2, found 1'
+
+
+def test_max_differences(tmp_path):
+    expected = 'a\n' + ''.join('{}\n'.format(i) for i in range(10))
+    actual = 'a\n' + ''.join('{}\n'.format(i + 100) for i in range(10))
+    assert len(_diff(tmp_path, expected, actual, max_differences=3)) == 3
@@ -0,0 +1,48 @@
+from scheduler import get_tables
+
+
+def test_insert_select():
+    reads, writes = get_tables(
+        'insert /*+ direct,label(x) */ into pex_test.youtube_history_denorm select * from youtube_history h '
+        'join youtube_meta m on m.gid = h.gid')
+    assert reads == {'youtube_history', 'youtube_meta'}
+    assert writes == {'youtube_history_denorm'}
+
+
+def test_merge_update_set():
+    reads, writes = get_tables(
+        'merge into etl_watermark w using (select max(updated_at) m from youtube_history) s on w.t = s.t\n'
+        'when matched then update set high_water_mark = s.m\n'
+        'when not matched then insert values (s.t, s.m)')
+    assert writes == {'etl_watermark'}
+    assert reads == {'youtube_history'}
+
+
+def test_update_set():
+    reads, writes = get_tables('update youtube_meta set duration = 0 where gid in (select gid from stg_youtube_meta)')
+    assert writes == {'youtube_meta'}
+    assert reads == {'stg_youtube_meta'}
+
+
+def test_cte():
+    reads, writes = get_tables(
+        'insert into youtube_history_denorm_daily\n'
+        'with days as (select gid, updated_at from youtube_history_denorm)\n'
+        'select * from days')
+    assert writes == {'youtube_history_denorm_daily'}
+    # Name of the CTE is reported too, callers intersect reads with known tables
+    assert {'youtube_history_denorm', 'days'} == reads
+
+
+def test_comments_and_hints():
+    reads, writes = get_tables(
+        '-- insert into commented_out select * from nothing\n'
+        'select /*+ label(from_hint) */ count(*) from youtube_history -- join other\n')
+    assert writes == set()
+    assert reads == {'youtube_history'}
+
+
+def test_table_written_and_read_is_write():
+    reads, writes = get_tables('insert into t select * from t where x > 0')
+    assert writes == {'t'}
+    assert reads == set()
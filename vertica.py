@@ -1,12 +1,71 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import bz2
 import collections
+import gzip
+import mmap
+import os
+import time
+from contextlib import contextmanager
+from threading import Lock
 from vertica_python import connect as vp_connect, errors
+from columnar import ColumnBatch, ColumnarResult, get_schema
+
+
+def _open_zstd(file_path):
+    try:
+        import zstandard
+    except ImportError:
+        raise Exception('Module zstandard is required to load {}, install it: pip install zstandard'.format(file_path))
+    return zstandard.ZstdDecompressor().stream_reader(open(file_path, 'rb'), closefd=True)
+
+
+# Compressed files are decompressed while streamed, nothing is staged on disk
+DECOMPRESSORS = {
+    '.gz': lambda file_path: gzip.open(file_path, 'rb'),
+    '.bz2': lambda file_path: bz2.open(file_path, 'rb'),
+    '.zst': _open_zstd,
+    '.zstd': _open_zstd
+}
+
+
+def is_compressed(file_path):
+    return os.path.splitext(file_path)[1].lower() in DECOMPRESSORS
+
+
+def open_copy_source(file_path, use_mmap=True):
+    """
+    Open file as a binary source of COPY FROM STDIN - bytes are sent to the server as they are,
+    without decoding / encoding. Compressed files (by extension: .gz, .bz2, .zst) are decompressed on the fly,
+    plain files are memory-mapped (read straight from page cache, no buffered reader in between).
+
+    :param file_path: path to the file to be loaded
+    :param use_mmap: memory-map plain files, otherwise binary file handle is used
+    :return: file-like object supporting read(size) returning bytes and close()
+    """
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension in DECOMPRESSORS:
+        return DECOMPRESSORS[extension](file_path)
+    fp = open(file_path, 'rb')
+    if not use_mmap or os.fstat(fp.fileno()).st_size == 0:
+        return fp
+    try:
+        # mmap keeps its own file descriptor
+        return mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+    finally:
+        fp.close()
 
 
 class VerticaConnection:
     def __init__(self, conn_attributes, host, schema_name='public', resource_pool='general'):
+        self.host = host
+        self.session_id = None
+        self.schema_name = schema_name
+        self.resource_pool = resource_pool
+        # Set when the session was closed on the server (e.g. by watchdog), it is not returned to the pool then
+        self.broken = False
+        start = time.time()
         try:
             self.connection = vp_connect(**{
                 'host': host,
@@ -20,12 +79,20 @@ class VerticaConnection:
             print('action=connect_db status=error Unable to connect to DB: {0}'.format(e))
             raise
         else:
+            setup_start = time.time()
             self._cursor = self.connection.cursor('dict')
-            self._exec('select 1')
+            # Session id is needed to interrupt statements of the session from another session
+            self._exec('select current_session() as session_id')
+            self.session_id = self._cursor.fetchall()[0]['session_id']
             stmt = 'set search_path to "{0}"'.format(schema_name)
             self.exec_noresult(stmt)
             stmt = 'set resource_pool to "{0}"'.format(resource_pool)
             self.exec_noresult(stmt)
+        self.opened_at = time.time()
+        # Session setup (SETs) only
+        self.setup_duration = self.opened_at - setup_start
+        # Handshake + session setup, used to report how much time the connection pool saved
+        self.connect_duration = self.opened_at - start
 
     def close(self):
         """
@@ -34,6 +101,22 @@ class VerticaConnection:
         if self.connection:
             self.connection.close()
 
+    def is_alive(self):
+        """
+        Health check of the session, used by connection pool before an idle session is reused.
+
+        :return: True, if the session is opened and responds to a trivial query
+        :rtype: bool
+        """
+        if not self.connection or self.connection.closed():
+            return False
+        try:
+            self._cursor.execute('select 1')
+            self._cursor.fetchall()
+        except Exception:
+            return False
+        return True
+
     def _reset_cursor(self):
         """
         Reset cursor is needed after COPY.
@@ -43,13 +126,14 @@ class VerticaConnection:
         if self._cursor:
             self._cursor = self.connection.cursor('dict')
 
-    def _exec(self, stmt):
+    def _exec(self, stmt, cursor=None):
         """
         Executes query
         :param stmt: query statement
+        :param cursor: cursor executing the query, default is the dict cursor of the connection
         """
         try:
-            self._cursor.execute(stmt)
+            (cursor or self._cursor).execute(stmt)
         except errors.TimedOutError:
             #
             # See: https://github.com/uber/vertica-python/pull/45
@@ -79,6 +163,74 @@ class VerticaConnection:
         self._exec(stmt)
         return self._cursor.fetchall()
 
+    def exec_stream(self, stmt, batch_size=10000):
+        """
+        Execute query against Vertica database.
+        Stream scenario - fetch result in batches, so the whole result is never held in memory.
+
+        :param stmt: SQL statement to be executed
+        :param batch_size: max number of rows fetched at once
+        :type batch_size: int
+        :return: Tuple (column names, generator of batches, each batch is list of rows(dictionaries))
+        :rtype: Tuple
+        """
+        self._exec(stmt)
+        column_names = [column[0] for column in self._cursor.description or []]
+        return column_names, self._fetch_batches(batch_size)
+
+    def _fetch_batches(self, batch_size):
+        while True:
+            rows = self._cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield rows
+
+    def exec_columnar(self, stmt, batch_size=10000):
+        """
+        Execute query against Vertica database.
+        Columnar scenario - fetch result in batches, each batch is stored by columns (see ColumnBatch).
+        Rows are fetched as lists (no dict per row), integer / float / boolean columns are stored in compact arrays.
+
+        :param stmt: SQL statement to be executed
+        :param batch_size: max number of rows fetched at once
+        :type batch_size: int
+        :return: Tuple (schema shared by all batches, generator of ColumnBatch)
+        :rtype: Tuple
+        """
+        cursor = self.connection.cursor()
+        self._exec(stmt, cursor)
+        schema = get_schema(cursor.description)
+        return schema, self._fetch_column_batches(cursor, schema, batch_size)
+
+    @staticmethod
+    def _fetch_column_batches(cursor, schema, batch_size):
+        try:
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield ColumnBatch.from_rows(schema, rows)
+        finally:
+            cursor.close()
+
+    def exec_columnar_indexed(self, stmt, key_list, batch_size=10000):
+        """
+        Execute query against Vertica database.
+        Columnar scenario - whole result stored by columns, with index of rows by key columns,
+        which is built in the same pass as batches are fetched.
+
+        :param stmt: SQL statement to be executed
+        :param key_list: columns representing unique key of row
+        :type key_list: list[str]
+        :return: result, see ColumnarResult (columns, index, row(key))
+        :rtype: ColumnarResult
+        """
+        schema, batches = self.exec_columnar(stmt, batch_size)
+        result = ColumnarResult(schema, key_list)
+        for batch in batches:
+            result.extend(batch)
+        return result
+
     def exec_simple(self, stmt):
         """
         Execute query against Vertica database.
@@ -111,6 +263,32 @@ class VerticaConnection:
         """
         self._exec(stmt)
 
+    def exec_batch(self, statements):
+        """
+        Execute statements in one round trip (multi-statement query).
+        Statements are executed in order, the server skips statements following a failed one.
+
+        :param statements: SQL statements
+        :type statements: list[str]
+        :return: Tuple (durations of succeeded statements in seconds, error of the failed statement or None).
+            Durations are approximate - gaps between results received by the client, not server execution times.
+        :rtype: Tuple
+        """
+        durations = []
+        start = time.time()
+        try:
+            self._exec('\n;\n'.join(statements))
+            while True:
+                end = time.time()
+                durations.append(end - start)
+                start = end
+                if len(durations) == len(statements) or not self._cursor.nextset():
+                    break
+        except errors.QueryError as e:
+            # Error of the whole batch would be reported with SQL of all statements
+            return durations, errors.QueryError(e.error_response, statements[len(durations)])
+        return durations, None
+
     def exec_complex(self, stmt, key_list):
         """
         Execute query against Vertica database.
@@ -125,21 +303,15 @@ class VerticaConnection:
         :rtype: dict
         """
         self._exec(stmt)
-        rows = self._cursor.fetchall()
         result = self.tree()
 
-        for rowValue in rows:
-            key_list_values = []
-            for key in key_list:
-                key_list_values.append(rowValue[key])
-
-            for colKey, colValue in rowValue.iteritems():
-                # copy to key_list_values_temp, not reference
-                key_list_values_temp = key_list_values[:]
-                key_list_values_temp.append(str(colKey))
-                # key_list_values_string = '->'.join(key_list_values_temp)
-                # logging.lg.debug('{0} -> {1}'.format(key_list_values_string, str(colValue)))
-                self.set_key_chain(result, key_list_values_temp, colValue)
+        # Rows are fetched in batches, the whole result is never held as list of rows next to the tree
+        for batch in self._fetch_batches(10000):
+            for row in batch:
+                # Walk the key chain once per row, then set all columns
+                node = self.get_key_chain(result, [row[key] for key in key_list])
+                for col_key, col_value in row.items():
+                    node[str(col_key)] = col_value
         return result
 
     def exec_copy_fh(self, stmt, fh, buffer_size=1024**2):
@@ -147,7 +319,7 @@ class VerticaConnection:
         Executes COPY FROM STDIN command implemented into new vertica_python (> v0.5x)
         :param stmt: COPY statement
         :type stmt: unicode
-        :param fh: handle to the file to be loaded
+        :param fh: handle to the file to be loaded, any object with read(size) returning bytes (or str)
         :type fh: BinaryIO
         :param buffer_size: buffer size
         :type buffer_size: int
@@ -163,18 +335,24 @@ class VerticaConnection:
                 self._cursor._message = e.error_response
             raise
 
-    def exec_copy(self, stmt, file_path, buffer_size=1024**2):
+    def exec_copy(self, stmt, file_path, buffer_size=1024**2, use_mmap=True):
         """
         Executes COPY FROM STDIN command implemented into new vertica_python (> v0.5x)
+        File is streamed as raw bytes, compressed files are decompressed on the fly, see open_copy_source.
         :param stmt: COPY statement
         :type stmt: unicode
         :param file_path: path to the file to be loaded
         :type file_path: unicode
         :param buffer_size: buffer size
         :type buffer_size: int
+        :param use_mmap: memory-map plain files
+        :type use_mmap: bool
         """
-        with open(file_path, str('r')) as f:
-            self.exec_copy_fh(stmt, f, buffer_size)
+        source = open_copy_source(file_path, use_mmap)
+        try:
+            self.exec_copy_fh(stmt, source, buffer_size)
+        finally:
+            source.close()
 
     def tree(self):
         """
@@ -186,15 +364,139 @@ class VerticaConnection:
         """
         return collections.defaultdict(self.tree)
 
+    @staticmethod
+    def get_key_chain(cur, key_list):
+        """
+        Nested dictionary at the end of the key chain, missing levels are created
+        """
+        for key in key_list:
+            if key not in cur:
+                cur[key] = {}
+            cur = cur[key]
+        return cur
+
     def set_key_chain(self, cur, key_list, value):
-        if len(key_list) == 1:
-            cur[key_list[0]] = value
-            return
-        # see http://stackoverflow.com/questions/17462011/python-generate-a-dynamic-dictionary-from-the-list-of-keys
-        # if not cur.has_key(list[0]):
-        if key_list[0] not in cur:
-            cur[key_list[0]] = {}
-        self.set_key_chain(cur[key_list[0]], key_list[1:], value)
+        self.get_key_chain(cur, key_list[:-1])[key_list[-1]] = value
+
+
+class VerticaConnectionPool(object):
+    """
+    Thread-safe pool of warm sessions keyed by (host, schema_name, resource_pool).
+
+    Sessions are created by connection_factory(host, schema_name, resource_pool), so they already have
+    search_path and resource_pool set. Released sessions are kept idle (LIFO, so a worker typically gets back
+    the session it used for its previous statement) and reused across statements and phases.
+    Sessions idle for longer than health_check_interval seconds are health-checked before reuse.
+    """
+
+    def __init__(self, connection_factory, max_idle=8, health_check_interval=30):
+        self._connection_factory = connection_factory
+        self._max_idle = max_idle
+        self._health_check_interval = health_check_interval
+        self._lock = Lock()
+        self._idle = collections.defaultdict(list)
+        self._stats = collections.defaultdict(collections.Counter)
+        self._closed = False
+
+    def acquire(self, host, schema_name='public', resource_pool='general'):
+        """
+        Get a session from the pool, open new one if there is no healthy idle session for the key.
+
+        :return: session with search_path and resource_pool set
+        :rtype: VerticaConnection
+        """
+        key = (host, schema_name, resource_pool)
+        while True:
+            with self._lock:
+                if not self._idle[key]:
+                    break
+                conn, released_at = self._idle[key].pop()
+            if time.time() - released_at < self._health_check_interval or conn.is_alive():
+                with self._lock:
+                    self._stats[key]['reused'] += 1
+                    self._stats[key]['connect_time_saved'] += conn.connect_duration
+                return conn
+            self._discard(key, conn)
+
+        conn = self._connection_factory(host, schema_name, resource_pool)
+        with self._lock:
+            self._stats[key]['opened'] += 1
+            self._stats[key]['connect_time'] += conn.connect_duration
+        return conn
+
+    def release(self, conn, reusable=True):
+        """
+        Return session to the pool.
+
+        :param conn: session acquired from this pool
+        :param reusable: False, if the session is in unknown state (e.g. statement failed), it is closed then,
+            broken sessions are closed too
+        """
+        key = (conn.host, conn.schema_name, conn.resource_pool)
+        with self._lock:
+            keep = reusable and not conn.broken and not self._closed and len(self._idle[key]) < self._max_idle
+            if keep:
+                self._idle[key].append((conn, time.time()))
+        if not keep:
+            self._discard(key, conn)
+
+    @contextmanager
+    def session(self, host, schema_name='public', resource_pool='general'):
+        """
+        Context manager acquiring a session and releasing it back to the pool.
+        Session is not reused, if an exception is raised inside the block.
+        """
+        conn = self.acquire(host, schema_name, resource_pool)
+        try:
+            yield conn
+        except Exception:
+            self.release(conn, reusable=False)
+            raise
+        else:
+            self.release(conn)
+
+    def _discard(self, key, conn):
+        with self._lock:
+            self._stats[key]['closed'] += 1
+        try:
+            conn.close()
+        except Exception as e:
+            print('action=close_db status=error Unable to close connection to {0}: {1}'.format(key[0], e))
+
+    def close(self, host=None):
+        """
+        Close idle sessions (of the host, if specified). Sessions released afterwards are closed immediately,
+        if the whole pool is closed.
+        """
+        with self._lock:
+            if host is None:
+                self._closed = True
+            keys = [key for key in self._idle if host is None or key[0] == host]
+            idle = [(key, self._idle.pop(key)) for key in keys]
+        for key, sessions in idle:
+            for conn, _ in sessions:
+                self._discard(key, conn)
+
+    def stats(self, host=None):
+        """
+        Connection statistics, summed over keys (of the host, if specified).
+        Times are in milliseconds.
+
+        :return: opened, reused and closed sessions, connect_time spent and connect_time_saved by reuse
+        :rtype: dict
+        """
+        result = collections.Counter()
+        with self._lock:
+            for key, key_stats in self._stats.items():
+                if host is None or key[0] == host:
+                    result.update(key_stats)
+        return {
+            'opened': result['opened'],
+            'reused': result['reused'],
+            'closed': result['closed'],
+            'connect_time': int(result['connect_time'] * 1000),
+            'connect_time_saved': int(result['connect_time_saved'] * 1000)
+        }
 
 
 class VerticaUtils(object):
@@ -216,6 +518,9 @@ class VerticaUtils(object):
     def create_schema(self, schema_name):
         self._conn.exec_noresult("CREATE SCHEMA {0}".format(schema_name))
 
+    def create_schema_if_not_exists(self, schema_name):
+        self._conn.exec_noresult("CREATE SCHEMA IF NOT EXISTS {0}".format(schema_name))
+
     def resource_pool_exists(self, resource_pool_name):
         result = self._conn.exec_default("SELECT count(*) as cnt FROM resource_pools WHERE name = '{0}'".format(
             resource_pool_name))
@@ -225,6 +530,21 @@ class VerticaUtils(object):
         if self.resource_pool_exists(resource_pool_name):
             self._conn.exec_noresult('DROP RESOURCE POOL {0}'.format(resource_pool_name))
 
+    def create_resource_pool_if_not_exists(self, resource_pool_name, rp_settings):
+        if not self.resource_pool_exists(resource_pool_name):
+            self.create_resource_pool(resource_pool_name, rp_settings)
+
+    def get_watermarks(self, schema_name):
+        """
+        High water marks of incrementally loaded tables
+
+        :return: Dictionary table_name -> high water mark
+        :rtype: dict
+        """
+        result = self._conn.exec_default(
+            "SELECT table_name, high_water_mark FROM {0}.etl_watermark ORDER BY table_name".format(schema_name))
+        return {row['table_name']: row['high_water_mark'] for row in result}
+
     def create_resource_pool(self, resource_pool_name, rp_settings):
         self._conn.exec_noresult(
             "CREATE RESOURCE POOL {0} maxmemorysize '{1}' maxconcurrency {2} plannedconcurrency {3}".format(